@@ -0,0 +1,106 @@
+"""
+Бенчмарк способов записи строк отчета в базу данных.
+
+Строит синтетический отчет (feeds фидов x categories категорий)
+и записывает его в таблицу reports_offers_<shop> каждым способом:
+одним запросом (chunk_size=0, как раньше), многострочным INSERT
+частями разного размера и через LOAD DATA LOCAL INFILE. Для каждого
+способа замеряются вставка в пустую таблицу и повторная запись тех же
+строк (обновление через ON DUPLICATE KEY UPDATE).
+
+Нужна база из переменных окружения db_config, для load_data - с
+включенным local_infile на сервере. Пример запуска из корня проекта:
+    python benchmarks/bulk_load.py --feeds 20 --categories 5000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from handler.db_config import config  # noqa: E402
+from handler.db_pool import DB_POOL  # noqa: E402
+from handler.reports_db import ReportDataBase  # noqa: E402
+
+STRATEGIES = (
+    ('single', 'chunked', 0),
+    ('chunked_500', 'chunked', 500),
+    ('chunked_2000', 'chunked', 2000),
+    ('chunked_10000', 'chunked', 10000),
+    ('load_data', 'load_data', 20000),
+)
+"""Прогоны бенчмарка: название, способ записи и размер части."""
+
+
+def report_rows(feeds: int, categories: int, seed: int = 0) -> list[dict]:
+    """Возвращает синтетические строки отчета."""
+    generator = random.Random(seed)
+    rows = []
+    for feed in range(feeds):
+        for category_id in range(1, categories + 1):
+            low = generator.randint(100, 10000)
+            high = low + generator.randint(0, 100000)
+            middle = round((low + high) / 2, 2)
+            rows.append({
+                'date': '2025-01-01',
+                'feed_name': f'context_region{feed}_cl.xml',
+                'category_id': category_id,
+                'parent_id': category_id // 10 or None,
+                'count_offers': generator.randint(1, 500),
+                'min_price': low,
+                'clear_min_price': low,
+                'max_price': high,
+                'clear_max_price': high,
+                'avg_price': middle,
+                'clear_avg_price': middle,
+                'median_price': middle,
+                'clear_median_price': middle,
+            })
+    return rows
+
+
+def measure(db_client, query_data, strategy: str, chunk_size: int) -> float:
+    """Записывает строки и возвращает время в секундах."""
+    start = time.perf_counter()
+    db_client.save_to_database(query_data, chunk_size, strategy)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--feeds', type=int, default=20)
+    parser.add_argument('--categories', type=int, default=5000)
+    parser.add_argument('--shop', default='bulk_benchmark')
+    parser.add_argument(
+        '--strategies',
+        nargs='*',
+        default=[name for name, _, _ in STRATEGIES]
+    )
+    args = parser.parse_args()
+    config['allow_local_infile'] = True
+
+    db_client = ReportDataBase(shop_name=args.shop)
+    query_data = db_client.insert_reports(
+        report_rows(args.feeds, args.categories)
+    )
+    table_name = f'reports_offers_{args.shop}'
+    print(f'Строк: {len(query_data[1])}, таблица {table_name}')
+    print(f"{'способ':<16}{'вставка, с':>12}{'обновление, с':>16}")
+    try:
+        for name, strategy, chunk_size in STRATEGIES:
+            if name not in args.strategies:
+                continue
+            db_client.clean_database(**{table_name: True})
+            inserted = measure(db_client, query_data, strategy, chunk_size)
+            updated = measure(db_client, query_data, strategy, chunk_size)
+            print(f'{name:<16}{inserted:>12.2f}{updated:>16.2f}')
+    finally:
+        db_client.clean_database(**{table_name: True})
+        DB_POOL.close_all()
+
+
+if __name__ == '__main__':
+    main()
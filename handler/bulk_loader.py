@@ -0,0 +1,107 @@
+import re
+import tempfile
+from typing import Iterator
+
+INSERT_PATTERN = re.compile(
+    r'INSERT\s+INTO\s+(?P<table>\w+)\s*\((?P<columns>[^)]*)\)'
+    r'\s*VALUES\s*\([^)]*\)'
+    r'(?:\s*ON\s+DUPLICATE\s+KEY\s+UPDATE\s+(?P<update>.*?))?\s*$',
+    re.I | re.S
+)
+"""Разбор запроса INSERT ... VALUES ... [ON DUPLICATE KEY UPDATE ...]."""
+
+STAGING_TABLE = 'bulk_staging'
+"""Имя временной таблицы для загрузки через LOAD DATA."""
+
+ESCAPES = str.maketrans({
+    '\\': '\\\\',
+    '\t': '\\t',
+    '\n': '\\n',
+    '\r': '\\r',
+    '\0': '\\0',
+})
+"""Экранирование символов в формате LOAD DATA по умолчанию."""
+
+
+def chunks(params: list, chunk_size: int) -> Iterator[list]:
+    """
+    Делит строки на части по chunk_size.
+    При chunk_size <= 0 возвращает все строки одной частью.
+    """
+    if chunk_size <= 0:
+        yield params
+        return
+    for start in range(0, len(params), chunk_size):
+        yield params[start:start + chunk_size]
+
+
+def parse_insert(query: str) -> tuple[str, list[str], str | None]:
+    """
+    Возвращает таблицу, колонки и выражение ON DUPLICATE KEY UPDATE
+    запроса INSERT. Для другого запроса вызывает ValueError.
+    """
+    match = INSERT_PATTERN.search(query)
+    if match is None:
+        raise ValueError('Запрос не является INSERT ... VALUES')
+    columns = [
+        column.strip(' `\n') for column in match['columns'].split(',')
+    ]
+    return match['table'], columns, match['update']
+
+
+def load_data_value(value) -> str:
+    """Возвращает значение поля в формате LOAD DATA по умолчанию."""
+    if value is None:
+        return '\\N'
+    return str(value).translate(ESCAPES)
+
+
+def write_load_file(params: list):
+    """
+    Пишет строки во временный файл в формате LOAD DATA по умолчанию
+    (поля через табуляцию, NULL как \\N) и возвращает открытый файл.
+    Файл удаляется при закрытии.
+    """
+    file = tempfile.NamedTemporaryFile(
+        'w',
+        encoding='utf-8',
+        newline='\n',
+        suffix='.tsv'
+    )
+    for row in params:
+        file.write('\t'.join(load_data_value(value) for value in row))
+        file.write('\n')
+    file.flush()
+    return file
+
+
+def load_data_queries(
+    table: str,
+    columns: list[str],
+    update: str | None,
+    file_name: str
+) -> list[str]:
+    """
+    Возвращает запросы загрузки файла через LOAD DATA LOCAL INFILE.
+    Строки загружаются во временную таблицу без ключей, затем
+    переносятся в table одним INSERT ... SELECT с тем же
+    ON DUPLICATE KEY UPDATE, что и у исходного запроса, поэтому
+    результат совпадает с построчной вставкой.
+    """
+    column_list = ', '.join(f'`{column}`' for column in columns)
+    insert = (
+        f'INSERT INTO {table} ({column_list}) '
+        f'SELECT {column_list} FROM {STAGING_TABLE}'
+    )
+    if update:
+        insert = f'{insert} ON DUPLICATE KEY UPDATE {update}'
+    path = file_name.replace('\\', '\\\\').replace("'", "\\'")
+    return [
+        f'DROP TEMPORARY TABLE IF EXISTS {STAGING_TABLE}',
+        f'CREATE TEMPORARY TABLE {STAGING_TABLE} '
+        f'SELECT {column_list} FROM {table} LIMIT 0',
+        f"LOAD DATA LOCAL INFILE '{path}' INTO TABLE {STAGING_TABLE} "
+        f"CHARACTER SET utf8mb4 ({column_list})",
+        insert,
+        f'DROP TEMPORARY TABLE {STAGING_TABLE}',
+    ]
@@ -1,7 +1,8 @@
 import numpy as np
 
 from handler.constants import (DECIMAL_ROUNDING, LOWER_OUTLIER_PERCENTILE,
-                               UPPER_OUTLIER_PERCENTILE)
+                               SKETCH_RANK_ERROR, UPPER_OUTLIER_PERCENTILE)
+from handler.quantile_sketch import KLLSketch, weighted_quantile
 
 
 def calc_quantile(data):
@@ -46,3 +47,255 @@ def clear_avg(data):
     """Находит среднее значение в коллекции без выбросов."""
     filtered_data = calc_quantile(data)
     return round(sum(filtered_data) / len(filtered_data), DECIMAL_ROUNDING)
+
+
+STAT_FIELDS = (
+    'min_price',
+    'clear_min_price',
+    'max_price',
+    'clear_max_price',
+    'avg_price',
+    'clear_avg_price',
+    'median_price',
+    'clear_median_price',
+)
+"""Поля статистики цен в строке отчета."""
+
+SEGMENT_BATCH_SIZE = 1 << 22
+"""Наибольшее число цен в одном пакете segment_price_stats."""
+
+
+def _segment_quantiles(sorted_values, starts, counts, quantile):
+    """
+    Считает квантиль каждого отрезка отсортированного массива
+    так же, как np.quantile (method='linear'): индекс (n - 1) * q
+    и интерполяция между соседними значениями.
+    """
+    virtual = (counts - 1) * quantile
+    previous = np.floor(virtual)
+    gamma = virtual - previous
+    previous = previous.astype(np.int64)
+    following = previous + 1
+    above = virtual >= counts - 1
+    previous[above] = counts[above] - 1
+    following[above] = counts[above] - 1
+    left = sorted_values[starts + previous]
+    right = sorted_values[starts + following]
+    diff = right - left
+    result = left + diff * gamma
+    upper_half = gamma >= 0.5
+    result[upper_half] = (right - diff * (1 - gamma))[upper_half]
+    return result
+
+
+def _segment_medians(sorted_values, starts, counts):
+    """
+    Считает медиану каждого отрезка отсортированного массива
+    так же, как np.median: среднее одного или двух средних значений.
+    """
+    middle = starts + counts // 2
+    upper = sorted_values[middle].astype(np.float64)
+    lower = sorted_values[middle - 1 + counts % 2].astype(np.float64)
+    return np.where(counts % 2 == 1, upper, (lower + upper) / 2)
+
+
+def segment_price_stats(values, starts, ends) -> list[dict]:
+    """
+    Считает статистику цен (STAT_FIELDS) сразу для набора отрезков
+    values[start:end]; отрезки могут пересекаться и вкладываться.
+    Все отрезки пакета сортируются одной сортировкой, квантили,
+    границы выбросов (IQR), суммы и медианы считаются векторно.
+    Отрезки обрабатываются пакетами не больше SEGMENT_BATCH_SIZE цен.
+    Результат совпадает с min, max, np.median и clear_* по каждому
+    отрезку, для пустого отрезка все значения равны 0.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    batches = np.cumsum(ends - starts) // SEGMENT_BATCH_SIZE
+    bounds = np.flatnonzero(np.diff(batches)) + 1
+    result = []
+    for batch_starts, batch_ends in zip(
+        np.split(starts, bounds),
+        np.split(ends, bounds)
+    ):
+        result.extend(_batch_price_stats(values, batch_starts, batch_ends))
+    return result
+
+
+def _batch_price_stats(values, starts, ends) -> list[dict]:
+    """Считает статистику цен для одного пакета отрезков."""
+    counts = ends - starts
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    segment_ids = np.repeat(np.arange(len(counts)), counts)
+    gathered = values[
+        np.arange(offsets[-1]) + np.repeat(starts - offsets[:-1], counts)
+    ]
+    sorted_values = gathered[np.lexsort((gathered, segment_ids))]
+    totals = np.zeros(len(sorted_values) + 1, dtype=np.int64)
+    np.cumsum(sorted_values, out=totals[1:])
+
+    filled = np.flatnonzero(counts > 0)
+    starts = offsets[filled]
+    counts = counts[filled]
+    ends = starts + counts
+    first_quartile = _segment_quantiles(
+        sorted_values, starts, counts, LOWER_OUTLIER_PERCENTILE
+    )
+    third_quartile = _segment_quantiles(
+        sorted_values, starts, counts, UPPER_OUTLIER_PERCENTILE
+    )
+    spread = third_quartile - first_quartile
+    lower_bound = first_quartile - 1.5 * spread
+    upper_bound = third_quartile + 1.5 * spread
+
+    positions = np.zeros(len(sorted_values) + 1, dtype=np.int64)
+    np.cumsum(
+        sorted_values < np.repeat(lower_bound, counts),
+        out=positions[1:]
+    )
+    clear_starts = starts + positions[ends] - positions[starts]
+    np.cumsum(
+        sorted_values <= np.repeat(upper_bound, counts),
+        out=positions[1:]
+    )
+    clear_ends = starts + positions[ends] - positions[starts]
+    clear_counts = clear_ends - clear_starts
+    if np.any(clear_counts == 0):
+        raise ValueError('После удаления выбросов не осталось цен')
+
+    medians = np.round(
+        _segment_medians(sorted_values, starts, counts), DECIMAL_ROUNDING
+    )
+    clear_medians = _segment_medians(sorted_values, clear_starts, clear_counts)
+    columns = zip(
+        sorted_values[starts].tolist(),
+        sorted_values[clear_starts].tolist(),
+        sorted_values[ends - 1].tolist(),
+        sorted_values[clear_ends - 1].tolist(),
+        (totals[ends] - totals[starts]).tolist(),
+        counts.tolist(),
+        (totals[clear_ends] - totals[clear_starts]).tolist(),
+        clear_counts.tolist(),
+    )
+    result = [dict.fromkeys(STAT_FIELDS, 0) for _ in range(len(offsets) - 1)]
+    for position, segment in enumerate(filled.tolist()):
+        (
+            min_price, clear_min_price, max_price, clear_max_price,
+            total, count, clear_total, clear_count
+        ) = next(columns)
+        result[segment] = {
+            'min_price': min_price,
+            'clear_min_price': clear_min_price,
+            'max_price': max_price,
+            'clear_max_price': clear_max_price,
+            'avg_price': round(total / count, DECIMAL_ROUNDING),
+            'clear_avg_price': round(
+                clear_total / clear_count, DECIMAL_ROUNDING
+            ),
+            'median_price': medians[position],
+            'clear_median_price': clear_medians[position],
+        }
+    return result
+
+
+def price_stats(data) -> dict:
+    """
+    Считает всю статистику цен (STAT_FIELDS) за один вызов
+    по одному отсортированному массиву.
+    """
+    return segment_price_stats(data, [0], [len(data)])[0]
+
+
+def sketch_price_stats(sketch: KLLSketch) -> dict:
+    """
+    Считает статистику цен (STAT_FIELDS) по квантильному скетчу.
+    Количество, минимум, максимум и среднее точные, медиана и границы
+    выбросов - с ошибкой ранга sketch.rank_error. Пока скетч хранит
+    все цены, результат совпадает с price_stats.
+    """
+    if not sketch.count:
+        return dict.fromkeys(STAT_FIELDS, 0)
+    items, weights = sketch.weighted_items()
+    if sketch.exact:
+        return price_stats(items)
+
+    first_quartile = float(
+        weighted_quantile(items, weights, LOWER_OUTLIER_PERCENTILE)
+    )
+    third_quartile = float(
+        weighted_quantile(items, weights, UPPER_OUTLIER_PERCENTILE)
+    )
+    spread = third_quartile - first_quartile
+    lower_bound = first_quartile - 1.5 * spread
+    upper_bound = third_quartile + 1.5 * spread
+    inside = (items >= lower_bound) & (items <= upper_bound)
+    if not np.any(inside):
+        raise ValueError('После удаления выбросов не осталось цен')
+    clear_items = items[inside]
+    clear_weights = weights[inside]
+    return {
+        'min_price': sketch.min,
+        'clear_min_price': sketch.min if sketch.min >= lower_bound
+        else int(clear_items[0]),
+        'max_price': sketch.max,
+        'clear_max_price': sketch.max if sketch.max <= upper_bound
+        else int(clear_items[-1]),
+        'avg_price': round(sketch.total / sketch.count, DECIMAL_ROUNDING),
+        'clear_avg_price': round(
+            int(np.dot(clear_items, clear_weights)) / int(
+                clear_weights.sum()
+            ),
+            DECIMAL_ROUNDING
+        ),
+        'median_price': np.float64(
+            weighted_quantile(items, weights, 0.5)
+        ).round(DECIMAL_ROUNDING),
+        'clear_median_price': np.float64(
+            weighted_quantile(clear_items, clear_weights, 0.5)
+        ),
+    }
+
+
+def validate_sketch(
+    values,
+    rank_error: float = SKETCH_RANK_ERROR,
+    chunks: int = 20
+) -> dict:
+    """
+    Сравнивает скетч с точным расчетом на наборе цен values.
+    Цены делятся на chunks частей (как фиды регионов), по каждой
+    строится скетч, затем скетчи объединяются. Возвращает
+    наибольшую ошибку ранга по сетке квантилей, допустимую ошибку,
+    размер скетча и относительные отклонения полей статистики.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    sketch = KLLSketch(rank_error)
+    for part in np.array_split(values, chunks):
+        sketch.merge(KLLSketch(rank_error).update(part))
+
+    sorted_values = np.sort(values)
+    observed_error = 0.0
+    for quantile in np.linspace(0, 1, 101).tolist():
+        item = sketch.quantile(quantile)
+        low = np.searchsorted(sorted_values, item, side='left')
+        high = np.searchsorted(sorted_values, item, side='right') - 1
+        target = quantile * (len(values) - 1)
+        distance = max(0, low - target, target - high)
+        observed_error = max(observed_error, distance / len(values))
+
+    exact = price_stats(values)
+    approximate = sketch_price_stats(sketch)
+    return {
+        'rank_error': observed_error,
+        'rank_error_bound': rank_error,
+        'retained': sketch.retained,
+        'count': len(values),
+        'relative_error': {
+            field: abs(float(approximate[field]) - float(exact[field])) / (
+                abs(float(exact[field])) or 1
+            )
+            for field in STAT_FIELDS
+        },
+    }
@@ -0,0 +1,123 @@
+import numpy as np
+
+
+class CategoryTree:
+    """
+    Дерево категорий фида с обходом в прямом порядке.
+
+    Строится по словарю категория -> родитель за один проход:
+    дети каждой категории хранятся в порядке словаря, корни - это
+    категории с родителем None. При прямом обходе поддерево категории
+    занимает непрерывный отрезок order[position:position + size],
+    поэтому цены поддерева - срез одного массива, а не копии списков
+    на каждом уровне. Категории, недостижимые из корней (родитель
+    не найден или цикл), в обход не попадают.
+    """
+
+    def __init__(self, parents: dict) -> None:
+        children: dict = {}
+        for category_id, parent_id in parents.items():
+            if parent_id is not None:
+                children.setdefault(parent_id, []).append(category_id)
+        self.parents = parents
+        self.order: list = []
+        self.position: dict = {}
+        self.size: dict = {}
+        stack = [
+            (category_id, False) for category_id, parent_id in reversed(
+                parents.items()
+            ) if parent_id is None
+        ]
+        while stack:
+            category_id, visited = stack.pop()
+            if visited:
+                self.size[category_id] = (
+                    len(self.order) - self.position[category_id]
+                )
+                continue
+            self.position[category_id] = len(self.order)
+            self.order.append(category_id)
+            stack.append((category_id, True))
+            stack.extend(
+                (child_id, False)
+                for child_id in reversed(children.get(category_id, ()))
+            )
+
+    def __repr__(self):
+        return f'CategoryTree(categories={len(self.order)})'
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def __contains__(self, category_id) -> bool:
+        return category_id in self.position
+
+    def spans(self, category_data: dict) -> tuple[np.ndarray, dict]:
+        """
+        Собирает цены всех категорий category_data в один массив
+        и возвращает его вместе со словарем category_id -> (start, end).
+        Для категорий дерева отрезок покрывает цены всего поддерева
+        в порядке обхода: свои цены, затем цены детей по порядку.
+        Категории вне дерева получают отрезок только со своими ценами.
+        """
+        outside = [
+            category_id for category_id in category_data
+            if category_id not in self.position
+        ]
+        sequence = self.order + outside
+        counts = np.fromiter(
+            (
+                len(category_data[category_id]['prices'])
+                for category_id in sequence
+            ),
+            dtype=np.int64,
+            count=len(sequence)
+        )
+        offsets = np.zeros(len(sequence) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        prices = np.fromiter(
+            (
+                price for category_id in sequence
+                for price in category_data[category_id]['prices']
+            ),
+            dtype=np.int64,
+            count=int(offsets[-1])
+        )
+        offsets = offsets.tolist()
+        spans = {}
+        for category_id in self.order:
+            start = self.position[category_id]
+            spans[category_id] = (
+                offsets[start],
+                offsets[start + self.size[category_id]]
+            )
+        for position, category_id in enumerate(outside, len(self.order)):
+            spans[category_id] = (offsets[position], offsets[position + 1])
+        return prices, spans
+
+    def aggregate(self, category_data: dict) -> None:
+        """
+        Заменяет цены и число офферов каждой категории из дерева
+        на значения по всему ее поддереву (см. spans).
+        Категории вне дерева остаются без изменений.
+        """
+        prices, spans = self.spans(category_data)
+        for category_id in self.order:
+            start, end = spans[category_id]
+            data = category_data[category_id]
+            data['prices'] = prices[start:end].tolist()
+            data['offers_count'] = end - start
+
+    def merge_up(self, sketches: dict) -> dict:
+        """
+        Объединяет скетчи (см. KLLSketch) снизу вверх: скетч каждой
+        категории дерева дополняется скетчами всех ее потомков.
+        Обход в обратном прямом порядке дает детей раньше родителей,
+        поэтому каждый скетч объединяется один раз. Скетчи изменяются
+        на месте, категории вне дерева остаются без изменений.
+        """
+        for category_id in reversed(self.order):
+            parent_id = self.parents[category_id]
+            if parent_id is not None:
+                sketches[parent_id].merge(sketches[category_id])
+        return sketches
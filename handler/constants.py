@@ -31,6 +31,15 @@ ATTEMPTION_LOAD_FEED = 3
 MAX_WORKERS = 10
 """Количество одновременно запущенных потоков."""
 
+PROCESS_WORKERS = int(os.getenv('PROCESS_WORKERS', 1))
+"""
+Количество процессов для обработки фидов в main
+(1 - последовательная обработка).
+"""
+
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+"""Размер блока потокового скачивания фида в байтах."""
+
 PARAM_FOR_DELETE = 'parentIdPhysical'
 """Параметр на удаление."""
 
@@ -55,6 +64,31 @@ TIME_DELAY = 5
 MAX_RETRIES = 5
 """Максимальное количество переподключений к бд."""
 
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+"""Максимальное количество одновременно открытых подключений к бд."""
+
+DB_POOL_CHECK_INTERVAL = int(os.getenv('DB_POOL_CHECK_INTERVAL', 30))
+"""
+Время простоя подключения в секундах, после которого оно
+проверяется (ping) перед повторным использованием.
+"""
+
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 60))
+"""Время ожидания свободного подключения к бд в секундах."""
+
+DB_CHUNK_SIZE = int(os.getenv('DB_CHUNK_SIZE', 1000))
+"""
+Количество строк отчета в одной части записи в бд; каждая часть
+фиксируется отдельно. 0 - все строки одним запросом.
+"""
+
+DB_LOAD_STRATEGY = os.getenv('DB_LOAD_STRATEGY', 'chunked')
+"""
+Способ записи строк в бд: 'chunked' - многострочный INSERT по частям,
+'load_data' - LOAD DATA LOCAL INFILE из временного файла по частям
+(требует local_infile на сервере).
+"""
+
 NAME_OF_SHOP = 'citilink'
 """Константа названия магазина."""
 
@@ -88,6 +122,59 @@ IMAGE_FOLDER = os.getenv('IMAGE_FOLDER', 'old_images')
 NEW_IMAGE_FOLDER = os.getenv('NEW_IMAGE_FOLDER', 'new_images')
 """Константа стокового названия директорий."""
 
+STORAGE_COMPRESSION = os.getenv('STORAGE_COMPRESSION', '')
+"""
+Сжатие скачанных фидов на диске в FEEDS_FOLDER: '' - без сжатия,
+'gzip' или 'lzma'. Имена файлов не меняются, при чтении формат
+определяется по сигнатуре файла. Опубликованные фиды
+в NEW_FEEDS_FOLDER всегда пишутся без сжатия.
+"""
+
+GZIP_COMPRESSION_LEVEL = 6
+"""Уровень сжатия gzip."""
+
+LZMA_COMPRESSION_PRESET = 1
+"""Пресет сжатия lzma."""
+
+ACCEPT_ENCODING = 'gzip, deflate'
+"""Допустимые кодировки сжатия при скачивании фидов."""
+
+STREAMING_MODE = os.getenv('STREAMING_MODE', 'false').lower() == 'true'
+"""Потоковая обработка фидов в FeedHandler (память не зависит от фида)."""
+
+COMPACT_XML = os.getenv('COMPACT_XML', 'false').lower() == 'true'
+"""Сохранять фиды без отступов (меньше размер, быстрее запись)."""
+
+OFFER_SNAPSHOTS = os.getenv('OFFER_SNAPSHOTS', 'true').lower() == 'true'
+"""
+Строить колоночные снимки офферов (.npy в META_FOLDER) и читать
+из них отчет, изображения и группировку для видео вместо XML.
+"""
+
+SNAPSHOTS_FOLDER = 'snapshots'
+"""Поддиректория META_FOLDER со снимками офферов."""
+
+XML_BACKEND = os.getenv('XML_BACKEND', 'etree')
+"""
+Библиотека разбора XML: 'etree' (стандартная библиотека, по умолчанию),
+'lxml' или 'auto' - lxml, если установлена. lxml не входит
+в requirements.txt, поэтому включается только явно.
+"""
+
+FEED_CACHE_SIZE = int(os.getenv('FEED_CACHE_SIZE', 2))
+"""
+Сколько разобранных фидов держать в памяти одновременно
+(0 - кэш отключен). Фид разбирается один раз этапом изменений,
+следующие этапы чтения берут данные из снимка (OFFER_SNAPSHOTS),
+поэтому этапы вытесняют фид, закончив с ним работу.
+"""
+
+META_FOLDER = '.meta'
+"""Скрытая поддиректория для служебных файлов рядом с фидами."""
+
+FEEDS_META_FILENAME = 'feeds_meta.json'
+"""Файл с ETag, Last-Modified и хэшем скачанных фидов."""
+
 UPPER_OUTLIER_PERCENTILE = 0.75
 """Процентиль (0.75)."""
 
@@ -97,6 +184,15 @@ LOWER_OUTLIER_PERCENTILE = 0.25
 DECIMAL_ROUNDING = 2
 """Округление до указанного количества знаков после точки (2)."""
 
+PRICE_STATS_MODE = os.getenv('PRICE_STATS_MODE', 'exact')
+"""
+Расчет статистики цен в отчете: 'exact' - точно по всем ценам,
+'sketch' - приближенно по квантильным скетчам (KLL).
+"""
+
+SKETCH_RANK_ERROR = float(os.getenv('SKETCH_RANK_ERROR', 0.01))
+"""Допустимая ошибка ранга квантилей в режиме 'sketch' (доля от 1)."""
+
 UNAVAILABLE_OFFER_ID_LIST = ['1621720', '1621704', '1621686']
 """Список id офферов для available=False."""
 
@@ -2,6 +2,8 @@ import os
 
 from dotenv import load_dotenv
 
+from handler.constants import DB_LOAD_STRATEGY
+
 load_dotenv()
 
 """
@@ -15,6 +17,7 @@ load_dotenv()
 - port (порт по умолчанию 3306)
 - connection_timeout (таймаут подключения)
 - use_pure (флаг использования чистого Python-коннектора)
+- allow_local_infile (LOAD DATA LOCAL INFILE, см. DB_LOAD_STRATEGY)
 
 Пример переменных окружения:
 LOGIN='admin'
@@ -30,5 +33,6 @@ config = {
     'port': os.getenv('DB_PORT_CITILINK', 3306),
     'connection_timeout': 10,
     'read_timeout': 60,
-    'use_pure': True
+    'use_pure': True,
+    'allow_local_infile': DB_LOAD_STRATEGY == 'load_data'
 }
@@ -0,0 +1,150 @@
+import logging
+import threading
+import time
+
+import mysql.connector
+
+from handler.constants import (DB_POOL_CHECK_INTERVAL, DB_POOL_SIZE,
+                               DB_POOL_TIMEOUT)
+from handler.db_config import config
+from handler.logging_config import setup_logging
+
+setup_logging()
+
+
+class ConnectionPool:
+    """
+    Пул подключений к MySQL, общий для процесса.
+
+    Подключения создаются через mysql.connector.connect по мере
+    необходимости, одновременно открыто не больше size. Возвращенное
+    подключение остается открытым и выдается следующему запросу;
+    если оно простаивало дольше check_interval секунд, перед выдачей
+    оно проверяется ping и при ошибке заменяется новым. Подключение,
+    выданное потоку, доступно ему через current, поэтому вложенные
+    вызовы используют его же, а не занимают второе.
+    """
+
+    def __init__(
+        self,
+        db_config: dict,
+        size: int = DB_POOL_SIZE,
+        check_interval: float = DB_POOL_CHECK_INTERVAL,
+        timeout: float = DB_POOL_TIMEOUT
+    ) -> None:
+        if size < 1:
+            raise ValueError(f'Недопустимый размер пула: {size}')
+        self.db_config = db_config
+        self.size = size
+        self.check_interval = check_interval
+        self.timeout = timeout
+        self.created = 0
+        self.reused = 0
+        self._idle: list[tuple] = []
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def __repr__(self):
+        return (
+            f'ConnectionPool(size={self.size}, idle={len(self._idle)}, '
+            f'created={self.created}, reused={self.reused})'
+        )
+
+    def current(self):
+        """Возвращает подключение, выданное текущему потоку, или None."""
+        return getattr(self._local, 'connection', None)
+
+    @staticmethod
+    def _is_alive(connection) -> bool:
+        """Защищенный метод, проверяет подключение запросом ping."""
+        try:
+            connection.ping(reconnect=False)
+            return True
+        except mysql.connector.Error as error:
+            logging.warning('Подключение к бд недоступно: %s', error)
+            return False
+
+    @staticmethod
+    def _close(connection) -> None:
+        """Защищенный метод, закрывает подключение, игнорируя ошибки."""
+        try:
+            connection.close()
+        except mysql.connector.Error:
+            pass
+
+    def _take_idle(self):
+        """
+        Защищенный метод, возвращает проверенное свободное
+        подключение или None, если свободных нет.
+        """
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                connection, released_at = self._idle.pop()
+            idle_time = time.monotonic() - released_at
+            if idle_time < self.check_interval:
+                return connection
+            if self._is_alive(connection):
+                return connection
+            self._close(connection)
+
+    def acquire(self):
+        """
+        Выдает подключение текущему потоку: свободное из пула
+        или новое. Если все size подключений заняты дольше timeout
+        секунд, вызывает PoolError.
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise mysql.connector.errors.PoolError(
+                f'Нет свободных подключений к бд за {self.timeout} сек.'
+            )
+        try:
+            connection = self._take_idle()
+            if connection is None:
+                connection = mysql.connector.connect(**self.db_config)
+                self.created += 1
+            else:
+                self.reused += 1
+        except BaseException:
+            self._slots.release()
+            raise
+        self._local.connection = connection
+        return connection
+
+    def release(self, connection, reusable: bool = True) -> None:
+        """
+        Возвращает подключение в пул. Подключение после сетевой
+        ошибки (reusable=False) или уже разорванное закрывается.
+        """
+        self._local.connection = None
+        try:
+            if reusable and connection.is_connected():
+                with self._lock:
+                    self._idle.append((connection, time.monotonic()))
+            else:
+                self._close(connection)
+        except mysql.connector.Error:
+            self._close(connection)
+        finally:
+            self._slots.release()
+
+    def close_all(self) -> None:
+        """Закрывает свободные подключения и логирует статистику."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            self._close(connection)
+        if self.created:
+            logging.info(
+                'Пул подключений закрыт: создано - %s, '
+                'повторно использовано - %s',
+                self.created,
+                self.reused
+            )
+        self.created = self.reused = 0
+
+
+DB_POOL = ConnectionPool(config)
+"""Общий для процесса пул подключений к бд."""
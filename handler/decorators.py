@@ -10,7 +10,7 @@ import requests
 
 from handler.constants import (ATTEMPTION_LOAD_FEED, DATE_FORMAT, MAX_RETRIES,
                                TIME_DELAY, TIME_FORMAT)
-from handler.db_config import config
+from handler.db_pool import DB_POOL
 from handler.exceptions import (DirectoryCreationError, EmptyFeedsListError,
                                 GetTreeError, StructureXMLError)
 from handler.logging_config import setup_logging
@@ -99,9 +99,11 @@ def connection_db(func):
     """
     Декоратор для подключения к базе данных.
 
-    Подключается к базе данных, обрабатывает ошибки в процессе подключения,
-    логирует все успешные/неуспешные действия, вызывает функцию, выполняющую
-    действия в базе данных и закрывает подключение.
+    Берет подключение из пула (см. ConnectionPool), обрабатывает ошибки
+    в процессе подключения, логирует все успешные/неуспешные действия,
+    вызывает функцию, выполняющую действия в базе данных, и возвращает
+    подключение в пул. Вложенный вызов использует подключение внешнего,
+    фиксацию транзакции выполняет внешний вызов.
 
     Args:
         func (callable): Декорируемая функция, которая выполняет
@@ -112,14 +114,24 @@ def connection_db(func):
         подключения к базе данных и логирования.
     """
     def wrapper(*args, **kwargs):
-        connection = None
-        cursor = None
+        shared = DB_POOL.current()
+        if shared is not None:
+            cursor = shared.cursor()
+            try:
+                kwargs['cursor'] = cursor
+                return func(*args, **kwargs)
+            finally:
+                cursor.close()
+
         delay = TIME_DELAY
         max_retries = MAX_RETRIES
 
         for attempt in range(max_retries):
+            connection = None
+            cursor = None
+            reusable = True
             try:
-                connection = mysql.connector.connect(**config)
+                connection = DB_POOL.acquire()
                 cursor = connection.cursor()
                 kwargs['cursor'] = cursor
                 result = func(*args, **kwargs)
@@ -129,6 +141,7 @@ def connection_db(func):
                 mysql.connector.errors.ConnectionTimeoutError,
                 mysql.connector.errors.OperationalError
             ) as e:
+                reusable = False
                 if attempt < max_retries - 1:
                     logging.warning(
                         f'Попытка {attempt + 1} не удалась, '
@@ -150,8 +163,8 @@ def connection_db(func):
             finally:
                 if cursor:
                     cursor.close()
-                if connection and connection.is_connected():
-                    connection.close()
+                if connection:
+                    DB_POOL.release(connection, reusable)
     return wrapper
 
 
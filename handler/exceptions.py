@@ -32,3 +32,7 @@ class CleanDataBaseError(ValueError):
 
 class StructureXMLError(ValueError):
     """Ошибка структуры XML-файла."""
+
+
+class FeedProcessingError(RuntimeError):
+    """Ошибка обработки одного или нескольких фидов."""
@@ -0,0 +1,252 @@
+import logging
+import tempfile
+
+import numpy as np
+
+from handler.constants import NEW_FEEDS_FOLDER
+from handler.exceptions import StructureXMLError
+from handler.logging_config import setup_logging
+from handler.mixins import FileMixin
+from handler.region_presence import RegionPresence, feed_region
+from handler.xml_backend import TagStream, sub_element
+from handler.xml_writer import serialize_xml
+
+setup_logging()
+
+OFFERS_TAG = 'offers'
+"""Тег контейнера офферов в каркасе объединенного фида."""
+
+JOIN_SENTINEL = '__join_offers__'
+"""Метка, по которой каркас объединенного фида режется на части."""
+
+JOIN_BITS_CAPACITY = 1024
+"""Начальное число строк матрицы присутствия, дальше она удваивается."""
+
+
+class OfferJoinIndex(FileMixin):
+    """
+    Индекс офферов обработанных фидов для объединения (join).
+
+    Каждый фид читается один раз потоково, в памяти остаются
+    только каркас первого фида и словарь offer_id -> [количество
+    вхождений, порядок первого вхождения, смещение и длина текста,
+    последний фид с оффером, номер оффера],
+    поэтому память зависит от числа разных id, а не от размера фидов.
+    Текст оффера пишется во временный файл (spool) уже отформатированным
+    для уровня вложенности офферов в каркасе.
+
+    Как и прежнее объединение деревьев, в результате офферы идут
+    в порядке первого вхождения, а содержимое берется из последнего.
+    Поэтому фиды читаются в обратном порядке и оффер сериализуется,
+    только если более поздний фид его еще не содержал; уровень
+    офферов заранее берется из начала первого фида, он же дает каркас.
+
+    В том же проходе строится матрица присутствия офферов в фидах
+    (см. RegionPresence): бит фида ставится сразу при чтении оффера
+    в строку по номеру оффера, без списков вхождений. По матрице
+    выбираются офферы для любого типа объединения без повторного
+    чтения фидов.
+
+    Временный файл закрывается в close; индекс можно использовать
+    как контекстный менеджер.
+    """
+
+    def __init__(
+        self,
+        filenames: list,
+        feeds_folder: str = NEW_FEEDS_FOLDER,
+        compact: bool = False
+    ) -> None:
+        self.filenames = list(filenames)
+        self.feeds_folder = feeds_folder
+        self.compact = compact
+        self.offers: dict[str, list[int]] = {}
+        self.presence: RegionPresence | None = None
+        self._bits = np.zeros(
+            (JOIN_BITS_CAPACITY, (len(self.filenames) + 7) // 8),
+            dtype=np.uint8
+        )
+        self.skeleton = None
+        self.container = None
+        self.offer_level = 0
+        self._spool = tempfile.TemporaryFile()
+
+    def __repr__(self):
+        return (
+            f'OfferJoinIndex(filenames={self.filenames}, '
+            f'offers={len(self.offers)})'
+        )
+
+    def __len__(self) -> int:
+        return len(self.offers)
+
+    def __enter__(self) -> 'OfferJoinIndex':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def build(self) -> 'OfferJoinIndex':
+        """Читает все фиды и строит индекс."""
+        if self.filenames:
+            self.offer_level = self._offer_level()
+        for feed_number in range(len(self.filenames) - 1, -1, -1):
+            self._scan(feed_number)
+        self._build_presence()
+        logging.info(
+            'Индекс объединения: %s офферов из %s фидов',
+            len(self.offers),
+            len(self.filenames)
+        )
+        return self
+
+    def _add(self, offer_id: str, offer, feed_number: int, position: int):
+        """Защищенный метод, учитывает одно вхождение оффера."""
+        first = (feed_number << 40) | position
+        entry = self.offers.get(offer_id)
+        if entry is None:
+            entry = self.offers[offer_id] = [
+                0, first, 0, 0, -1, len(self.offers)
+            ]
+            if entry[5] == len(self._bits):
+                self._bits = np.concatenate(
+                    (self._bits, np.zeros_like(self._bits))
+                )
+        self._bits[entry[5], feed_number >> 3] |= 1 << (feed_number & 7)
+        entry[0] += 1
+        entry[1] = min(entry[1], first)
+        if entry[4] > feed_number:
+            return
+        fragment = serialize_xml(offer, self.offer_level, self.compact)
+        data = fragment.encode('utf-8')
+        entry[2] = self._spool.seek(0, 2)
+        entry[3] = len(data)
+        entry[4] = feed_number
+        self._spool.write(data)
+
+    def _offer_level(self) -> int:
+        """
+        Защищенный метод, читает начало первого фида до контейнера
+        офферов и возвращает уровень вложенности офферов в каркасе.
+        """
+        file_path = self._get_path(self.filenames[0], self.feeds_folder)
+        with self._open_file(file_path) as source:
+            stream = TagStream(source, (OFFERS_TAG,), self.xml_backend)
+            for _, _, parent in stream:
+                if parent is not None:
+                    return stream.depth() + 1
+        raise StructureXMLError(
+            'Тег пуст или структура фида не соответствует ожидаемой.'
+        )
+
+    def _scan(self, feed_number: int) -> None:
+        """
+        Защищенный метод, читает фид потоково (см. TagStream).
+        Оффер учитывается и удаляется из дерева на следующем событии,
+        когда текст после него уже прочитан. Порядок оффера - по
+        открывающему тегу, как в findall('.//offer'). От первого
+        фида остается каркас с пустым контейнером офферов.
+        """
+        is_first = feed_number == 0
+        positions: list[int] = []
+        position = 0
+        pending = None
+        file_path = self._get_path(
+            self.filenames[feed_number],
+            self.feeds_folder
+        )
+        with self._open_file(file_path) as source:
+            stream = TagStream(source, ('offer', OFFERS_TAG), self.xml_backend)
+            for event, element, parent in stream:
+                if pending is not None:
+                    self._flush(feed_number, *pending)
+                    pending = None
+                if parent is None:
+                    continue
+                if event == 'start':
+                    if element.tag != OFFERS_TAG:
+                        positions.append(position)
+                        position += 1
+                    elif is_first and self.container is None:
+                        self.container = element
+                    continue
+                if element.tag == OFFERS_TAG:
+                    continue
+                if is_first and self.container is None:
+                    raise StructureXMLError(
+                        'Тег пуст или структура фида не соответствует '
+                        'ожидаемой.'
+                    )
+                offer_position = positions.pop()
+                detach = not positions and (
+                    not is_first or parent is self.container
+                )
+                pending = (element, offer_position, parent if detach else None)
+            if pending is not None:
+                self._flush(feed_number, *pending)
+        if is_first:
+            if self.container is None:
+                raise StructureXMLError(
+                    'Тег пуст или структура фида не соответствует ожидаемой.'
+                )
+            self.skeleton = stream.root
+            self.container.clear()
+
+    def _flush(self, feed_number: int, offer, position: int, parent) -> None:
+        """
+        Защищенный метод, учитывает прочитанный оффер и удаляет его
+        из дерева, если передан родитель.
+        """
+        offer_id = offer.get('id')
+        if offer_id:
+            self._add(offer_id, offer, feed_number, position)
+        if parent is not None:
+            parent.remove(offer)
+
+    def _build_presence(self) -> None:
+        """
+        Защищенный метод, строит матрицу присутствия: биты,
+        поставленные в _add по номеру оффера, упорядочиваются
+        по первому вхождению оффера.
+        """
+        entries = sorted(self.offers.items(), key=lambda item: item[1][1])
+        order = np.fromiter(
+            (entry[5] for _, entry in entries),
+            dtype=np.int64,
+            count=len(entries)
+        )
+        bits = self._bits[order]
+        self._bits = self._bits[:0]
+        self.presence = RegionPresence(
+            [feed_region(filename) for filename in self.filenames],
+            [offer_id for offer_id, _ in entries],
+            bits,
+            np.fromiter(
+                (entry[0] for _, entry in entries),
+                dtype=np.int64,
+                count=len(entries)
+            )
+        )
+
+    def fragment(self, offer_id: str) -> str:
+        """Возвращает отформатированный текст оффера."""
+        _, _, offset, length = self.offers[offer_id][:4]
+        self._spool.seek(offset)
+        return self._spool.read(length).decode('utf-8')
+
+    def split_skeleton(self) -> tuple[str, str]:
+        """Возвращает текст каркаса до офферов и после них."""
+        sentinel = sub_element(self.container, JOIN_SENTINEL)
+        try:
+            return self._split_skeleton(
+                self.skeleton,
+                sentinel,
+                self.offer_level,
+                self.compact
+            )
+        finally:
+            self.container.remove(sentinel)
+
+    def close(self) -> None:
+        """Закрывает временный файл с текстами офферов."""
+        self._spool.close()
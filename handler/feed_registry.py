@@ -0,0 +1,125 @@
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable
+
+from handler.constants import FEED_CACHE_SIZE
+from handler.logging_config import setup_logging
+from handler.offer_index import OfferIndex
+
+setup_logging()
+
+
+class FeedRegistry:
+    """
+    Кэш разобранных XML-фидов, общий для всех этапов обработки.
+
+    Ключ - путь к файлу, запись действительна, пока у файла не изменились
+    mtime и размер. Вместе с деревом хранится индекс офферов.
+    Количество деревьев в памяти ограничено max_size
+    (вытесняется давно не использованное), кроме того записи можно
+    вытеснять явно: evict, clear или take для потребителей,
+    которые изменяют дерево.
+    """
+
+    def __init__(self, max_size: int = FEED_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._cache: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return (
+            f'FeedRegistry(max_size={self.max_size}, '
+            f'cached={len(self._cache)}, '
+            f'hits={self.hits}, misses={self.misses})'
+        )
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    @staticmethod
+    def _signature(path: Path) -> tuple[int, int]:
+        """Защищенный метод, возвращает (mtime, размер) файла."""
+        stat = path.stat()
+        return stat.st_mtime_ns, stat.st_size
+
+    def _entry(self, path: Path, loader: Callable) -> list:
+        """
+        Защищенный метод, возвращает запись кэша для фида:
+        [сигнатура, корень, индекс офферов или None].
+        Если фида нет в кэше или файл изменился, разбирает его loader.
+        """
+        signature = self._signature(path)
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached is not None and cached[0] == signature:
+                self._cache.move_to_end(path)
+                self.hits += 1
+                return cached
+        entry = [signature, loader(path), None]
+        self.misses += 1
+        if self.max_size <= 0:
+            return entry
+        with self._lock:
+            self._cache[path] = entry
+            self._cache.move_to_end(path)
+            while len(self._cache) > self.max_size:
+                evicted, _ = self._cache.popitem(last=False)
+                logging.debug('Фид %s вытеснен из кэша', evicted)
+        return entry
+
+    def get(self, path: Path, loader: Callable):
+        """
+        Возвращает корень разобранного фида из кэша.
+        Если фида нет в кэше или файл изменился, разбирает его loader.
+        """
+        return self._entry(Path(path).resolve(), loader)[1]
+
+    def get_index(self, path: Path, loader: Callable) -> OfferIndex:
+        """
+        Возвращает индекс офферов фида. Индекс строится при первом
+        обращении и живет вместе с деревом в кэше: изменение файла,
+        take, evict и вытеснение сбрасывают его вместе с деревом.
+        """
+        entry = self._entry(Path(path).resolve(), loader)
+        if entry[2] is None:
+            entry[2] = OfferIndex(entry[1])
+        return entry[2]
+
+    def take(self, path: Path, loader: Callable):
+        """
+        Забирает дерево фида из кэша во владение вызывающего.
+        Используется потребителями, которые изменяют дерево:
+        другие этапы после этого разберут файл заново.
+        """
+        path = Path(path).resolve()
+        signature = self._signature(path)
+        with self._lock:
+            cached = self._cache.pop(path, None)
+        if cached is not None and cached[0] == signature:
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        return loader(path)
+
+    def evict(self, path: Path) -> None:
+        """Удаляет фид из кэша."""
+        with self._lock:
+            self._cache.pop(Path(path).resolve(), None)
+
+    def clear(self) -> None:
+        """Очищает кэш и логирует статистику попаданий."""
+        with self._lock:
+            self._cache.clear()
+        logging.info(
+            'Кэш фидов очищен: попаданий - %s, разборов - %s',
+            self.hits,
+            self.misses
+        )
+
+
+FEED_REGISTRY = FeedRegistry()
+"""Общий для процесса кэш разобранных фидов."""
@@ -2,13 +2,16 @@ import logging
 import xml.etree.ElementTree as ET
 from collections import defaultdict
 
-from handler.constants import (FEEDS_FOLDER, IMAGE_FTP_ADDRESS,
+from handler.constants import (COMPACT_XML, FEEDS_FOLDER, IMAGE_FTP_ADDRESS,
                                NEW_FEEDS_FOLDER, NEW_IMAGE_FOLDER,
                                VIDEO_FTP_ADDRESS, VIDEOS_FOLDER)
 from handler.decorators import time_of_function
 from handler.feeds import FEEDS
 from handler.logging_config import setup_logging
 from handler.mixins import FileMixin
+from handler.offer_filter import OfferFilter
+from handler.xml_backend import sub_element
+from handler.xml_writer import write_xml
 
 setup_logging()
 logger = logging.getLogger(__name__)
@@ -18,8 +21,24 @@ class FeedHandler(FileMixin):
     """
     Класс, предоставляющий интерфейс
     для обработки xml-файлов.
+
+    Методы delete_tags, delete_param, replace_images и add_video
+    только записывают операцию в план; план применяется за один
+    обход офферов при первом обращении к дереву (save, фильтрация).
+
+    В потоковом режиме (streaming=True) дерево целиком не строится:
+    save читает офферы по одному через iterparse, применяет к ним план
+    (включая remove_non_matching_offers) и сразу пишет в файл.
+
+    Исходный фид может быть сжат (STORAGE_COMPRESSION), но результат
+    публикуется в new_feeds_folder обычным XML: эти файлы забирают
+    зеркала FTP и рекламные площадки.
     """
 
+    _STREAM_SENTINEL = '__stream_offers__'
+
+    _files_dict_cache: dict[str, dict] = {}
+
     def __init__(
         self,
         filename: str,
@@ -27,7 +46,9 @@ class FeedHandler(FileMixin):
         new_feeds_folder: str = NEW_FEEDS_FOLDER,
         new_images_folder: str = NEW_IMAGE_FOLDER,
         videos_folder: str = VIDEOS_FOLDER,
-        feeds_list: tuple[str, ...] = FEEDS
+        feeds_list: tuple[str, ...] = FEEDS,
+        streaming: bool = False,
+        compact: bool = COMPACT_XML
     ):
         self.filename = filename
         self.feeds_folder = feeds_folder
@@ -35,163 +56,378 @@ class FeedHandler(FileMixin):
         self.new_images_folder = new_images_folder
         self.videos_folder = videos_folder
         self.feeds_list = feeds_list
+        self.streaming = streaming
+        self.compact = compact
         self._root = None
+        self._plan: list[tuple] = []
+        self._stream_filters: dict[int, OfferFilter] = {}
+        self._stream_targets: dict[int, frozenset] = {}
         self._is_modified = False
 
     def __repr__(self):
         return (
-            f"FeedHandler(filename = '{self.filename}'"
+            f"FeedHandler(filename = '{self.filename}', "
+            f"streaming={self.streaming})"
         )
 
     @property
     def root(self):
-        """Ленивая загрузка корневого элемента."""
+        """
+        Ленивая загрузка корневого элемента.
+        Перед выдачей дерева применяет накопленные операции.
+        """
+        if self.streaming:
+            raise ValueError('В потоковом режиме дерево фида не загружается')
         if self._root is None:
-            self._root = self._get_root(self.filename, self.feeds_folder)
+            self._root = self._take_root(self.filename, self.feeds_folder)
+        if self._plan:
+            self._apply_plan()
         return self._root
 
+    def _cached_files_dict(self, folder_name: str) -> dict:
+        """
+        Защищенный метод, возвращает словарь '{offer_id}: {filename}'
+        директории, построенный один раз за запуск.
+        """
+        cache = FeedHandler._files_dict_cache
+        if folder_name not in cache:
+            cache[folder_name] = self._get_files_dict(folder_name)
+        return cache[folder_name]
+
+    @classmethod
+    def clear_files_cache(cls) -> None:
+        """Сбрасывает кэш словарей видео и изображений."""
+        cls._files_dict_cache.clear()
+
     def delete_tags(self, tags: tuple):
         """Метод удаляет переданные теги из офферов."""
-        tags_dict_count: dict = defaultdict(int)
-        try:
-            offers = self.root.findall('.//offer')
-            for offer in offers:
-                for tag in tags:
-                    target_tag = offer.find(tag)
-                    if target_tag is not None:
-                        offer.remove(target_tag)
-                        tags_dict_count[tag] += 1
-                        self._is_modified = True
-
-            logging.info('Удаление тегов в фиде %s:', self.filename)
-            logging.info('Всего обработано офферов - %s', len(offers))
-            logging.info(
-                'Всего удалено тегов в фиде %s - %s',
-                self.filename,
-                tags_dict_count
-            )
-            return self
+        self._plan.append(('delete_tags', tags))
+        return self
 
+    def delete_param(self, param: str):
+        """Метод удаляет переданные параметры из офферов."""
+        self._plan.append(('delete_param', param))
+        return self
+
+    def _apply_plan(self) -> None:
+        """
+        Защищенный метод, применяет накопленные операции за один
+        обход дерева: к каждому офферу операции применяются в порядке
+        их вызова, параметры вне офферов удаляются по ходу обхода.
+        """
+        plan, self._plan = self._plan, []
+        counters: list[dict] = [defaultdict(int) for _ in plan]
+        param_steps = [
+            (index, param) for index, (name, param) in enumerate(plan)
+            if name == 'delete_param'
+        ]
+        offers_count = 0
+        try:
+            stack = list(reversed(self._root))
+            while stack:
+                element = stack.pop()
+                if element.tag == 'offer':
+                    offers_count += 1
+                    for index, (name, argument) in enumerate(plan):
+                        self._OFFER_STEPS[name](
+                            element,
+                            argument,
+                            counters[index]
+                        )
+                    continue
+                for index, param in param_steps:
+                    if param in element.attrib:
+                        del element.attrib[param]
+                        counters[index][param] += 1
+                stack.extend(reversed(element))
         except Exception as error:
             logging.error(
-                'Неизвестная ошибка в delete_tags в файле %s: %s',
+                'Неожиданная ошибка при обработке офферов в файле %s: %s',
                 self.filename,
                 error
             )
             raise
 
-    def delete_param(self, param: str):
-        """Метод удаляет переданные параметры из офферов."""
-        deleted_params = 0
-        try:
-            target_param = self.root.findall(f'.//*[@{param}]')
+        for (name, argument), counter in zip(plan, counters):
+            if any(counter.values()):
+                self._is_modified = True
+            getattr(self, f'_log_{name}')(argument, counter, offers_count)
 
-            if not target_param:
-                logging.debug('В файле %s не найдено %s', self.filename, param)
-                return self
+    def _strip_params(self, skeleton, param_steps, counters) -> None:
+        """
+        Защищенный метод, удаляет параметры из каркаса фида
+        (все элементы, кроме корня и офферов).
+        """
+        stack = list(skeleton)
+        while stack:
+            element = stack.pop()
+            if element.tag == 'offer':
+                continue
+            for index, param in param_steps:
+                if param in element.attrib:
+                    del element.attrib[param]
+                    counters[index][param] += 1
+            stack.extend(element)
+
+    def _stream_offer(self, offer, plan, counters, skeleton) -> bool:
+        """
+        Защищенный метод, применяет план к одному офферу.
+        Возвращает False, если оффер не прошел фильтр.
+        """
+        for index, (name, argument) in enumerate(plan):
+            if name != 'filter':
+                self._OFFER_STEPS[name](offer, argument, counters[index])
+                continue
+            offer_filter = self._stream_filters[index]
+            if index not in self._stream_targets:
+                self._stream_targets[index] = offer_filter.compile(
+                    skeleton.findall('.//category')
+                )
+            if not offer_filter.matches(offer, self._stream_targets[index]):
+                counters[index]['removed'] += 1
+                return False
+        return True
+
+    def _stream_save(self, new_filename: str) -> bool:
+        """
+        Защищенный метод, потоково обрабатывает и сохраняет фид.
+        Офферы читаются через iterparse по одному, обрабатываются
+        планом и сразу пишутся в файл, после чего удаляются из дерева.
+        В памяти остается только каркас фида без офферов, поэтому
+        пиковая память не зависит от количества офферов.
+        Возвращает False, если содержимое файла не изменилось.
+        """
+        plan, self._plan = self._plan, []
+        counters: list[dict] = [defaultdict(int) for _ in plan]
+        param_steps = [
+            (index, param) for index, (name, param) in enumerate(plan)
+            if name == 'delete_param'
+        ]
+        self._stream_filters = {
+            index: OfferFilter.from_dict(argument)
+            for index, (name, argument) in enumerate(plan)
+            if name == 'filter'
+        }
+        self._stream_targets = {}
+        offers_count = 0
+
+        def write(output) -> None:
+            nonlocal offers_count
+            offers_count = self._stream_write(
+                output,
+                plan,
+                counters,
+                param_steps
+            )
 
-            for element in target_param:
-                element.attrib.pop(param, None)
-                deleted_params += 1
+        published = self._publish(
+            self.new_feeds_folder,
+            new_filename,
+            write
+        )
+        for (name, argument), counter in zip(plan, counters):
+            if any(counter.values()):
                 self._is_modified = True
+            getattr(self, f'_log_{name}')(argument, counter, offers_count)
+        return published
 
-            logging.info(
-                'Удаление параметра %s в фиде %s:',
-                param,
-                self.filename
-            )
-            logging.info(
-                'Всего найдено параметров в фиде - %s',
-                len(target_param)
-            )
-            logging.info(
-                'Всего удалено параметров в фиде %s - %s',
-                self.filename,
-                deleted_params
-            )
-            return self
+    def _stream_write(self, output, plan, counters, param_steps) -> int:
+        """
+        Защищенный метод, читает исходный фид через iterparse
+        и пишет результат в output. Возвращает количество офферов.
+        Текст после оффера (tail) парсер может прочитать позже события
+        'end', поэтому оффер обрабатывается на следующем событии.
+        """
+        skeleton = sentinel = None
+        sentinel_level = position = 0
+        stack: list = []
+        offer_depth = 0
+        offers_count = 0
+        pending = None
+        source_path = self._get_path(self.filename, self.feeds_folder)
+
+        def emit(element, container, level: int) -> None:
+            nonlocal sentinel, sentinel_level
+            if not self._stream_offer(element, plan, counters, skeleton):
+                return
+            if sentinel is None:
+                sentinel = ET.Element(self._STREAM_SENTINEL)
+                sentinel_level = level
+                container.insert(position, sentinel)
+                self._strip_params(skeleton, param_steps, counters)
+                prefix, _ = self._split_skeleton(
+                    skeleton,
+                    sentinel,
+                    sentinel_level,
+                    self.compact
+                )
+                output.write(prefix)
+            write_xml(element, output, level, self.compact)
+
+        with self._open_file(source_path) as source:
+            for event, element in ET.iterparse(
+                source,
+                events=('start', 'end')
+            ):
+                if pending is not None:
+                    emit(*pending)
+                    pending = None
+                if event == 'start':
+                    if skeleton is None:
+                        skeleton = element
+                    stack.append(element)
+                    if element.tag == 'offer':
+                        offer_depth += 1
+                    continue
+                stack.pop()
+                if element.tag != 'offer':
+                    continue
+                offer_depth -= 1
+                if offer_depth:
+                    continue
 
-        except Exception as error:
-            logging.error(
-                'Неожиданная ошибка в delete_param в файле %s: %s',
-                self.filename,
-                error
+                offers_count += 1
+                container = stack[-1]
+                if sentinel is None:
+                    position = list(container).index(element)
+                container.remove(element)
+                pending = (element, container, len(stack))
+            if pending is not None:
+                emit(*pending)
+
+        self._strip_params(skeleton, param_steps, counters)
+        if sentinel is None:
+            write_xml(skeleton, output, compact=self.compact)
+        else:
+            _, suffix = self._split_skeleton(
+                skeleton,
+                sentinel,
+                sentinel_level,
+                self.compact
             )
-            raise
+            output.write(suffix)
+        return offers_count
+
+    @staticmethod
+    def _offer_delete_tags(offer, tags: tuple, counter: dict) -> None:
+        """Удаляет из оффера первые вхождения переданных тегов."""
+        for tag in tags:
+            target_tag = offer.find(tag)
+            if target_tag is not None:
+                offer.remove(target_tag)
+                counter[tag] += 1
+
+    @staticmethod
+    def _offer_delete_param(offer, param: str, counter: dict) -> None:
+        """Удаляет параметр у оффера и всех его вложенных тегов."""
+        for element in offer.iter():
+            if param in element.attrib:
+                del element.attrib[param]
+                counter[param] += 1
+
+    @staticmethod
+    def _offer_replace_images(offer, image_dict: dict, counter: dict) -> None:
+        """Заменяет изображения оффера на обрамленное."""
+        offer_id = offer.get('id')
+        if not offer_id or offer_id not in image_dict:
+            return
+        pictures = offer.findall('picture')
+        for picture in pictures:
+            offer.remove(picture)
+        counter['deleted'] += len(pictures)
+        picture_tag = sub_element(offer, 'picture')
+        picture_tag.text = f'{IMAGE_FTP_ADDRESS}/{image_dict[offer_id]}'
+        counter['input'] += 1
+
+    @staticmethod
+    def _offer_add_video(offer, videos_dict: dict, counter: dict) -> None:
+        """Добавляет в оффер ссылку на видео."""
+        offer_id = offer.get('id')
+        if not offer_id or offer_id not in videos_dict:
+            return
+        video_tag = sub_element(offer, 'video')
+        video_tag.text = f'{VIDEO_FTP_ADDRESS}/{videos_dict[offer_id]}'
+        counter['input'] += 1
+
+    _OFFER_STEPS = {
+        'delete_tags': _offer_delete_tags,
+        'delete_param': _offer_delete_param,
+        'replace_images': _offer_replace_images,
+        'add_video': _offer_add_video,
+    }
+
+    def _log_delete_tags(self, tags, counter, offers_count) -> None:
+        logging.info('Удаление тегов в фиде %s:', self.filename)
+        logging.info('Всего обработано офферов - %s', offers_count)
+        logging.info(
+            'Всего удалено тегов в фиде %s - %s',
+            self.filename,
+            dict(counter)
+        )
+
+    def _log_delete_param(self, param, counter, offers_count) -> None:
+        if not counter[param]:
+            logging.debug('В файле %s не найдено %s', self.filename, param)
+            return
+        logging.info(
+            'Удаление параметра %s в фиде %s:',
+            param,
+            self.filename
+        )
+        logging.info('Всего найдено параметров в фиде - %s', counter[param])
+        logging.info(
+            'Всего удалено параметров в фиде %s - %s',
+            self.filename,
+            counter[param]
+        )
+
+    def _log_replace_images(self, image_dict, counter, offers_count) -> None:
+        logging.info(
+            '\nКоличество удаленных изображений - %s'
+            '\nКоличество добавленных изображений - %s',
+            counter['deleted'],
+            counter['input']
+        )
+
+    def _log_add_video(self, videos_dict, counter, offers_count) -> None:
+        logging.info('Количество добавленных видео - %s', counter['input'])
+
+    def _log_filter(self, vendor_category, counter, offers_count) -> None:
+        logger.info(
+            'Удалено офферов по фильтрам: %s (%s)',
+            counter['removed'], self.filename
+        )
 
     @time_of_function
     def remove_non_matching_offers(self, vendor_category: dict):
         """
         Метод фильтрует офферы по брендам и
         категориям и удаляет неподходящие.
+        Оффер остается, если его пара (бренд, категория) есть
+        в скомпилированном фильтре; список офферов пересобирается
+        за один проход. В потоковом режиме фильтр добавляется в план.
         """
+        if self.streaming:
+            self._plan.append(('filter', vendor_category))
+            return self
         try:
-            categories = self.root.findall('.//category')
-            all_categories = {
-                category.get('id'): category.get('parentId')
-                for category in categories
-            }
-
-            children_map = defaultdict(list)
-            for category_id, parent_id in all_categories.items():
-                if parent_id:
-                    children_map[parent_id].append(category_id)
-
-            def collect(category_id):
-                result = set()
-                stack = [str(category_id)]
-
-                while stack:
-                    cur = stack.pop()
-                    result.add(cur)
-                    for child in children_map.get(cur, []):
-                        if child not in result:
-                            stack.append(child)
-                return result
-
-            target: set = set()
-
-            for vendor_cats in vendor_category.values():
-                for category_id in vendor_cats:
-                    if category_id == 'all':
-                        target.update(all_categories.keys())
-                        target.add(None)
-                    elif str(category_id).isdigit():
-                        target.update(collect(category_id))
-
-            offers = self.root.findall('.//offer')
-            parent = self.root.find('.//offers') or self.root
-            removed = 0
-
-            for offer in offers[:]:
-                vendor = (offer.findtext('vendor') or '').strip().lower()
-                category_id = offer.findtext('categoryId')
-
-                if vendor not in vendor_category:
-                    parent.remove(offer)
-                    removed += 1
-                    continue
-
-                vendor_cats = vendor_category[vendor]
-
-                if not vendor_cats:
-                    parent.remove(offer)
-                    removed += 1
-
-                if 'all' in vendor_cats:
-                    continue
-
-                if category_id not in target:
-                    parent.remove(offer)
-                    removed += 1
+            offer_filter = OfferFilter.from_dict(vendor_category)
+            pairs = offer_filter.compile(self.root.findall('.//category'))
+            parent = self.root.find('.//offers')
+            if parent is None:
+                parent = self.root
+            kept = [
+                child for child in parent
+                if child.tag != 'offer' or offer_filter.matches(child, pairs)
+            ]
+            removed = len(parent) - len(kept)
+            if removed:
+                parent[:] = kept
 
             if removed:
                 self._is_modified = True
 
-            logger.info(
-                'Удалено офферов по фильтрам: %s (%s)',
-                removed, self.filename
-            )
+            self._log_filter(vendor_category, {'removed': removed}, None)
             return self
 
         except Exception as error:
@@ -202,37 +438,10 @@ class FeedHandler(FileMixin):
             )
             raise
 
-    @time_of_function
     def replace_images(self):
         """Метод, заменяющий в фидах изображения на обрамленные."""
-        deleted_images = 0
-        input_images = 0
         try:
-            image_dict = self._get_files_dict(self.new_images_folder)
-            offers = self.root.findall('.//offer')
-
-            for offer in offers:
-                offer_id = offer.get('id')
-
-                if offer_id and offer_id in image_dict:
-                    pictures = offer.findall('picture')
-                    for picture in pictures:
-                        offer.remove(picture)
-                    deleted_images += len(pictures)
-                    picture_tag = ET.SubElement(offer, 'picture')
-                    picture_tag.text = (
-                        f'{IMAGE_FTP_ADDRESS}/{image_dict[offer_id]}'
-                    )
-                    input_images += 1
-                    self._is_modified = True
-
-            logging.info(
-                '\nКоличество удаленных изображений - %s'
-                '\nКоличество добавленных изображений - %s',
-                deleted_images,
-                input_images
-            )
-            return self
+            image_dict = self._cached_files_dict(self.new_images_folder)
         except Exception as error:
             logging.error(
                 'Неожиданная ошибка в replace_images в файле %s: %s',
@@ -240,25 +449,13 @@ class FeedHandler(FileMixin):
                 error
             )
             raise
+        self._plan.append(('replace_images', image_dict))
+        return self
 
     def add_video(self):
         """Метод, добавляющий в оффер ссылку на видео в тег <video>."""
-        input_videos = 0
         try:
-            videos_dict = self._get_files_dict(self.videos_folder)
-            offers = self.root.findall('.//offer')
-            for offer in offers:
-                offer_id = offer.get('id')
-
-                if offer_id and offer_id in videos_dict:
-                    video_tag = ET.SubElement(offer, 'video')
-                    video_tag.text = (
-                        f'{VIDEO_FTP_ADDRESS}/{videos_dict[offer_id]}'
-                    )
-                    input_videos += 1
-                    self._is_modified = True
-            logging.info('Количество добавленных видео - %s', input_videos)
-            return self
+            videos_dict = self._cached_files_dict(self.videos_folder)
         except Exception as error:
             logging.error(
                 'Неожиданная ошибка в add_video в файле %s: %s',
@@ -266,22 +463,31 @@ class FeedHandler(FileMixin):
                 error
             )
             raise
+        self._plan.append(('add_video', videos_dict))
+        return self
 
     def save(self, prefix: str):
-        """Метод сохраняет файл, если были изменения."""
+        """
+        Метод сохраняет файл. Если результат совпадает с
+        опубликованной ранее версией, файл не перезаписывается.
+        """
         try:
             if 'retailmedia_auction' in self.filename:
                 return self
             old_prefix = self.filename.split('_')[0]
             new_filename = self.filename.replace(old_prefix, prefix)
 
-            if not self._is_modified:
-                self._save_xml(self.root, self.new_feeds_folder, new_filename)
-                logger.info('Файл обновлен без изменений')
-                return self
-
-            self._save_xml(self.root, self.new_feeds_folder, new_filename)
-            logger.info('Файл сохранён как %s', new_filename)
+            if self.streaming:
+                published = self._stream_save(new_filename)
+            else:
+                published = self._save_xml(
+                    self.root,
+                    self.new_feeds_folder,
+                    new_filename,
+                    compact=self.compact
+                )
+            if published:
+                logger.info('Файл сохранён как %s', new_filename)
 
             self._is_modified = False
             return self
@@ -1,19 +1,28 @@
-# import logging
-from collections import defaultdict
+import logging
 from datetime import datetime as dt
 
 import numpy as np
 
-from handler.calculation import clear_avg, clear_max, clear_median, clear_min
-from handler.constants import (DATE_FORMAT, DECIMAL_ROUNDING, FEEDS_FOLDER,
-                               JOIN_FEEDS_FOLDER, NEW_FEEDS_FOLDER)
+from handler.calculation import segment_price_stats, sketch_price_stats
+from handler.category_tree import CategoryTree
+from handler.constants import (COMPACT_XML, DATE_FORMAT, FEEDS_FOLDER,
+                               JOIN_FEEDS_FOLDER, NEW_FEEDS_FOLDER,
+                               OFFER_SNAPSHOTS, PRICE_STATS_MODE)
 from handler.decorators import time_of_function, try_except
-from handler.exceptions import StructureXMLError
+from handler.feed_join import OfferJoinIndex
 # from handler.logging_config import setup_logging
 from handler.mixins import FileMixin
+from handler.offer_delta import REPORT_ROWS_SUFFIX, OfferDelta
+from handler.offer_snapshot import PRICE_INVALID, OfferSnapshot
+from handler.quantile_sketch import KLLSketch
+from handler.region_presence import RegionJoin
+from handler.xml_writer import write_xml
 
 # setup_logging()
 
+JOIN_FILENAME = '{}_join_feed.xml'
+"""Шаблон имени объединенного фида по имени типа объединения."""
+
 
 class FeedReport(FileMixin):
 
@@ -22,13 +31,20 @@ class FeedReport(FileMixin):
         filenames: list,
         feeds_folder: str = FEEDS_FOLDER,
         new_feeds_folder: str = NEW_FEEDS_FOLDER,
-        join_feeds_folder: str = JOIN_FEEDS_FOLDER
+        join_feeds_folder: str = JOIN_FEEDS_FOLDER,
+        compact: bool = COMPACT_XML,
+        snapshots: bool = OFFER_SNAPSHOTS,
+        stats_mode: str = PRICE_STATS_MODE
     ):
         self.filenames = filenames
         self.feeds_folder = feeds_folder
         self.new_feeds_folder = new_feeds_folder
         self.join_feeds_folder = join_feeds_folder
-        self._cached_offers = None
+        self.compact = compact
+        self.snapshots = snapshots
+        self.stats_mode = stats_mode
+        self.category_sketches: dict[str, dict[str, KLLSketch]] = {}
+        self._join_index: OfferJoinIndex | None = None
 
     def __repr__(self):
         return (
@@ -37,145 +53,359 @@ class FeedReport(FileMixin):
             f"new_feeds_folder='{self.new_feeds_folder}'), "
         )
 
+    def _category_data(self, filename: str) -> tuple[dict, dict]:
+        """
+        Защищенный метод, собирает по дереву фида цены офферов
+        по категориям и словарь категория -> родитель.
+        """
+        root = self._get_root(filename, self.feeds_folder)
+        category_data = {}
+        all_categories = {}
+
+        for category in root.findall('.//category'):
+            category_name = category.text
+            category_id = category.get('id')
+            parent_id = category.get('parentId')
+            all_categories[category_id] = parent_id
+            category_data[category_id] = {
+                'prices': [],
+                'category_name': category_name,
+                'offers_count': 0
+            }
+
+        for offer in self._get_offer_index(filename, self.feeds_folder):
+            category_id = offer.category_id
+            price = offer.price
+            if category_id and price:
+                if category_id not in category_data:
+                    category_data[category_id] = {
+                        'prices': [],
+                        'category_name': '',
+                        'offers_count': 0
+                    }
+                category_data[category_id]['prices'].append(int(price))
+                category_data[category_id]['offers_count'] += 1
+        return category_data, all_categories
+
+    def _snapshot_category_data(
+        self,
+        snapshot: OfferSnapshot
+    ) -> tuple[dict, dict]:
+        """
+        Защищенный метод, делает то же, что _category_data,
+        по колоночному снимку: цены группируются по категориям
+        стабильной сортировкой, порядок цен и категорий совпадает.
+        """
+        category_data = {}
+        all_categories = {}
+        for category_id, parent_id, category_name in zip(
+            snapshot.columns['category'].tolist(),
+            snapshot.columns['parent'].tolist(),
+            snapshot.columns['category_name'].tolist()
+        ):
+            all_categories[category_id] = parent_id
+            category_data[category_id] = {
+                'prices': [],
+                'category_name': category_name,
+                'offers_count': 0
+            }
+
+        categories = snapshot.columns['category_id']
+        codes = np.asarray(categories.codes)
+        filled = np.char.str_len(categories.table) > 0
+        valid = (codes >= 0) & (np.asarray(snapshot.price_state) > 0)
+        valid[valid] = filled[codes[valid]]
+        if np.any(snapshot.price_state[valid] == PRICE_INVALID):
+            raise ValueError('В фиде есть офферы с нечисловой ценой')
+
+        codes = codes[valid]
+        order = np.argsort(codes, kind='stable')
+        prices = np.asarray(snapshot.price)[valid][order].tolist()
+        unique_codes, first_seen, counts = np.unique(
+            codes,
+            return_index=True,
+            return_counts=True
+        )
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1])).tolist()
+        groups = dict(zip(
+            unique_codes.tolist(),
+            zip(starts, counts.tolist())
+        ))
+        table = categories.table.tolist()
+        for code in unique_codes[np.argsort(first_seen)].tolist():
+            start, count = groups[code]
+            data = category_data.setdefault(table[code], {
+                'prices': [],
+                'category_name': '',
+                'offers_count': 0
+            })
+            data['prices'].extend(prices[start:start + count])
+            data['offers_count'] += count
+        return category_data, all_categories
+
+    def _category_row(
+        self,
+        filename: str,
+        category_id: str,
+        category_name: str,
+        parent_id: str | None,
+        offers_count: int,
+        stats: dict
+    ) -> dict:
+        """
+        Защищенный метод, собирает строку отчета по категории
+        из статистики цен (см. segment_price_stats).
+        """
+        return {
+            'date': None,
+            'feed_name': filename,
+            'category_name': category_name,
+            'category_id': category_id,
+            'parent_id': parent_id,
+            'count_offers': offers_count,
+            **stats
+        }
+
+    def _category_stats(
+        self,
+        filename: str,
+        category_data: dict,
+        tree: CategoryTree,
+        pending: list
+    ) -> tuple[dict, dict]:
+        """
+        Защищенный метод, считает статистику цен по поддеревьям
+        категорий pending и число офферов в поддеревьях.
+        В режиме 'exact' статистика считается точно одним пакетом
+        по отрезкам общего массива цен, в режиме 'sketch' -
+        по скетчам KLL, объединенным снизу вверх по дереву.
+        """
+        if self.stats_mode == 'exact':
+            prices, spans = tree.spans(category_data)
+            stats = dict(zip(pending, segment_price_stats(
+                prices,
+                [spans[category_id][0] for category_id in pending],
+                [spans[category_id][1] for category_id in pending]
+            )))
+            return stats, {
+                category_id: end - start
+                for category_id, (start, end) in spans.items()
+            }
+        if self.stats_mode == 'sketch':
+            sketches = tree.merge_up({
+                category_id: KLLSketch().update(data['prices'])
+                for category_id, data in category_data.items()
+            })
+            self.category_sketches[filename] = sketches
+            stats = {
+                category_id: sketch_price_stats(sketches[category_id])
+                for category_id in pending
+            }
+            return stats, {
+                category_id: sketch.count
+                for category_id, sketch in sketches.items()
+            }
+        raise ValueError(f'Неизвестный режим статистики: {self.stats_mode}')
+
+    def regions_price_stats(self) -> dict[str, dict]:
+        """
+        Метод, возвращающий статистику цен по категориям сразу
+        по всем регионам (фидам). Доступен в режиме 'sketch'
+        после get_offers_report: скетчи категорий всех фидов
+        объединяются без повторного чтения цен.
+        """
+        merged: dict[str, KLLSketch] = {}
+        for sketches in self.category_sketches.values():
+            for category_id, sketch in sketches.items():
+                if category_id in merged:
+                    merged[category_id].merge(sketch)
+                else:
+                    merged[category_id] = sketch.copy()
+        return {
+            category_id: sketch_price_stats(sketch)
+            for category_id, sketch in merged.items()
+        }
+
+    def _reusable_rows(
+        self,
+        filename: str,
+        delta: OfferDelta | None,
+        all_categories: dict
+    ) -> tuple[dict, set]:
+        """
+        Защищенный метод, возвращает строки отчета прошлого запуска
+        и множество категорий, которые нужно пересчитать: категории
+        измененных офферов (до и после изменения) и их предков.
+        Без изменений или при новом дереве категорий пересчитывается все.
+        Строки используются, только если они сохранены вместе
+        с отпечатками, с которыми сравнивался фид (см. base_commit).
+        """
+        if delta is None or delta.initial or delta.categories_changed:
+            return {}, set()
+        cached = self._read_meta(
+            self.feeds_folder,
+            f'{filename}{REPORT_ROWS_SUFFIX}'
+        )
+        if delta.base_commit is None or (
+            cached.get('commit') != delta.base_commit
+        ):
+            return {}, set()
+        cached_rows = cached['rows']
+        affected: set = set()
+        for category_id in delta.affected_values('category_id'):
+            while category_id is not None and category_id not in affected:
+                affected.add(category_id)
+                category_id = all_categories.get(category_id)
+        logging.info(
+            'Отчет по фиду %s: пересчет %s категорий из %s',
+            filename,
+            len(affected),
+            len(all_categories)
+        )
+        return cached_rows, affected
+
     @time_of_function
     @try_except
-    def get_offers_report(self) -> list[dict]:
-        """Метод, формирующий отчет по офферам."""
+    def get_offers_report(
+        self,
+        deltas: dict[str, OfferDelta] | None = None
+    ) -> list[dict]:
+        """
+        Метод, формирующий отчет по офферам.
+        Если переданы изменения офферов (см. OfferDeltaTracker),
+        строки категорий без изменений берутся из прошлого отчета,
+        а новые строки передаются в OfferDelta.report_rows и
+        сохраняются вместе с отпечатками в OfferDeltaTracker.commit.
+        """
         result = []
         date_str = (dt.now()).strftime(DATE_FORMAT)
         for filename in self.filenames:
-            root = self._get_root(filename, self.feeds_folder)
-            category_data = {}
-            all_categories = {}
-
-            for category in root.findall('.//category'):
-                category_name = category.text
-                category_id = category.get('id')
-                parent_id = category.get('parentId')
-                all_categories[category_id] = parent_id
-                category_data[category_id] = {
-                    'prices': [],
-                    'category_name': category_name,
-                    'offers_count': 0
-                }
-
-            for offer in root.findall('.//offer'):
-                category_id = offer.findtext('categoryId')
-                price = offer.findtext('price')
-                if category_id and price:
-                    if category_id not in category_data:
-                        category_data[category_id] = {
-                            'prices': [],
-                            'category_name': '',
-                            'offers_count': 0
-                        }
-                    category_data[category_id]['prices'].append(int(price))
-                    category_data[category_id]['offers_count'] += 1
-
-            def aggregate_data(category_id):
-                prices = category_data[category_id]['prices'].copy()
-                offers_count = category_data[category_id]['offers_count']
-
-                for child_id, parent_id in all_categories.items():
-                    if parent_id == category_id:
-                        child_prices, child_count = aggregate_data(child_id)
-                        prices.extend(child_prices)
-                        offers_count += child_count
-                category_data[category_id]['prices'] = prices
-                category_data[category_id]['offers_count'] = offers_count
-                return prices, offers_count
-
-            root_categories = [
-                cat_id for cat_id, parent_id in all_categories.items()
-                if parent_id is None
+            if self.snapshots:
+                category_data, all_categories = self._snapshot_category_data(
+                    self._get_snapshot(filename, self.feeds_folder)
+                )
+            else:
+                category_data, all_categories = self._category_data(filename)
+            self._release_feed(filename, self.feeds_folder)
+            cached_rows, affected = self._reusable_rows(
+                filename,
+                (deltas or {}).get(filename),
+                all_categories
+            )
+            pending = [
+                category_id for category_id in category_data
+                if category_id not in cached_rows or category_id in affected
             ]
-            for root_id in root_categories:
-                aggregate_data(root_id)
-
+            stats, counts = self._category_stats(
+                filename,
+                category_data,
+                CategoryTree(all_categories),
+                pending
+            )
+            rows = {}
             for category_id, data in category_data.items():
-                count_offers = data['offers_count']
-                price_list = data['prices']
-                parent_id = all_categories.get(category_id)
-                category_name = data['category_name']
-
-                result.append({
-                    'date': date_str,
-                    'feed_name': filename,
-                    'category_name': category_name,
-                    'category_id': category_id,
-                    'parent_id': parent_id,
-                    'count_offers': count_offers,
-                    'min_price': min(price_list) if price_list else 0,
-                    'clear_min_price': clear_min(price_list)
-                    if price_list else 0,
-                    'max_price': max(price_list) if price_list else 0,
-                    'clear_max_price': clear_max(price_list)
-                    if price_list else 0,
-                    'avg_price': round(
-                        sum(price_list) / len(price_list), DECIMAL_ROUNDING
-                    ) if price_list else 0,
-                    'clear_avg_price': clear_avg(price_list)
-                    if price_list else 0,
-                    'median_price': round(
-                        np.median(price_list), DECIMAL_ROUNDING
-                    ) if price_list else 0,
-                    'clear_median_price': clear_median(price_list)
-                    if price_list else 0
-                })
+                row = cached_rows.get(category_id)
+                if category_id in stats:
+                    row = self._category_row(
+                        filename,
+                        category_id,
+                        data['category_name'],
+                        all_categories.get(category_id),
+                        counts[category_id],
+                        stats[category_id]
+                    )
+                row['date'] = date_str
+                rows[category_id] = row
+                result.append(row)
+            if filename in (deltas or {}):
+                deltas[filename].report_rows = rows
         return result
 
-    def _super_feed(self) -> tuple:
-        """Защищенный метод, создает шаблон фида с пустыми offers."""
-        root = self._get_root(self.filenames[0], self.new_feeds_folder)
-        offers = root.find('.//offers')
-        if offers is not None:
-            offers.clear()
-        else:
-            raise StructureXMLError(
-                'Тег пуст или структура фида не соответствует ожидаемой.'
-            )
-        return root, offers
+    def _get_join_index(self) -> OfferJoinIndex:
+        """
+        Защищенный метод, возвращает индекс объединения для текущего
+        списка фидов; индекс строится один раз на список.
+        """
+        index = self._join_index
+        if index is None or index.filenames != list(self.filenames):
+            if index is not None:
+                index.close()
+            index = self._join_index = OfferJoinIndex(
+                self.filenames,
+                self.new_feeds_folder,
+                self.compact
+            ).build()
+        return index
+
+    def close_join_index(self) -> None:
+        """Закрывает индекс объединения и его временный файл."""
+        if self._join_index is not None:
+            self._join_index.close()
+            self._join_index = None
 
-    def _collect_all_offers(self) -> tuple[dict, dict]:
+    def _write_joins(
+        self,
+        index: OfferJoinIndex,
+        masks: np.ndarray,
+        outputs: list
+    ) -> None:
         """
-        Защищенный метод, подсчитывает встречался ли оффер в том или ином фиде.
+        Защищенный метод, пишет все объединенные фиды за один проход
+        по индексу: masks - матрица офферы x фиды, текст оффера
+        читается один раз и пишется во все фиды, куда он отобран.
         """
-        offer_counts: dict = defaultdict(int)
-        all_offers = {}
-        for filename in self.filenames:
-            root = self._get_root(filename, self.new_feeds_folder)
-            for offer in root.findall('.//offer'):
-                offer_id = offer.get('id')
-                if offer_id:
-                    offer_counts[offer_id] += 1
-                    all_offers[offer_id] = offer
-        return offer_counts, all_offers
+        filled = masks.any(axis=0).tolist()
+        prefix, suffix = index.split_skeleton()
+        for output, has_offers in zip(outputs, filled):
+            if has_offers:
+                output.write(prefix)
+            else:
+                write_xml(index.skeleton, output, compact=self.compact)
+        selected = np.flatnonzero(masks.any(axis=1))
+        offer_ids = index.presence.ids
+        for row, flags in zip(selected.tolist(), masks[selected].tolist()):
+            fragment = index.fragment(offer_ids[row])
+            for output, flag in zip(outputs, flags):
+                if flag:
+                    output.write(fragment)
+        for output, has_offers in zip(outputs, filled):
+            if has_offers:
+                output.write(suffix)
 
     @time_of_function
     @try_except
-    def join_feeds(self, join_type: str = 'inner') -> bool:
+    def join_feeds(self, *join_types: 'str | RegionJoin') -> bool:
         """
         Универсальный метод для объединения фидов.
+        Фиды читаются один раз (см. OfferJoinIndex), все запрошенные
+        объединения пишутся одновременно, каждое в файл
+        {имя типа}_join_feed.xml.
 
         Args:
-            join_type: 'inner' или 'full_outer'
-        """
-        if not self._cached_offers:
-            self._cached_offers = self._collect_all_offers()
-
-        offer_counts, all_offers = self._cached_offers
-        root, offers = self._super_feed()
-        if join_type == 'inner':
-            for offer_id, count in offer_counts.items():
-                if count == len(self.filenames):
-                    offers.append(all_offers[offer_id])
-            filename = 'inner_join_feed.xml'
-        elif join_type == 'full_outer':
-            for offer in all_offers.values():
-                offers.append(offer)
-            filename = 'full_outer_join_feed.xml'
-        else:
-            raise ValueError(f'Неизвестный тип join: {join_type}')
-
-        self._save_xml(root, self.join_feeds_folder, filename)
+            join_types: 'inner', 'full_outer' или RegionJoin
+                (см. at_least, left_join, regions_join),
+                по умолчанию 'inner'
+        """
+        join_types = join_types or ('inner',)
+        index = self._get_join_index()
+        masks = np.column_stack([
+            index.presence.mask(join_type) for join_type in join_types
+        ])
+        names = [
+            join_type.name if isinstance(join_type, RegionJoin)
+            else join_type
+            for join_type in join_types
+        ]
+
+        def publish(position: int, outputs: list) -> None:
+            if position == len(names):
+                self._write_joins(index, masks, outputs)
+                return
+            self._publish(
+                self.join_feeds_folder,
+                JOIN_FILENAME.format(names[position]),
+                lambda output: publish(position + 1, outputs + [output])
+            )
+
+        publish(0, [])
         return True
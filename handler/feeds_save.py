@@ -1,11 +1,20 @@
+import hashlib
 import logging
+import os
 import re
+import threading
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
 
 import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 
-from handler.constants import FEEDS_FOLDER
+from handler.constants import (ACCEPT_ENCODING, DOWNLOAD_CHUNK_SIZE,
+                               FEEDS_FOLDER, FEEDS_META_FILENAME, MAX_WORKERS,
+                               STORAGE_COMPRESSION)
 from handler.decorators import retry_on_network_error, time_of_function
 from handler.exceptions import (EmptyFeedsListError, EmptyXMLError,
                                 InvalidXMLError)
@@ -18,6 +27,125 @@ setup_logging()
 logger = logging.getLogger(__name__)
 
 
+class _NullTarget:
+    """
+    Пустой обработчик событий парсера: проверяет корректность
+    XML, не строя дерево в памяти.
+    """
+
+    def start(self, tag, attrib):
+        pass
+
+    def end(self, tag):
+        pass
+
+    def data(self, data):
+        pass
+
+    def close(self):
+        return None
+
+
+class _PartialDownload:
+    """
+    Состояние загрузки фида во временный файл.
+    Переживает повторные попытки: хранит число принятых байт,
+    sha256 и состояние парсера, чтобы докачать только хвост.
+    Файл открывается через opener, что позволяет писать его сжатым.
+    """
+
+    def __init__(self, path: Path, opener=open) -> None:
+        self.path = path
+        self.opener = opener
+        self.reset()
+
+    def reset(self) -> None:
+        """Сбрасывает принятые данные для загрузки с нуля."""
+        self.size = 0
+        self.etag = None
+        self.last_modified = None
+        self.total = None
+        self.resumable = False
+        self._digest = hashlib.sha256()
+        self._parser = ET.XMLParser(target=_NullTarget())
+        self._has_content = False
+        self.path.unlink(missing_ok=True)
+
+    @property
+    def validator(self) -> str | None:
+        """Валидатор для If-Range: сильный ETag или Last-Modified."""
+        if self.etag and not self.etag.startswith('W/'):
+            return self.etag
+        return self.last_modified
+
+    def start(self, response) -> None:
+        """Начинает загрузку с нуля по полному ответу 200."""
+        self.reset()
+        headers = response.headers
+        self.etag = headers.get('ETag')
+        self.last_modified = headers.get('Last-Modified')
+        length = headers.get('Content-Length')
+        self.total = int(length) if length and length.isdigit() else None
+        self.resumable = all((
+            headers.get('Accept-Ranges') != 'none',
+            not headers.get('Content-Encoding'),
+            self.validator is not None
+        ))
+
+    def range_headers(self) -> dict:
+        """Заголовки запроса недостающего хвоста."""
+        if not self.size or not self.resumable:
+            return {}
+        return {'Range': f'bytes={self.size}-', 'If-Range': self.validator}
+
+    def accepts(self, response) -> bool:
+        """Проверяет, что ответ 206 продолжает уже принятые байты."""
+        match = re.fullmatch(
+            r'bytes (\d+)-\d+/(\d+|\*)',
+            response.headers.get('Content-Range', '')
+        )
+        if not match or int(match.group(1)) != self.size:
+            return False
+        total = match.group(2)
+        if self.total is not None and total != '*':
+            if int(total) != self.total:
+                return False
+        etag = response.headers.get('ETag')
+        return not (self.etag and etag and etag != self.etag)
+
+    def consume(self, response) -> None:
+        """
+        Дописывает тело ответа в файл блоками, обновляя хэш
+        и проверяя XML по мере поступления данных.
+        """
+        try:
+            with self.opener(self.path, 'ab') as file:
+                for chunk in response.iter_content(
+                    chunk_size=DOWNLOAD_CHUNK_SIZE
+                ):
+                    if not chunk:
+                        continue
+                    file.write(chunk)
+                    self.size += len(chunk)
+                    self._digest.update(chunk)
+                    if not self._has_content and chunk.strip():
+                        self._has_content = True
+                    if self._has_content:
+                        self._parser.feed(chunk)
+        except ET.ParseError as e:
+            raise InvalidXMLError(f'XML содержит синтаксические ошибки: {e}')
+
+    def finish(self) -> str:
+        """Завершает проверку XML и возвращает sha256 содержимого."""
+        if not self._has_content:
+            raise EmptyXMLError('XML пуст')
+        try:
+            self._parser.close()
+        except ET.ParseError as e:
+            raise InvalidXMLError(f'XML содержит синтаксические ошибки: {e}')
+        return self._digest.hexdigest()
+
+
 class FeedSaver(FileMixin):
     """
     Класс, предоставляющий интерфейс для скачивания,
@@ -28,29 +156,123 @@ class FeedSaver(FileMixin):
     def __init__(
         self,
         feeds_list: tuple[str, ...] = FEEDS,
-        feeds_folder: str = FEEDS_FOLDER
+        feeds_folder: str = FEEDS_FOLDER,
+        max_workers: int = MAX_WORKERS,
+        reindent: bool = False,
+        compression: str = STORAGE_COMPRESSION
     ) -> None:
         if not feeds_list:
             logging.error('Не передан список фидов.')
             raise EmptyFeedsListError('Список фидов пуст.')
+        self._check_compression(compression)
 
         self.feeds_list = feeds_list
         self.feeds_folder = feeds_folder
+        self.max_workers = max_workers
+        self.reindent = reindent
+        self.compression = compression
+        self.changed_feeds: set[str] = set()
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._feeds_meta: dict = {}
+        self._meta_lock = threading.Lock()
 
     def __repr__(self):
         return (
             f"FeedSaver(feeds_folder='{self.feeds_folder}', "
-            f"feeds_list='{self.feeds_list}'), "
+            f"feeds_list='{self.feeds_list}', "
+            f"max_workers={self.max_workers}, "
+            f"reindent={self.reindent}, "
+            f"compression='{self.compression}'), "
+        )
+
+    @property
+    def session(self) -> requests.Session:
+        """
+        Ленивая инициализация сессии с пулом соединений,
+        общей для всех потоков загрузки. Сессия создается под
+        блокировкой, чтобы потоки не создали несколько сессий.
+        """
+        if self._session is not None:
+            return self._session
+        with self._session_lock:
+            if self._session is None:
+                pool_size = max(self.max_workers, 1)
+                adapter = HTTPAdapter(
+                    pool_connections=pool_size,
+                    pool_maxsize=pool_size
+                )
+                session = requests.Session()
+                session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._session = session
+            return self._session
+
+    def _close_session(self) -> None:
+        """Защищенный метод, закрывает сессию и ее пул соединений."""
+        with self._session_lock:
+            session, self._session = self._session, None
+        if session is not None:
+            session.close()
+
+    def _request(self, feed: str, headers: dict | None = None):
+        """Защищенный метод, выполняет потоковый GET-запрос фида."""
+        return self.session.get(
+            feed,
+            headers=headers or {},
+            stream=True,
+            timeout=(10, 60)
         )
 
     @retry_on_network_error(max_attempts=3, delays=(2, 5, 10))
-    def _get_file(self, feed: str):
-        """Защищенный метод, получает фид по ссылке."""
+    def _get_file(
+        self,
+        feed: str,
+        download: _PartialDownload,
+        headers: dict | None = None
+    ):
+        """
+        Защищенный метод, скачивает фид по ссылке во временный файл.
+        После обрыва повторная попытка запрашивает через Range только
+        недостающий хвост; если сервер не продолжил загрузку, фид
+        скачивается заново. Ответ 304 возвращается как есть.
+        При ошибке ответ закрывается, иначе его закрывает вызывающий.
+        """
+        response = None
         try:
-            response = requests.get(feed, stream=True, timeout=(10, 60))
+            range_headers = download.range_headers()
+            response = self._request(
+                feed,
+                {**(headers or {}), **range_headers}
+            )
+            resumed = all((
+                range_headers,
+                response.status_code == requests.codes.partial_content,
+                download.accepts(response)
+            ))
+            if range_headers and not resumed and response.status_code in (
+                requests.codes.partial_content,
+                requests.codes.requested_range_not_satisfiable
+            ):
+                logging.warning(
+                    'Сервер не продолжил загрузку %s, скачивание заново',
+                    feed
+                )
+                response.close()
+                download.reset()
+                response = self._request(feed, headers)
 
-            if response.status_code == requests.codes.ok:
+            if response.status_code == requests.codes.not_modified:
                 return response
+            if resumed:
+                logging.info(
+                    'Докачка %s с %s байта',
+                    feed,
+                    download.size
+                )
+            elif response.status_code == requests.codes.ok:
+                download.start(response)
             else:
                 logging.error(
                     'HTTP ошибка %s при загрузке %s',
@@ -60,25 +282,59 @@ class FeedSaver(FileMixin):
                 raise requests.exceptions.HTTPError(
                     f'HTTP {response.status_code} для {feed}'
                 )
+            download.consume(response)
+            return response
 
-        except requests.RequestException as error:
-            logging.error('Ошибка при загрузке %s: %s', feed, error)
+        except Exception as error:
+            if response is not None:
+                response.close()
+            if isinstance(error, requests.RequestException):
+                logging.error('Ошибка при загрузке %s: %s', feed, error)
             raise
 
+    def _conditional_headers(self, file_name: str, file_path: Path) -> dict:
+        """
+        Защищенный метод, формирует заголовки условного запроса
+        по сохраненным ETag и Last-Modified фида.
+        """
+        meta = self._feeds_meta.get(file_name)
+        if not meta or not file_path.exists():
+            return {}
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def _update_meta(
+        self,
+        file_name: str,
+        download: _PartialDownload,
+        content_hash: str
+    ) -> None:
+        """Защищенный метод, запоминает метаданные скачанного фида."""
+        with self._meta_lock:
+            self._feeds_meta[file_name] = {
+                'etag': download.etag,
+                'last_modified': download.last_modified,
+                'sha256': content_hash
+            }
+
+    def _mark_changed(self, file_name: str) -> None:
+        """Защищенный метод, отмечает фид как измененный."""
+        with self._meta_lock:
+            self.changed_feeds.add(file_name)
+
     def _get_filename(self, feed: str) -> str:
         """Защищенный метод, формирующий имя xml-файлу."""
         return feed.split('/')[-1]
 
-    def _validate_xml(self, xml_content: bytes):
-        """
-        Валидирует XML.
-        Возвращает декодированное содержимое и кодировку.
-        """
-        if not xml_content.strip():
-            raise EmptyXMLError('XML пуст')
+    def _detect_encoding(self, head: bytes) -> str:
+        """Защищенный метод, определяет кодировку по XML-декларации."""
         encoding = 'utf-8'
         try:
-            declaration = xml_content[:100].decode('ascii', errors='ignore')
+            declaration = head.decode('ascii', errors='ignore')
             if 'encoding=' in declaration:
                 match = re.search(r'encoding=[\'"]([^\'"]+)[\'"]', declaration)
                 if match:
@@ -88,55 +344,135 @@ class FeedSaver(FileMixin):
                 'Не удалось определить кодировку из декларации: %s',
                 error
             )
+        return encoding
+
+    def _reindent_file(self, temp_path: Path) -> None:
+        """
+        Защищенный метод, переформатирует скачанный фид с отступами.
+        Требует памяти на все дерево, поэтому включается опционально.
+        """
+        with self._open_file(temp_path) as file:
+            declaration = file.read(100)
+            file.seek(0)
+            tree = ET.parse(file)
+        encoding = self._detect_encoding(declaration)
+        self._indent(tree.getroot())
+        with self._open_file(temp_path, 'wb', self.compression) as file:
+            tree.write(file, encoding=encoding, xml_declaration=True)
+
+    def _save_feed(self, feed: str, folder_path: Path) -> bool:
+        """
+        Защищенный метод, скачивает, валидирует и сохраняет один фид.
+        Возвращает True, если файл записан. Ответ закрывается
+        в любом случае, чтобы соединение вернулось в пул сессии.
+        """
+        file_name = self._get_filename(feed)
+        file_path = folder_path / file_name
+        temp_path = self._meta_path(self.feeds_folder, f'{file_name}.part')
+        download = _PartialDownload(
+            temp_path,
+            partial(self._open_file, compression=self.compression)
+        )
+        response = None
         try:
-            decoded_content = xml_content.decode(encoding)
-        except UnicodeDecodeError:
-            try:
-                decoded_content = xml_content.decode('utf-8')
-                encoding = 'utf-8'
-            except UnicodeDecodeError:
-                raise InvalidXMLError('Не удалось декодировать XML')
-        try:
-            ET.fromstring(decoded_content)
-        except ET.ParseError as e:
-            raise InvalidXMLError(f'XML содержит синтаксические ошибки: {e}')
-        return decoded_content, encoding
+            response = self._get_file(
+                feed,
+                download,
+                self._conditional_headers(file_name, file_path)
+            )
+            if response.status_code == requests.codes.not_modified:
+                logging.info(
+                    'Фид %s не изменился, используется локальный файл',
+                    file_name
+                )
+                return True
+            content_hash = download.finish()
+            previous_hash = self._feeds_meta.get(file_name, {}).get('sha256')
+            if file_path.exists() and previous_hash == content_hash:
+                self._update_meta(file_name, download, content_hash)
+                logging.info(
+                    'Содержимое фида %s не изменилось, файл не перезаписан',
+                    file_name
+                )
+                return True
+            if self.reindent:
+                self._reindent_file(temp_path)
+            os.replace(temp_path, file_path)
+            self._update_meta(file_name, download, content_hash)
+            self._mark_changed(file_name)
+            logging.info(f'Файл {file_name} успешно сохранен')
+            return True
+        except requests.exceptions.RequestException as error:
+            logging.warning('Фид %s не получен: %s', file_name, error)
+            return False
+        except (EmptyXMLError, InvalidXMLError) as error:
+            logging.error('Ошибка валидации XML %s: %s', file_name, error)
+            return False
+        except Exception as error:
+            logging.error(
+                'Ошибка обработки файла %s: %s',
+                file_name,
+                error
+            )
+            raise
+        finally:
+            if response is not None:
+                response.close()
+            temp_path.unlink(missing_ok=True)
 
     @time_of_function
     def save_xml(self) -> None:
-        """Метод, сохраняющий фиды в xml-файлы"""
+        """
+        Метод, сохраняющий фиды в xml-файлы.
+        При max_workers > 1 фиды скачиваются параллельно
+        в пуле потоков с общей сессией.
+        Неизменившиеся фиды (304 или тот же хэш) не перезаписываются,
+        имена действительно обновленных файлов - в changed_feeds.
+        Новые ETag и хэши сохраняются только в commit, после успешной
+        обработки: иначе фиды, не дошедшие до изображений и видео,
+        в следующем запуске считались бы неизменившимися.
+        """
         total_files: int = len(self.feeds_list)
-        saved_files = 0
         folder_path = self._make_dir(self.feeds_folder)
-        for feed in self.feeds_list:
-            file_name = self._get_filename(feed)
-            file_path = folder_path / file_name
-            try:
-                response = self._get_file(feed)
-                xml_content = response.content
-                decoded_content, encoding = self._validate_xml(xml_content)
-                xml_tree = ET.fromstring(decoded_content)
-                self._indent(xml_tree)
-                tree = ET.ElementTree(xml_tree)
-                with open(file_path, 'wb') as file:
-                    tree.write(file, encoding=encoding, xml_declaration=True)
-                saved_files += 1
-                logging.info(f'Файл {file_name} успешно сохранен')
-            except requests.exceptions.RequestException as error:
-                logging.warning('Фид %s не получен: %s', file_name, error)
-                continue
-            except (EmptyXMLError, InvalidXMLError) as error:
-                logging.error('Ошибка валидации XML %s: %s', file_name, error)
-                continue
-            except Exception as error:
-                logging.error(
-                    'Ошибка обработки файла %s: %s',
-                    file_name,
-                    error
-                )
-                raise
+        self.changed_feeds = set()
+        self._feeds_meta = self._read_meta(
+            self.feeds_folder,
+            FEEDS_META_FILENAME
+        )
+        workers = min(self.max_workers, total_files)
+        try:
+            if workers > 1:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    results = list(executor.map(
+                        lambda feed: self._save_feed(feed, folder_path),
+                        self.feeds_list
+                    ))
+            else:
+                results = [
+                    self._save_feed(feed, folder_path)
+                    for feed in self.feeds_list
+                ]
+        finally:
+            self._close_session()
+        saved_files = sum(results)
         logger.bot_event(
             'Успешно записано %s файлов из %s.',
             saved_files,
             total_files
         )
+        logging.info(
+            'Изменились фиды: %s из %s',
+            len(self.changed_feeds),
+            total_files
+        )
+
+    def commit(self) -> None:
+        """
+        Сохраняет ETag, Last-Modified и хэши фидов последнего save_xml.
+        Вызывается после успешного завершения всех этапов.
+        """
+        self._write_meta(
+            self.feeds_folder,
+            FEEDS_META_FILENAME,
+            self._feeds_meta
+        )
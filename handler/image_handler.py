@@ -7,11 +7,12 @@ from PIL import Image
 
 from handler.constants import (FEEDS_FOLDER, FRAME_FOLDER, IMAGE_FOLDER,
                                NAME_OF_FRAME, NEW_IMAGE_FOLDER,
-                               RGB_COLOR_SETTINGS)
+                               OFFER_SNAPSHOTS, RGB_COLOR_SETTINGS)
 from handler.decorators import time_of_function
 from handler.exceptions import DirectoryCreationError, EmptyFeedsListError
 from handler.logging_config import setup_logging
 from handler.mixins import FileMixin
+from handler.offer_delta import OfferDelta
 
 setup_logging()
 logger = logging.getLogger(__name__)
@@ -30,7 +31,9 @@ class FeedImage(FileMixin):
         feeds_folder: str = FEEDS_FOLDER,
         image_folder: str = IMAGE_FOLDER,
         frame_folder: str = FRAME_FOLDER,
-        new_image_folder: str = NEW_IMAGE_FOLDER
+        new_image_folder: str = NEW_IMAGE_FOLDER,
+        deltas: dict[str, OfferDelta] | None = None,
+        snapshots: bool = OFFER_SNAPSHOTS
     ) -> None:
         self.filenames = filenames
         self.images = images
@@ -38,6 +41,9 @@ class FeedImage(FileMixin):
         self.image_folder = image_folder
         self.frame_folder = frame_folder
         self.new_image_folder = new_image_folder
+        self.deltas = deltas
+        self.snapshots = snapshots
+        self.refreshed_offers: set[str] = set()
         self._existing_image_offers: set[str] = set()
         self._existing_framed_offers: set[str] = set()
 
@@ -88,28 +94,80 @@ class FeedImage(FileMixin):
         image_data: bytes,
         folder_path: Path,
         image_filename: str
-    ):
-        """Защищенный метод, сохраняет изображение по указанному пути."""
-        if not image_data:
-            return
+    ) -> bool:
+        """
+        Защищенный метод, сохраняет изображение по указанному пути.
+        Возвращает True, если изображение записано.
+        """
+        if not image_data or not image_filename:
+            return False
         try:
             file_path = folder_path / image_filename
             with open(file_path, 'wb') as f:
                 f.write(image_data)
             logging.debug('Изображение сохранено: %s', file_path)
+            return True
         except Exception as error:
             logging.error(
                 'Ошибка при сохранении %s: %s',
                 image_filename,
                 error
             )
+            return False
+
+    def _image_fields(self, filename: str) -> list[tuple]:
+        """
+        Защищенный метод, возвращает пары (id, picture) офферов фида
+        в порядке документа из колоночного снимка или индекса.
+        """
+        if self.snapshots:
+            columns = self._get_snapshot(filename, self.feeds_folder).columns
+            return list(zip(
+                columns['offer_id'].tolist(),
+                columns['picture'].tolist()
+            ))
+        return [
+            (offer.offer_id, offer.picture)
+            for offer in self._get_offer_index(filename, self.feeds_folder)
+        ]
+
+    def _pending_offers(self, filename: str, offers: list) -> tuple:
+        """
+        Защищенный метод, возвращает пары (id, picture) офферов фида,
+        которые нужно обработать, и множество офферов, чьи изображения
+        нужно скачать заново. Без изменений офферов (deltas)
+        обрабатываются все офферы. С изменениями - только добавленные,
+        офферы со сменившейся ссылкой на изображение (их изображение
+        обновляется) и офферы без скачанного изображения.
+        """
+        delta = (self.deltas or {}).get(filename)
+        if delta is None:
+            return set(), offers
+        first: dict = {}
+        for offer_id, picture in offers:
+            first.setdefault(offer_id, picture)
+        refresh = delta.changed_in('picture')
+        pending = delta.added | refresh | (
+            first.keys() - self._existing_image_offers
+        )
+        return refresh, [
+            (offer_id, picture) for offer_id, picture in first.items()
+            if offer_id in pending
+        ]
 
     @time_of_function
     def get_images(self):
-        """Метод получения и сохранения изображений из xml-файла."""
+        """
+        Метод получения и сохранения изображений из xml-файла.
+        Оффер считается обновленным (refreshed_offers), только если
+        его изображение сохранено. Для офферов, чье изображение
+        не удалось скачать, в отпечатках остается прошлое состояние
+        (см. OfferDelta.hold), и следующий запуск повторит загрузку.
+        """
         total_offers_processed = 0
         offers_with_images = 0
         images_downloaded = 0
+        images_failed = 0
         offers_skipped_existing = 0
 
         try:
@@ -123,28 +181,28 @@ class FeedImage(FileMixin):
             )
         try:
             for filename in self.filenames:
-                root = self._get_root(filename, self.feeds_folder)
-                offers = root.findall('.//offer')
+                offers = self._image_fields(filename)
 
                 if not offers:
                     logging.debug('В файле %s не найдено offers', filename)
                     return
 
-                for offer in offers:
-                    offer_id = str(offer.get('id'))
+                refresh, offers = self._pending_offers(filename, offers)
+                self._release_feed(filename, self.feeds_folder)
+                failed = set()
+                for offer_id, offer_image in offers:
+                    offer_id = str(offer_id)
                     total_offers_processed += 1
 
-                    picture = offer.find('picture')
-                    if picture is None:
-                        continue
-
-                    offer_image = picture.text
                     if not offer_image:
                         continue
 
                     offers_with_images += 1
 
-                    if offer_id in self._existing_image_offers:
+                    if all((
+                        offer_id in self._existing_image_offers,
+                        offer_id not in refresh
+                    )):
                         offers_skipped_existing += 1
                         continue
 
@@ -157,22 +215,31 @@ class FeedImage(FileMixin):
                         image_format
                     )
                     folder_path = self._make_dir(self.image_folder)
-                    self._save_image(
+                    if not self._save_image(
                         image_data,
                         folder_path,
                         image_filename
-                    )
+                    ):
+                        images_failed += 1
+                        failed.add(offer_id)
+                        continue
                     images_downloaded += 1
+                    if offer_id in refresh:
+                        self.refreshed_offers.add(offer_id)
+                if failed and filename in (self.deltas or {}):
+                    self.deltas[filename].hold(failed)
             logging.info(
                 '\nВсего обработано фидов - %s'
                 '\nВсего обработано офферов - %s'
                 '\nВсего офферов с подходящими изображениями - %s'
                 '\nВсего изображений скачано - %s'
+                '\nНе удалось скачать изображений - %s'
                 '\nПропущено офферов с уже скачанными изображениями - %s',
                 len(self.filenames),
                 total_offers_processed,
                 offers_with_images,
                 images_downloaded,
+                images_failed,
                 offers_skipped_existing
             )
         except Exception as error:
@@ -201,6 +268,7 @@ class FeedImage(FileMixin):
                 'Директория с форматированными изображениями отсутствует. '
                 'Первый запуск'
             )
+        self._existing_framed_offers -= self.refreshed_offers
         try:
             frame = Image.open(frame_path / NAME_OF_FRAME)
         except Exception as error:
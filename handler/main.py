@@ -1,18 +1,19 @@
 import logging
 
 # from handler.constants import CUSTOM_LABEL, UNAVAILABLE_OFFER_ID_LIST
-from handler.constants import (AUCTION_PREFIX, FEEDS_FOLDER, IMAGE_FOLDER,
-                               NEW_FEEDS_FOLDER, NEW_PREFIX, PARAM_FOR_DELETE,
-                               TAGS_FOR_DELETE)
+from handler.constants import FEEDS_FOLDER, IMAGE_FOLDER, NEW_FEEDS_FOLDER
+from handler.db_pool import DB_POOL
 from handler.decorators import time_of_script
+from handler.feed_registry import FEED_REGISTRY
 from handler.feeds_handler import FeedHandler
 from handler.feeds_report import FeedReport
 from handler.feeds_save import FeedSaver
 from handler.image_handler import FeedImage
 from handler.logging_config import setup_logging
+from handler.offer_delta import OfferDeltaTracker
 from handler.reports_db import ReportDataBase
-from handler.utils import get_filenames_list, save_to_database
-from handler.vendor_category_dict import VENDOR_CATEGORY
+from handler.utils import (filter_auction_feed, get_filenames_list,
+                           process_feed, run_per_feed, save_to_database)
 from handler.video_create import VideoCreater
 
 setup_logging()
@@ -20,13 +21,17 @@ setup_logging()
 
 @time_of_script
 def main():
+    FeedHandler.clear_files_cache()
     saver = FeedSaver()
     db_client = ReportDataBase()
     saver.save_xml()
     filenames = get_filenames_list(FEEDS_FOLDER)
+    delta_tracker = OfferDeltaTracker(filenames)
+    deltas = delta_tracker.compute_all()
     report_client = FeedReport(filenames)
-    data = report_client.get_offers_report()
+    data = report_client.get_offers_report(deltas)
     save_to_database(db_client, data)
+    DB_POOL.close_all()
 
     if not filenames:
         logging.error('Директория %s пуста', FEEDS_FOLDER)
@@ -34,7 +39,7 @@ def main():
             f'Директория {FEEDS_FOLDER} не содержит файлов'
         )
 
-    image_client = FeedImage(filenames, images=[])
+    image_client = FeedImage(filenames, images=[], deltas=deltas)
     image_client.get_images()
     images = get_filenames_list(IMAGE_FOLDER)
 
@@ -45,31 +50,25 @@ def main():
         )
     image_client.images = images
     image_client.add_frame()
-    video_client = VideoCreater(filenames)
+    video_client = VideoCreater(
+        filenames,
+        refreshed_offers=image_client.refreshed_offers
+    )
     video_client.create_videos()
 
-    for filename in filenames:
-        handler_client = FeedHandler(filename)
-        (
-            handler_client
-            .delete_tags(TAGS_FOR_DELETE)
-            .delete_param(PARAM_FOR_DELETE)
-            # .replace_images()
-            .add_video()
-            .save(prefix=NEW_PREFIX)
-        )
+    run_per_feed(process_feed, filenames)
+    FEED_REGISTRY.clear()
     new_filenames = get_filenames_list(NEW_FEEDS_FOLDER)
     report_client.filenames = new_filenames
-    report_client.join_feeds('full_outer')
-    report_client.join_feeds('inner')
+    try:
+        report_client.join_feeds('full_outer', 'inner')
+    finally:
+        report_client.close_join_index()
 
-    for filename in new_filenames:
-        handler = FeedHandler(filename, feeds_folder=NEW_FEEDS_FOLDER)
-        (
-            handler
-            .remove_non_matching_offers(VENDOR_CATEGORY)
-            .save(prefix=AUCTION_PREFIX)
-        )
+    run_per_feed(filter_auction_feed, new_filenames)
+    FEED_REGISTRY.clear()
+    delta_tracker.commit()
+    saver.commit()
 
 
 if __name__ == '__main__':
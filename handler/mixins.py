@@ -1,13 +1,50 @@
+import gzip
+import hashlib
+import json
 import logging
+import lzma
+import os
 import xml.etree.ElementTree as ET
 from pathlib import Path
+from typing import Callable, TextIO
 
+from handler.constants import (GZIP_COMPRESSION_LEVEL, LZMA_COMPRESSION_PRESET,
+                               META_FOLDER, SNAPSHOTS_FOLDER, XML_BACKEND)
 from handler.exceptions import (DirectoryCreationError, EmptyFeedsListError,
                                 GetTreeError)
+from handler.feed_registry import FEED_REGISTRY
 from handler.logging_config import setup_logging
+from handler.offer_index import OfferIndex
+from handler.offer_snapshot import OfferSnapshot
+from handler.xml_backend import parse_xml
+from handler.xml_writer import serialize_xml, write_xml
 
 setup_logging()
 
+GZIP_MAGIC = b'\x1f\x8b'
+"""Сигнатура gzip-файла."""
+
+LZMA_MAGIC = b'\xfd7zXZ\x00'
+"""Сигнатура xz-файла."""
+
+COMPRESSIONS = ('gzip', 'lzma')
+"""Поддерживаемые форматы сжатия фидов на диске."""
+
+
+class _HashingWriter:
+    """Обертка над текстовым файлом, считающая sha256 записанного."""
+
+    def __init__(self, file: TextIO) -> None:
+        self.file = file
+        self._hash = hashlib.sha256()
+
+    def write(self, text: str) -> int:
+        self._hash.update(text.encode('utf-8'))
+        return self.file.write(text)
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
 
 class FileMixin:
     """
@@ -16,20 +53,141 @@ class FileMixin:
     - _get_filenames_list - Получение имен для XML-файлов списком.
     - _make_dir - Создает директорию и возвращает путь до нее.
     - _get_tree - Получает дерево XML-файла.
+    - _get_offer_index - Получает индекс офферов фида.
+    - _get_snapshot - Получает колоночный снимок офферов фида.
+    - _read_meta / _write_meta - Читает и пишет служебные json-файлы.
+    - _open_file - Открывает файл фида с учетом сжатия.
+    - _publish - Атомарно публикует файл, если изменилось содержимое.
+    - _split_skeleton - Разрезает каркас фида на части до и после офферов.
     """
 
-    def _save_xml(self, elem, file_folder, filename) -> None:
-        """Защищенный метод, сохраняет отформатированные файлы."""
-        root = elem
-        self._indent(root)
-        formatted_xml = ET.tostring(root, encoding='unicode')
-        file_path = self._make_dir(file_folder)
-        with open(
-            file_path / filename,
-            'w',
-            encoding='utf-8'
-        ) as f:
-            f.write(formatted_xml)
+    xml_backend: str = XML_BACKEND
+
+    def _check_compression(self, compression: str | None) -> None:
+        """Защищенный метод, проверяет название формата сжатия."""
+        if compression and compression not in COMPRESSIONS:
+            raise ValueError(
+                f'Неизвестный формат сжатия: {compression}. '
+                f'Допустимые: {", ".join(COMPRESSIONS)}'
+            )
+
+    def _open_file(
+        self,
+        file_path: Path,
+        mode: str = 'rb',
+        compression: str | None = None,
+        **kwargs
+    ):
+        """
+        Защищенный метод, открывает файл фида.
+        При чтении сжатие определяется по сигнатуре файла,
+        при записи используется переданный формат compression.
+        """
+        if 'r' in mode:
+            with open(file_path, 'rb') as f:
+                magic = f.read(len(LZMA_MAGIC))
+            if magic.startswith(GZIP_MAGIC):
+                compression = 'gzip'
+            elif magic.startswith(LZMA_MAGIC):
+                compression = 'lzma'
+            else:
+                compression = None
+        else:
+            self._check_compression(compression)
+        if 'b' not in mode and 't' not in mode and compression:
+            mode += 't'
+        if compression == 'gzip':
+            if 'r' not in mode:
+                kwargs['compresslevel'] = GZIP_COMPRESSION_LEVEL
+            return gzip.open(file_path, mode, **kwargs)
+        if compression == 'lzma':
+            if 'r' not in mode:
+                kwargs['preset'] = LZMA_COMPRESSION_PRESET
+            return lzma.open(file_path, mode, **kwargs)
+        return open(file_path, mode, **kwargs)
+
+    def _save_xml(
+        self,
+        elem,
+        file_folder,
+        filename,
+        compression: str | None = None,
+        compact: bool = False
+    ) -> bool:
+        """
+        Защищенный метод, сохраняет отформатированные файлы.
+        Элемент пишется в файл потоково, дерево не изменяется.
+        Возвращает False, если содержимое файла не изменилось.
+        """
+        return self._publish(
+            file_folder,
+            filename,
+            lambda f: write_xml(elem, f, compact=compact),
+            compression
+        )
+
+    def _publish(
+        self,
+        file_folder: str,
+        filename: str,
+        writer: Callable[[TextIO], None],
+        compression: str | None = None
+    ) -> bool:
+        """
+        Защищенный метод, публикует файл, только если он изменился.
+        writer пишет содержимое во временный файл, по ходу записи
+        считается sha256. Если хэш и формат сжатия совпадают с
+        манифестом прошлой публикации, файл и его mtime не трогаются.
+        Иначе временный файл атомарно заменяет опубликованный.
+        Возвращает True, если файл был заменен.
+        """
+        target_path = self._make_dir(file_folder) / filename
+        temp_path = self._meta_path(file_folder, f'{filename}.tmp')
+        meta_name = f'{filename}.json'
+        try:
+            with self._open_file(
+                temp_path,
+                'w',
+                compression,
+                encoding='utf-8'
+            ) as f:
+                output = _HashingWriter(f)
+                writer(output)
+            manifest = {
+                'sha256': output.hexdigest(),
+                'compression': compression or None
+            }
+            if all((
+                target_path.exists(),
+                self._read_meta(file_folder, meta_name) == manifest
+            )):
+                logging.info(
+                    'Файл %s не изменился, публикация пропущена',
+                    filename
+                )
+                return False
+            os.replace(temp_path, target_path)
+            self._write_meta(file_folder, meta_name, manifest)
+            return True
+        finally:
+            temp_path.unlink(missing_ok=True)
+
+    def _split_skeleton(
+        self,
+        skeleton,
+        sentinel,
+        level: int,
+        compact: bool = False
+    ) -> tuple[str, str]:
+        """
+        Защищенный метод, сериализует каркас фида и разрезает его
+        по метке (на уровне вложенности level) на части
+        до офферов и после них.
+        """
+        text = serialize_xml(skeleton, compact=compact)
+        marker = serialize_xml(sentinel, level, compact)
+        index = text.index(marker)
+        return text[:index], text[index + len(marker):]
 
     def _indent(self, elem, level=0) -> None:
         """Защищенный метод, расставляет правильные отступы в XML файлах."""
@@ -58,15 +216,125 @@ class FileMixin:
             logging.error('Не удалось создать директорию по причине %s', error)
             raise DirectoryCreationError('Ошибка создания директории.')
 
+    def _meta_path(self, folder_name: str, meta_name: str) -> Path:
+        """
+        Защищенный метод, возвращает путь к служебному файлу
+        в скрытой поддиректории переданной директории.
+        """
+        return self._make_dir(f'{folder_name}/{META_FOLDER}') / meta_name
+
+    def _read_meta(self, folder_name: str, meta_name: str) -> dict:
+        """Защищенный метод, читает служебный json-файл."""
+        meta_path = self._meta_path(folder_name, meta_name)
+        if not meta_path.exists():
+            return {}
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as error:
+            logging.warning(
+                'Служебный файл %s поврежден и будет пересоздан: %s',
+                meta_path,
+                error
+            )
+            return {}
+
+    def _write_meta(
+        self,
+        folder_name: str,
+        meta_name: str,
+        data: dict
+    ) -> None:
+        """Защищенный метод, атомарно записывает служебный json-файл."""
+        meta_path = self._meta_path(folder_name, meta_name)
+        temp_path = meta_path.with_name(f'{meta_path.name}.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, meta_path)
+
+    def _get_path(self, file_name: str, folder_name: str) -> Path:
+        """Защищенный метод, возвращает путь к файлу в директории."""
+        return Path(__file__).parent.parent / folder_name / file_name
+
+    def _parse_file(self, file_path: Path) -> ET.Element:
+        """
+        Защищенный метод, разбирает XML-файл и возвращает корень.
+        Библиотека разбора задается атрибутом xml_backend.
+        """
+        with self._open_file(file_path) as f:
+            return parse_xml(f, self.xml_backend)
+
     def _get_root(self, file_name: str, folder_name: str) -> ET.Element:
-        """Защищенный метод, создает экземпляр класса Element."""
+        """
+        Защищенный метод, создает экземпляр класса Element.
+        Дерево берется из общего кэша фидов и не должно изменяться:
+        для изменения используйте _take_root.
+        """
+        try:
+            file_path = self._get_path(file_name, folder_name)
+            logging.debug(f'Путь к файлу: {file_path}')
+            return FEED_REGISTRY.get(file_path, self._parse_file)
+        except Exception as error:
+            logging.error(
+                'Не удалось получить дерево фида по причине %s',
+                error
+            )
+            raise GetTreeError('Ошибка получения дерева фида.')
+
+    def _get_offer_index(
+        self,
+        file_name: str,
+        folder_name: str
+    ) -> OfferIndex:
+        """
+        Защищенный метод, возвращает индекс офферов фида
+        из общего кэша (см. OfferIndex).
+        """
         try:
-            file_path = (
-                Path(__file__).parent.parent / folder_name / file_name
+            file_path = self._get_path(file_name, folder_name)
+            return FEED_REGISTRY.get_index(file_path, self._parse_file)
+        except Exception as error:
+            logging.error(
+                'Не удалось получить индекс офферов фида по причине %s',
+                error
+            )
+            raise GetTreeError('Ошибка получения дерева фида.')
+
+    def _get_snapshot(
+        self,
+        file_name: str,
+        folder_name: str
+    ) -> OfferSnapshot:
+        """
+        Защищенный метод, возвращает колоночный снимок офферов фида.
+        Снимок хранится в META_FOLDER/SNAPSHOTS_FOLDER директории
+        фида и строится заново, только если файл фида изменился.
+        """
+        file_path = self._get_path(file_name, folder_name)
+        stat = file_path.stat()
+        signature = [stat.st_mtime_ns, stat.st_size]
+        snapshot_folder = self._make_dir(
+            f'{folder_name}/{META_FOLDER}/{SNAPSHOTS_FOLDER}/{file_name}'
+        )
+        snapshot = OfferSnapshot.load(snapshot_folder, signature)
+        if snapshot is None:
+            snapshot = OfferSnapshot.from_index(
+                self._get_offer_index(file_name, folder_name),
+                self._get_root(file_name, folder_name)
             )
+            snapshot.save(snapshot_folder, signature)
+            logging.debug('Построен снимок офферов %s', file_name)
+        return snapshot
+
+    def _take_root(self, file_name: str, folder_name: str) -> ET.Element:
+        """
+        Защищенный метод, возвращает дерево фида во владение:
+        дерево вытесняется из общего кэша и может изменяться.
+        """
+        try:
+            file_path = self._get_path(file_name, folder_name)
             logging.debug(f'Путь к файлу: {file_path}')
-            tree = ET.parse(file_path)
-            return tree.getroot()
+            return FEED_REGISTRY.take(file_path, self._parse_file)
         except Exception as error:
             logging.error(
                 'Не удалось получить дерево фида по причине %s',
@@ -74,6 +342,13 @@ class FileMixin:
             )
             raise GetTreeError('Ошибка получения дерева фида.')
 
+    def _release_feed(self, file_name: str, folder_name: str) -> None:
+        """
+        Защищенный метод, вытесняет дерево фида из общего кэша.
+        Вызывается этапом, который закончил работу с фидом.
+        """
+        FEED_REGISTRY.evict(self._get_path(file_name, folder_name))
+
     def _get_files_list(self, folder_name: str) -> list:
         """
         Защищенный метод, возвращает список
@@ -0,0 +1,304 @@
+import hashlib
+import logging
+import uuid
+
+from handler.constants import FEEDS_FOLDER, OFFER_SNAPSHOTS
+from handler.logging_config import setup_logging
+from handler.mixins import FileMixin
+
+setup_logging()
+
+FINGERPRINTS_SUFFIX = '.offers.json'
+"""Суффикс служебного файла с отпечатками офферов фида."""
+
+REPORT_ROWS_SUFFIX = '.report.json'
+"""Суффикс служебного файла со строками отчета по фиду."""
+
+TRACKED_FIELDS = ('category_id', 'picture')
+"""Поля оффера (см. OfferRecord), которые хранятся вместе с отпечатком."""
+
+
+def offer_fingerprint(offer) -> str:
+    """
+    Возвращает отпечаток оффера - хэш его канонического XML.
+    Порядок атрибутов и пробелы вокруг текста не влияют на отпечаток.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    stack = [offer]
+    while stack:
+        elem = stack.pop()
+        if elem is None:
+            digest.update(b'>')
+            continue
+        digest.update(repr((
+            elem.tag,
+            sorted(elem.items()),
+            (elem.text or '').strip(),
+            (elem.tail or '').strip() if elem is not offer else ''
+        )).encode('utf-8'))
+        stack.append(None)
+        stack.extend(reversed(elem))
+    return digest.hexdigest()
+
+
+def categories_fingerprint(root) -> str:
+    """Возвращает отпечаток дерева категорий фида."""
+    digest = hashlib.blake2b(digest_size=16)
+    for category in root.iter('category'):
+        digest.update(repr((
+            category.get('id'),
+            category.get('parentId'),
+            category.text
+        )).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class OfferDelta:
+    """
+    Изменения офферов фида с прошлого успешного запуска.
+
+    added, removed, changed - множества offer_id. previous и current
+    хранят для измененных офферов записи [отпечаток, *TRACKED_FIELDS]
+    прошлого и текущего запуска. initial - прошлого состояния нет,
+    все офферы считаются добавленными. categories_changed - изменилось
+    дерево категорий. report_rows - строки отчета этого запуска
+    (см. FeedReport.get_offers_report), они записываются вместе
+    с отпечатками в OfferDeltaTracker.commit. base_commit - метка
+    сохранения, с отпечатками которого сравнивался фид. held - офферы,
+    обработку которых нужно повторить (см. hold).
+    """
+
+    def __init__(
+        self,
+        added: frozenset = frozenset(),
+        removed: frozenset = frozenset(),
+        changed: frozenset = frozenset(),
+        previous: dict | None = None,
+        current: dict | None = None,
+        initial: bool = False,
+        categories_changed: bool = False
+    ) -> None:
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+        self.previous = previous or {}
+        self.current = current or {}
+        self.initial = initial
+        self.categories_changed = categories_changed
+        self.report_rows: dict | None = None
+        self.base_commit: str | None = None
+        self.held: set[str] = set()
+
+    def __repr__(self):
+        return (
+            f'OfferDelta(added={len(self.added)}, '
+            f'removed={len(self.removed)}, '
+            f'changed={len(self.changed)}, initial={self.initial})'
+        )
+
+    def __bool__(self) -> bool:
+        return any((
+            self.added,
+            self.removed,
+            self.changed,
+            self.categories_changed
+        ))
+
+    @property
+    def touched(self) -> frozenset:
+        """Добавленные и измененные офферы."""
+        return self.added | self.changed
+
+    def _field(self, entry: list, field: str):
+        """Защищенный метод, возвращает поле из записи отпечатка."""
+        return entry[1 + TRACKED_FIELDS.index(field)]
+
+    def changed_in(self, field: str) -> frozenset:
+        """Измененные офферы, у которых изменилось поле field."""
+        return frozenset(
+            offer_id for offer_id in self.changed
+            if self._field(self.previous[offer_id], field) != self._field(
+                self.current[offer_id], field
+            )
+        )
+
+    def hold(self, offer_ids) -> None:
+        """
+        Не сохраняет новые отпечатки офферов offer_ids: в commit
+        для них остается прошлая запись, а добавленные офферы
+        не записываются. В следующем запуске эти офферы снова
+        окажутся добавленными или измененными.
+        """
+        self.held.update(offer_ids)
+
+    def affected_values(self, field: str) -> set:
+        """
+        Значения поля field до и после изменения у всех
+        добавленных, удаленных и измененных офферов.
+        """
+        values = {
+            self._field(entry, field) for entry in self.previous.values()
+        }
+        values.update(
+            self._field(entry, field) for entry in self.current.values()
+        )
+        return values
+
+
+class OfferDeltaTracker(FileMixin):
+    """
+    Хранилище отпечатков офферов по регионам (файлам фидов).
+
+    compute сравнивает офферы фида с отпечатками прошлого запуска
+    и возвращает OfferDelta. Новые отпечатки записываются только
+    в commit, который вызывается после успешного завершения всех
+    этапов: если запуск упал, следующий получит изменения заново.
+    Строки отчета (OfferDelta.report_rows) пишутся там же с общей
+    меткой сохранения: строки используются повторно, только если их
+    метка совпадает с OfferDelta.base_commit.
+    """
+
+    def __init__(
+        self,
+        filenames: list,
+        feeds_folder: str = FEEDS_FOLDER,
+        snapshots: bool = OFFER_SNAPSHOTS
+    ) -> None:
+        self.filenames = filenames
+        self.feeds_folder = feeds_folder
+        self.snapshots = snapshots
+        self._pending: dict[str, tuple[dict, OfferDelta]] = {}
+
+    def __repr__(self):
+        return (
+            f'OfferDeltaTracker(filenames={self.filenames}, '
+            f"feeds_folder='{self.feeds_folder}')"
+        )
+
+    def _snapshot(self, filename: str) -> dict:
+        """
+        Защищенный метод, строит отпечатки офферов фида.
+        У офферов с одинаковым id отпечаток общий, поля берутся
+        из первого оффера, как в OfferIndex.get.
+        """
+        index = self._get_offer_index(filename, self.feeds_folder)
+        root = self._get_root(filename, self.feeds_folder)
+        hashes: dict[str, list] = {}
+        offers: dict[str, list] = {}
+        for record in index:
+            if not record.offer_id:
+                continue
+            hashes.setdefault(record.offer_id, []).append(
+                offer_fingerprint(record.element)
+            )
+            if record.offer_id not in offers:
+                offers[record.offer_id] = [
+                    getattr(record, field) for field in TRACKED_FIELDS
+                ]
+        for offer_id, fingerprints in hashes.items():
+            fingerprint = fingerprints[0] if len(fingerprints) == 1 else (
+                hashlib.blake2b(
+                    ''.join(fingerprints).encode(),
+                    digest_size=16
+                ).hexdigest()
+            )
+            offers[offer_id].insert(0, fingerprint)
+        return {
+            'categories': categories_fingerprint(root),
+            'offers': offers
+        }
+
+    def compute(self, filename: str) -> OfferDelta:
+        """
+        Возвращает изменения офферов фида с прошлого запуска.
+        По тому же дереву строится колоночный снимок фида
+        (см. FileMixin._get_snapshot): отчет, изображения и видео
+        читают его и не разбирают фид заново.
+        """
+        snapshot = self._snapshot(filename)
+        if self.snapshots:
+            self._get_snapshot(filename, self.feeds_folder)
+        self._release_feed(filename, self.feeds_folder)
+        stored = self._read_meta(
+            self.feeds_folder,
+            f'{filename}{FINGERPRINTS_SUFFIX}'
+        )
+        current = snapshot['offers']
+        if not stored:
+            delta = OfferDelta(
+                added=frozenset(current),
+                current=current,
+                initial=True
+            )
+        else:
+            previous = stored.get('offers', {})
+            changed = frozenset(
+                offer_id for offer_id, entry in current.items()
+                if offer_id in previous and previous[offer_id] != entry
+            )
+            added = frozenset(current.keys() - previous.keys())
+            removed = frozenset(previous.keys() - current.keys())
+            delta = OfferDelta(
+                added=added,
+                removed=removed,
+                changed=changed,
+                previous={
+                    offer_id: previous[offer_id]
+                    for offer_id in removed | changed
+                },
+                current={
+                    offer_id: current[offer_id]
+                    for offer_id in added | changed
+                },
+                categories_changed=(
+                    stored.get('categories') != snapshot['categories']
+                )
+            )
+        delta.base_commit = stored.get('commit')
+        self._pending[filename] = (snapshot, delta)
+        logging.info('Изменения офферов в фиде %s: %s', filename, delta)
+        return delta
+
+    def compute_all(self) -> dict[str, OfferDelta]:
+        """Возвращает изменения офферов по всем фидам."""
+        return {
+            filename: self.compute(filename) for filename in self.filenames
+        }
+
+    def commit(self) -> None:
+        """
+        Сохраняет отпечатки, посчитанные в compute, и строки отчета,
+        переданные в OfferDelta.report_rows, с общей меткой сохранения.
+        Отпечатки офферов из OfferDelta.held не обновляются.
+        """
+        for filename, (snapshot, delta) in self._pending.items():
+            commit_id = uuid.uuid4().hex
+            offers = snapshot['offers']
+            if delta.held:
+                offers = dict(offers)
+                for offer_id in delta.held:
+                    if offer_id in delta.previous:
+                        offers[offer_id] = delta.previous[offer_id]
+                    elif offer_id in delta.added:
+                        offers.pop(offer_id, None)
+                logging.info(
+                    'В фиде %s не сохранены отпечатки %s офферов',
+                    filename,
+                    len(delta.held)
+                )
+            if delta.report_rows is not None:
+                self._write_meta(
+                    self.feeds_folder,
+                    f'{filename}{REPORT_ROWS_SUFFIX}',
+                    {'commit': commit_id, 'rows': delta.report_rows}
+                )
+            self._write_meta(
+                self.feeds_folder,
+                f'{filename}{FINGERPRINTS_SUFFIX}',
+                {**snapshot, 'offers': offers, 'commit': commit_id}
+            )
+        logging.info(
+            'Сохранены отпечатки офферов для %s фидов',
+            len(self._pending)
+        )
+        self._pending.clear()
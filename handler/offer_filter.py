@@ -0,0 +1,103 @@
+from collections import defaultdict
+
+
+class OfferFilter:
+    """
+    Скомпилированный фильтр офферов по брендам и категориям.
+
+    Строится один раз из словаря вида {бренд: [категории]}.
+    Для конкретного дерева категорий фильтр разворачивает каждую
+    категорию в поддерево и собирает неизменяемое множество
+    допустимых пар (бренд, категория). Результат кэшируется
+    по дереву категорий, поэтому фиды с одинаковым деревом
+    компилируются один раз. Бренды со значением 'all' проходят
+    фильтр в любой категории.
+    """
+
+    _instances: dict = {}
+
+    def __init__(self, vendor_category: dict) -> None:
+        self.all_vendors = frozenset(
+            vendor for vendor, categories in vendor_category.items()
+            if 'all' in categories
+        )
+        self.vendor_roots = {
+            vendor: frozenset(
+                str(category_id) for category_id in categories
+                if str(category_id).isdigit()
+            )
+            for vendor, categories in vendor_category.items()
+            if vendor not in self.all_vendors
+        }
+        self._compiled: dict = {}
+
+    @classmethod
+    def from_dict(cls, vendor_category: dict) -> 'OfferFilter':
+        """Возвращает фильтр для словаря, собирая его только один раз."""
+        key = tuple(
+            (vendor, tuple(categories))
+            for vendor, categories in vendor_category.items()
+        )
+        offer_filter = cls._instances.get(key)
+        if offer_filter is None:
+            offer_filter = cls._instances[key] = cls(vendor_category)
+        return offer_filter
+
+    @classmethod
+    def clear_cache(cls) -> None:
+        """Очищает кэш фильтров."""
+        cls._instances.clear()
+
+    def compile(self, categories: list) -> frozenset:
+        """
+        Возвращает множество допустимых пар (бренд, категория)
+        для дерева категорий фида.
+        """
+        tree = tuple(
+            (category.get('id'), category.get('parentId'))
+            for category in categories
+        )
+        pairs = self._compiled.get(tree)
+        if pairs is None:
+            pairs = self._compiled[tree] = self._build_pairs(tree)
+        return pairs
+
+    def _build_pairs(self, tree: tuple) -> frozenset:
+        """
+        Защищенный метод, разворачивает категории брендов
+        в поддеревья. Каждое поддерево обходится один раз,
+        сколько бы брендов на него ни ссылалось.
+        """
+        children_map = defaultdict(list)
+        for category_id, parent_id in tree:
+            if parent_id:
+                children_map[parent_id].append(category_id)
+
+        subtrees: dict[str, frozenset] = {}
+
+        def collect(category_id: str) -> frozenset:
+            if category_id not in subtrees:
+                result = set()
+                stack = [category_id]
+                while stack:
+                    cur = stack.pop()
+                    result.add(cur)
+                    for child in children_map.get(cur, []):
+                        if child not in result:
+                            stack.append(child)
+                subtrees[category_id] = frozenset(result)
+            return subtrees[category_id]
+
+        return frozenset(
+            (vendor, category_id)
+            for vendor, roots in self.vendor_roots.items()
+            for root in roots
+            for category_id in collect(root)
+        )
+
+    def matches(self, offer, pairs: frozenset) -> bool:
+        """Проверяет, проходит ли оффер фильтр."""
+        vendor = (offer.findtext('vendor') or '').strip().lower()
+        if vendor in self.all_vendors:
+            return True
+        return (vendor, offer.findtext('categoryId')) in pairs
@@ -0,0 +1,78 @@
+import xml.etree.ElementTree as ET
+from typing import Iterator, KeysView, NamedTuple
+
+INDEXED_FIELDS = {
+    'vendor': 'vendor',
+    'categoryId': 'category_id',
+    'price': 'price',
+    'picture': 'picture',
+}
+"""Теги оффера, значения которых сохраняются в индексе."""
+
+
+class OfferRecord(NamedTuple):
+    """
+    Запись индекса: элемент оффера и его часто используемые поля.
+    Значения полей совпадают с offer.findtext(тег): текст первого
+    такого тега, '' для пустого тега и None, если тега нет.
+    """
+
+    offer_id: str | None
+    element: ET.Element
+    vendor: str | None
+    category_id: str | None
+    price: str | None
+    picture: str | None
+
+
+class OfferIndex:
+    """
+    Индекс офферов фида, строится за один проход по дереву.
+
+    Хранит записи в порядке документа (итерация по индексу
+    перебирает все офферы, включая повторяющиеся id) и словарь
+    offer_id -> записи для поиска за O(1). Индекс не следит
+    за деревом: после изменения дерева его нужно построить заново,
+    общий кэш фидов делает это сам (см. FeedRegistry.get_index).
+    """
+
+    def __init__(self, root: ET.Element) -> None:
+        self.records: list[OfferRecord] = []
+        self._by_id: dict[str | None, list[OfferRecord]] = {}
+        for offer in root.iter('offer'):
+            fields = dict.fromkeys(INDEXED_FIELDS.values())
+            for child in offer:
+                name = INDEXED_FIELDS.get(child.tag)
+                if name and fields[name] is None:
+                    fields[name] = child.text or ''
+            record = OfferRecord(offer.get('id'), offer, **fields)
+            self.records.append(record)
+            self._by_id.setdefault(record.offer_id, []).append(record)
+
+    def __repr__(self):
+        return (
+            f'OfferIndex(offers={len(self.records)}, '
+            f'unique_ids={len(self._by_id)})'
+        )
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self) -> Iterator[OfferRecord]:
+        return iter(self.records)
+
+    def __contains__(self, offer_id) -> bool:
+        return offer_id in self._by_id
+
+    def ids(self) -> KeysView:
+        """Возвращает id офферов фида в порядке документа."""
+        return self._by_id.keys()
+
+    def get(self, offer_id: str) -> OfferRecord | None:
+        """Возвращает первую в документе запись оффера с offer_id."""
+        records = self._by_id.get(offer_id)
+        return records[0] if records else None
+
+    def get_all(self, offer_id: str) -> list[OfferRecord]:
+        """Возвращает все записи офферов с offer_id."""
+        return list(self._by_id.get(offer_id, ()))
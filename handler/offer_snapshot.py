@@ -0,0 +1,174 @@
+import json
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+
+from handler.logging_config import setup_logging
+from handler.offer_index import OfferIndex
+
+setup_logging()
+
+SNAPSHOT_FORMAT = 1
+"""Версия формата снимка; снимки другой версии строятся заново."""
+
+SNAPSHOT_META = 'meta.json'
+"""Файл с сигнатурой фида, по которой построен снимок."""
+
+OFFER_COLUMNS = ('offer_id', 'vendor', 'category_id', 'picture')
+"""Строковые колонки офферов (поля OfferRecord)."""
+
+CATEGORY_COLUMNS = ('category', 'parent', 'category_name')
+"""Строковые колонки дерева категорий: id, parentId и название."""
+
+PRICE_MISSING, PRICE_OK, PRICE_INVALID = 0, 1, 2
+"""Состояния цены оффера: нет цены, число, не число."""
+
+
+class StringColumn:
+    """
+    Колонка строк со словарем: уникальные значения хранятся один раз
+    в table, для каждой строки - номер значения в codes (-1 для None).
+    """
+
+    def __init__(self, table: np.ndarray, codes: np.ndarray) -> None:
+        self.table = table
+        self.codes = codes
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @classmethod
+    def from_values(cls, values: list) -> 'StringColumn':
+        """Строит колонку из списка строк и None."""
+        interned: dict[str, int] = {}
+        codes = np.fromiter(
+            (
+                -1 if value is None
+                else interned.setdefault(value, len(interned))
+                for value in values
+            ),
+            dtype=np.int32,
+            count=len(values)
+        )
+        table = np.array(list(interned), dtype=str)
+        if not interned:
+            table = np.empty(0, dtype='U1')
+        return cls(table, codes)
+
+    def tolist(self) -> list:
+        """Возвращает значения колонки списком строк и None."""
+        table = self.table.tolist()
+        return [
+            table[code] if code >= 0 else None
+            for code in self.codes.tolist()
+        ]
+
+
+class OfferSnapshot:
+    """
+    Колоночный снимок офферов и категорий фида.
+
+    Строковые поля хранятся в StringColumn, цены - в массиве int64
+    с массивом состояний price_state (PRICE_MISSING, PRICE_OK,
+    PRICE_INVALID). Снимок сохраняется в .npy-файлы и читается
+    через отображение в память, поэтому этапы, которым нужны только
+    эти поля, не разбирают XML повторно.
+    """
+
+    def __init__(
+        self,
+        columns: dict[str, StringColumn],
+        price: np.ndarray,
+        price_state: np.ndarray
+    ) -> None:
+        self.columns = columns
+        self.price = price
+        self.price_state = price_state
+
+    def __repr__(self):
+        return (
+            f'OfferSnapshot(offers={len(self)}, '
+            f"categories={len(self.columns['category'])})"
+        )
+
+    def __len__(self) -> int:
+        return len(self.price)
+
+    @classmethod
+    def from_index(cls, index: OfferIndex, root) -> 'OfferSnapshot':
+        """Строит снимок по индексу офферов и дереву фида."""
+        records = index.records
+        columns = {
+            name: StringColumn.from_values(
+                [getattr(record, name) for record in records]
+            )
+            for name in OFFER_COLUMNS
+        }
+        categories = list(root.iter('category'))
+        for name, values in zip(CATEGORY_COLUMNS, (
+            [category.get('id') for category in categories],
+            [category.get('parentId') for category in categories],
+            [category.text for category in categories],
+        )):
+            columns[name] = StringColumn.from_values(values)
+
+        price = np.zeros(len(records), dtype=np.int64)
+        price_state = np.zeros(len(records), dtype=np.int8)
+        for position, record in enumerate(records):
+            if not record.price:
+                continue
+            try:
+                price[position] = int(record.price)
+                price_state[position] = PRICE_OK
+            except (ValueError, OverflowError):
+                price_state[position] = PRICE_INVALID
+        return cls(columns, price, price_state)
+
+    def save(self, folder: Path, signature: list) -> None:
+        """
+        Сохраняет снимок в директорию folder. Файл с сигнатурой
+        пишется последним, поэтому недописанный снимок не читается.
+        """
+        meta_path = folder / SNAPSHOT_META
+        meta_path.unlink(missing_ok=True)
+        for name, column in self.columns.items():
+            np.save(folder / f'{name}.table.npy', column.table)
+            np.save(folder / f'{name}.codes.npy', column.codes)
+        np.save(folder / 'price.npy', self.price)
+        np.save(folder / 'price_state.npy', self.price_state)
+        temp_path = folder / f'{SNAPSHOT_META}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'format': SNAPSHOT_FORMAT, 'signature': signature}, f)
+        os.replace(temp_path, meta_path)
+
+    @classmethod
+    def load(cls, folder: Path, signature: list) -> 'OfferSnapshot | None':
+        """
+        Читает снимок через отображение в память.
+        Возвращает None, если снимка нет или он построен
+        по другой версии фида.
+        """
+        try:
+            with open(folder / SNAPSHOT_META, encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta != {'format': SNAPSHOT_FORMAT, 'signature': signature}:
+                return None
+            columns = {
+                name: StringColumn(
+                    np.load(folder / f'{name}.table.npy', mmap_mode='r'),
+                    np.load(folder / f'{name}.codes.npy', mmap_mode='r')
+                )
+                for name in OFFER_COLUMNS + CATEGORY_COLUMNS
+            }
+            return cls(
+                columns,
+                np.load(folder / 'price.npy', mmap_mode='r'),
+                np.load(folder / 'price_state.npy', mmap_mode='r')
+            )
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as error:
+            logging.warning('Снимок %s поврежден: %s', folder, error)
+            return None
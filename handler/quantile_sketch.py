@@ -0,0 +1,169 @@
+import math
+import random
+
+import numpy as np
+
+from handler.constants import SKETCH_RANK_ERROR
+
+COMPACTOR_RATIO = 2 / 3
+"""Во сколько раз уровень KLL меньше следующего за ним."""
+
+MIN_CAPACITY = 2
+"""Минимальная емкость уровня скетча."""
+
+ERROR_CONSTANT, ERROR_EXPONENT = 2.296, 0.9723
+"""
+Эмпирическая зависимость ошибки ранга KLL от параметра k:
+ошибка ~ ERROR_CONSTANT / k ** ERROR_EXPONENT.
+"""
+
+
+def sketch_size_for_error(rank_error: float) -> int:
+    """Возвращает параметр k, при котором ошибка ранга не больше заданной."""
+    if not 0 < rank_error < 1:
+        raise ValueError(f'Недопустимая ошибка ранга: {rank_error}')
+    return max(
+        8,
+        math.ceil((ERROR_CONSTANT / rank_error) ** (1 / ERROR_EXPONENT))
+    )
+
+
+class KLLSketch:
+    """
+    Квантильный скетч KLL (Karnin, Lang, Liberty) для цен.
+
+    Хранит уровни-компакторы: элемент уровня h весит 2 ** h.
+    Переполненный уровень сортируется, и каждый второй элемент
+    (со случайным сдвигом) переносится на уровень выше, поэтому
+    память O(k log(n / k)) не зависит от числа цен. Скетчи можно
+    объединять (merge) - по дереву категорий и между регионами.
+    Количество, сумма, минимум и максимум считаются точно.
+    Пока ни один уровень не сжимался, скетч хранит все цены (exact).
+    """
+
+    def __init__(
+        self,
+        rank_error: float = SKETCH_RANK_ERROR,
+        seed: int = 0
+    ) -> None:
+        self.rank_error = rank_error
+        self.k = sketch_size_for_error(rank_error)
+        self.levels = [np.empty(0, dtype=np.int64)]
+        self.count = 0
+        self.total = 0
+        self.min: int | None = None
+        self.max: int | None = None
+        self._random = random.Random(seed)
+
+    def __repr__(self):
+        return (
+            f'KLLSketch(k={self.k}, count={self.count}, '
+            f'retained={self.retained}, levels={len(self.levels)})'
+        )
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def retained(self) -> int:
+        """Количество хранимых элементов."""
+        return sum(len(level) for level in self.levels)
+
+    @property
+    def exact(self) -> bool:
+        """Скетч хранит все цены без сжатия."""
+        return len(self.levels) == 1
+
+    def _capacity(self, height: int) -> int:
+        """Защищенный метод, возвращает емкость уровня height."""
+        depth = len(self.levels) - height - 1
+        return max(
+            MIN_CAPACITY,
+            math.ceil(self.k * COMPACTOR_RATIO ** depth)
+        )
+
+    def _compress(self) -> None:
+        """
+        Защищенный метод, сжимает нижние переполненные уровни,
+        пока общее число элементов не станет меньше суммы емкостей.
+        """
+        while self.retained >= sum(
+            self._capacity(height) for height in range(len(self.levels))
+        ):
+            for height, level in enumerate(self.levels):
+                if len(level) < self._capacity(height):
+                    continue
+                if height + 1 == len(self.levels):
+                    self.levels.append(np.empty(0, dtype=np.int64))
+                level = np.sort(level)
+                held = len(level) % 2
+                offset = self._random.randint(0, 1)
+                self.levels[height + 1] = np.concatenate((
+                    self.levels[height + 1],
+                    level[offset:len(level) - held:2]
+                ))
+                self.levels[height] = level[len(level) - held:]
+                break
+
+    def update(self, values) -> 'KLLSketch':
+        """Добавляет в скетч массив цен."""
+        values = np.asarray(values, dtype=np.int64)
+        if not len(values):
+            return self
+        self.count += len(values)
+        self.total += int(values.sum())
+        low, high = int(values.min()), int(values.max())
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+        self.levels[0] = np.concatenate((self.levels[0], values))
+        self._compress()
+        return self
+
+    def merge(self, other: 'KLLSketch') -> 'KLLSketch':
+        """Добавляет в скетч все цены другого скетча."""
+        if not other.count:
+            return self
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0, dtype=np.int64))
+        for height, level in enumerate(other.levels):
+            self.levels[height] = np.concatenate((self.levels[height], level))
+        self.count += other.count
+        self.total += other.total
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self._compress()
+        return self
+
+    def copy(self) -> 'KLLSketch':
+        """Возвращает независимую копию скетча."""
+        sketch = KLLSketch(self.rank_error)
+        sketch.merge(self)
+        return sketch
+
+    def weighted_items(self) -> tuple[np.ndarray, np.ndarray]:
+        """Возвращает хранимые элементы по возрастанию и их веса."""
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([
+            np.full(len(level), 2 ** height, dtype=np.int64)
+            for height, level in enumerate(self.levels)
+        ])
+        order = np.argsort(items, kind='stable')
+        return items[order], weights[order]
+
+    def quantile(self, quantile: float) -> int:
+        """Возвращает элемент с рангом примерно quantile * (count - 1)."""
+        if not self.count:
+            raise ValueError('Скетч пуст')
+        items, weights = self.weighted_items()
+        return int(weighted_quantile(items, weights, quantile))
+
+
+def weighted_quantile(items, weights, quantile: float):
+    """
+    Возвращает элемент отсортированного взвешенного набора,
+    накопленный вес которого первым превышает quantile * (n - 1).
+    """
+    cumulative = np.cumsum(weights)
+    target = quantile * (cumulative[-1] - 1)
+    position = int(np.searchsorted(cumulative, target, side='right'))
+    return items[min(position, len(items) - 1)]
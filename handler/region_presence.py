@@ -0,0 +1,134 @@
+from typing import NamedTuple
+
+import numpy as np
+
+POPCOUNT = np.array([bin(byte).count('1') for byte in range(256)], np.uint8)
+"""Число единичных битов для каждого значения байта."""
+
+
+def feed_region(filename: str) -> str:
+    """
+    Возвращает код региона по имени фида - часть перед суффиксом
+    _cl: new_msk_cl.xml и retailmedia_auction_msk_cl.xml -> msk.
+    """
+    name = filename.split('.')[0]
+    parts = name.split('_')
+    return parts[-2] if len(parts) > 2 else name
+
+
+class RegionJoin(NamedTuple):
+    """
+    Тип объединения фидов по присутствию офферов в регионах.
+
+    name - имя типа, по нему называется объединенный фид.
+    Оффер попадает в фид, если он есть в каждом регионе include,
+    нет ни в одном регионе exclude и есть хотя бы в min_regions
+    регионах.
+    """
+
+    name: str
+    include: tuple = ()
+    exclude: tuple = ()
+    min_regions: int = 0
+
+
+def at_least(count: int) -> RegionJoin:
+    """Объединение офферов, которые есть хотя бы в count регионах."""
+    return RegionJoin(f'at_least_{count}', min_regions=count)
+
+
+def left_join(region: str) -> RegionJoin:
+    """Левое объединение: все офферы региона region."""
+    return RegionJoin(f'left_{region}', include=(region,))
+
+
+def regions_join(include: tuple, exclude: tuple = ()) -> RegionJoin:
+    """Офферы, которые есть во всех регионах include и нет в exclude."""
+    name = '_'.join(include)
+    if exclude:
+        name = f"{name}_not_{'_'.join(exclude)}"
+    return RegionJoin(name, tuple(include), tuple(exclude))
+
+
+class RegionPresence:
+    """
+    Матрица присутствия офферов в регионах.
+
+    Строка - оффер (в порядке ids), бит столбца - фид: бит j
+    байта i относится к фиду 8 * i + j. counts хранит число вхождений
+    оффера во все фиды с учетом повторов внутри фида. Условия
+    объединения считаются побитовыми операциями над всей матрицей
+    сразу и возвращают булеву маску по офферам.
+    """
+
+    def __init__(
+        self,
+        regions: list[str],
+        ids: list[str],
+        bits: np.ndarray,
+        counts: np.ndarray
+    ) -> None:
+        self.regions = regions
+        self.ids = ids
+        self.bits = bits
+        self.counts = counts
+
+    def __repr__(self):
+        return (
+            f'RegionPresence(regions={self.regions}, '
+            f'offers={len(self.ids)})'
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _region_bits(self, region: str) -> np.ndarray:
+        """
+        Защищенный метод, возвращает строку битов всех фидов региона.
+        Для неизвестного региона вызывает ValueError.
+        """
+        row = np.zeros(self.bits.shape[1], dtype=np.uint8)
+        for column, name in enumerate(self.regions):
+            if name == region:
+                row[column >> 3] |= 1 << (column & 7)
+        if not row.any():
+            raise ValueError(f'Неизвестный регион: {region}')
+        return row
+
+    def present_in(self, region: str) -> np.ndarray:
+        """Маска офферов, которые есть в регионе region."""
+        return (self.bits & self._region_bits(region)).any(axis=1)
+
+    def region_counts(self) -> np.ndarray:
+        """
+        Количество регионов, в которых есть каждый оффер.
+        Несколько фидов одного региона считаются одним регионом.
+        """
+        regions = dict.fromkeys(self.regions)
+        if len(regions) == len(self.regions):
+            return POPCOUNT[self.bits].sum(axis=1, dtype=np.int64)
+        counts = np.zeros(len(self.ids), dtype=np.int64)
+        for region in regions:
+            counts += self.present_in(region)
+        return counts
+
+    def mask(self, join_type: 'str | RegionJoin') -> np.ndarray:
+        """
+        Возвращает маску офферов для типа объединения: 'inner'
+        (число вхождений равно числу фидов), 'full_outer' (все офферы)
+        или RegionJoin.
+        """
+        if join_type == 'inner':
+            return self.counts == len(self.regions)
+        if join_type == 'full_outer':
+            return np.ones(len(self.ids), dtype=bool)
+        if not isinstance(join_type, RegionJoin):
+            raise ValueError(f'Неизвестный тип join: {join_type}')
+        mask = np.ones(len(self.ids), dtype=bool)
+        for region in join_type.include:
+            mask &= self.present_in(region)
+        for region in join_type.exclude:
+            mask &= ~self.present_in(region)
+        if join_type.min_regions:
+            mask &= self.region_counts() >= join_type.min_regions
+        return mask
@@ -1,122 +1,103 @@
+import hashlib
 import logging
-from datetime import datetime as dt
+import threading
 
-import numpy as np
+import mysql.connector
 
-from handler.calculation import clear_avg, clear_max, clear_median, clear_min
+from handler.bulk_loader import (chunks, load_data_queries, parse_insert,
+                                 write_load_file)
 from handler.constants import (CREATE_CATALOG_TABLE, CREATE_REPORTS_TABLE,
-                               DATE_FORMAT, DECIMAL_ROUNDING, INSERT_CATALOG,
-                               INSERT_REPORT, NAME_OF_SHOP)
-from handler.decorators import connection_db, time_of_function, try_except
+                               DB_CHUNK_SIZE, DB_LOAD_STRATEGY, FEEDS_FOLDER,
+                               INSERT_CATALOG, INSERT_REPORT, NAME_OF_SHOP)
+from handler.decorators import connection_db
 from handler.exceptions import TableNameError
+from handler.feeds_report import FeedReport
 from handler.logging_config import setup_logging
 from handler.mixins import FileMixin
 
 setup_logging()
 
+TABLE_SNAPSHOT_SUFFIX = '.table.json'
+"""Суффикс служебного файла со снимком содержимого таблицы бд."""
+
+
+def schema_version(sql_pattern: str) -> str:
+    """Возвращает версию схемы таблицы - хэш запроса на ее создание."""
+    return hashlib.blake2b(
+        sql_pattern.encode('utf-8'),
+        digest_size=8
+    ).hexdigest()
+
+
+class SchemaRegistry:
+    """
+    Таблицы бд, существование которых уже проверено в этом процессе.
+
+    Для таблицы хранится версия схемы (см. schema_version): пока запрос
+    на создание не изменился, таблица повторно не проверяется.
+    При ошибке записи реестр сбрасывается (invalidate), и следующее
+    обращение снова проверяет таблицы в базе.
+    """
+
+    def __init__(self) -> None:
+        self._tables: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f'SchemaRegistry(tables={sorted(self._tables)})'
+
+    def __len__(self) -> int:
+        return len(self._tables)
+
+    def is_known(self, table_name: str, version: str) -> bool:
+        """Проверяет, что таблица этой версии уже есть в базе."""
+        with self._lock:
+            return self._tables.get(table_name) == version
+
+    def add(self, table_name: str, version: str) -> None:
+        """Запоминает, что таблица этой версии есть в базе."""
+        with self._lock:
+            self._tables[table_name] = version
+
+    def invalidate(self) -> None:
+        """Сбрасывает реестр."""
+        with self._lock:
+            self._tables.clear()
+
+
+SCHEMA_REGISTRY = SchemaRegistry()
+"""Общий для процесса реестр проверенных таблиц."""
+
 
 class ReportDataBase(FileMixin):
     """Класс, предоставляющий интерфейс для работы с базой данных"""
 
-    def __init__(self, shop_name: str = NAME_OF_SHOP):
+    def __init__(
+        self,
+        shop_name: str = NAME_OF_SHOP,
+        schema: SchemaRegistry = SCHEMA_REGISTRY,
+        meta_folder: str = FEEDS_FOLDER
+    ):
         self.shop_name = shop_name
+        self.schema = schema
+        self.meta_folder = meta_folder
 
     def __repr__(self):
         return (
             f"ReportDataBase(shop_name='{self.shop_name}', "
         )
 
-    @time_of_function
-    @try_except
     def get_offers_report(
         self,
         filenames: list,
         feeds_folder: str
     ) -> list[dict]:
-        """Метод, формирующий отчет по офферам."""
-        result = []
-        date_str = (dt.now()).strftime(DATE_FORMAT)
-        for filename in filenames:
-            tree = self._get_tree(filename, feeds_folder)
-            root = tree.getroot()
-            category_data = {}
-            all_categories = {}
-
-            for category in root.findall('.//category'):
-                category_name = category.text
-                category_id = category.get('id')
-                parent_id = category.get('parentId')
-                all_categories[category_id] = parent_id
-                category_data[category_id] = {
-                    'prices': [],
-                    'category_name': category_name,
-                    'offers_count': 0
-                }
-
-            for offer in root.findall('.//offer'):
-                category_id = offer.findtext('categoryId')
-                price = offer.findtext('price')
-                if category_id and price:
-                    if category_id not in category_data:
-                        category_data[category_id] = {
-                            'prices': [],
-                            'category_name': '',
-                            'offers_count': 0
-                        }
-                    category_data[category_id]['prices'].append(int(price))
-                    category_data[category_id]['offers_count'] += 1
-
-            def aggregate_data(category_id):
-                prices = category_data[category_id]['prices'].copy()
-                offers_count = category_data[category_id]['offers_count']
-
-                for child_id, parent_id in all_categories.items():
-                    if parent_id == category_id:
-                        child_prices, child_count = aggregate_data(child_id)
-                        prices.extend(child_prices)
-                        offers_count += child_count
-                category_data[category_id]['prices'] = prices
-                category_data[category_id]['offers_count'] = offers_count
-                return prices, offers_count
-
-            root_categories = [
-                cat_id for cat_id, parent_id in all_categories.items()
-                if parent_id is None
-            ]
-            for root_id in root_categories:
-                aggregate_data(root_id)
-
-            for category_id, data in category_data.items():
-                count_offers = data['offers_count']
-                price_list = data['prices']
-                parent_id = all_categories.get(category_id)
-                category_name = data['category_name']
-
-                result.append({
-                    'date': date_str,
-                    'feed_name': filename,
-                    'category_name': category_name,
-                    'category_id': category_id,
-                    'parent_id': parent_id,
-                    'count_offers': count_offers,
-                    'min_price': min(price_list) if price_list else 0,
-                    'clear_min_price': clear_min(price_list)
-                    if price_list else 0,
-                    'max_price': max(price_list) if price_list else 0,
-                    'clear_max_price': clear_max(price_list)
-                    if price_list else 0,
-                    'avg_price': round(
-                        sum(price_list) / len(price_list), DECIMAL_ROUNDING
-                    ) if price_list else 0,
-                    'clear_avg_price': clear_avg(price_list)
-                    if price_list else 0,
-                    'median_price': round(
-                        np.median(price_list), DECIMAL_ROUNDING
-                    ) if price_list else 0,
-                    'clear_median_price': clear_median(price_list)
-                    if price_list else 0
-                })
-        return result
+        """Метод, формирующий отчет по офферам (см. FeedReport)."""
+        return FeedReport(
+            filenames,
+            feeds_folder=feeds_folder,
+            snapshots=False
+        ).get_offers_report()
 
     @connection_db
     def _allowed_tables(self, cursor=None) -> list:
@@ -128,39 +109,135 @@ class ReportDataBase(FileMixin):
         return [table[0] for table in cursor.fetchall()]
 
     @connection_db
-    def _create_table_if_not_exists(
-        self,
-        prefix,
-        sql_pattern,
-        cursor=None
-    ) -> str:
+    def _create_table(self, create_table_query: str, cursor=None) -> None:
+        """Защищенный метод, выполняет запрос на создание таблицы."""
+        cursor.execute(create_table_query)
+
+    def _create_table_if_not_exists(self, prefix, sql_pattern) -> str:
         """
         Защищенный метод, создает таблицу в базе данных, если ее не существует.
         Если таблица есть в базе данных - возварщает ее имя.
+        Таблица проверяется один раз за процесс (см. SchemaRegistry).
         """
         table_name = f'{prefix}_{self.shop_name}'
+        version = schema_version(sql_pattern)
+        if self.schema.is_known(table_name, version):
+            return table_name
         if table_name in self._allowed_tables():
             logging.info(f'Таблица {table_name} найдена в базе')
-            return table_name
-        create_table_query = sql_pattern.format(table_name=table_name)
-        cursor.execute(create_table_query)
-        logging.info(f'Таблица {table_name} успешно создана')
+        else:
+            self._create_table(sql_pattern.format(table_name=table_name))
+            self._drop_snapshot(table_name)
+            logging.info(f'Таблица {table_name} успешно создана')
+        self.schema.add(table_name, version)
         return table_name
 
-    def insert_catalog(self, data):
+    def insert_catalog(self, data, known: dict | None = None):
+        """
+        Метод, формирующий запрос на запись каталога категорий.
+        Категория, которая встречается в отчете по каждому фиду,
+        записывается один раз с последним названием. Если передан
+        снимок каталога known (str(category_id) -> название),
+        в запрос попадают только новые и переименованные категории.
+        """
         table_name = self._create_table_if_not_exists(
             'catalog_categories',
             CREATE_CATALOG_TABLE
         )
         query = INSERT_CATALOG.format(table_name=table_name)
-        params = [
-            (
-                item['category_id'],
-                item['category_name']
-            ) for item in data
-        ]
+        categories = {}
+        for item in data:
+            categories[item['category_id']] = item['category_name']
+        params = []
+        for category_id, category_name in categories.items():
+            key = str(category_id)
+            if known and key in known and known[key] == category_name:
+                continue
+            params.append((category_id, category_name))
         return query, params
 
+    def _drop_snapshot(self, table_name: str) -> None:
+        """
+        Защищенный метод, удаляет снимок содержимого таблицы,
+        когда таблица создана заново или очищена.
+        """
+        self._meta_path(
+            self.meta_folder,
+            f'{table_name}{TABLE_SNAPSHOT_SUFFIX}'
+        ).unlink(missing_ok=True)
+
+    @connection_db
+    def _count_rows(self, table_name: str, cursor=None) -> int:
+        """Защищенный метод, возвращает количество строк таблицы."""
+        cursor.execute(f'SELECT COUNT(*) FROM {table_name}')
+        return cursor.fetchone()[0]
+
+    @connection_db
+    def _select_catalog(self, table_name: str, cursor=None) -> dict:
+        """Защищенный метод, читает каталог категорий из базы."""
+        cursor.execute(
+            f'SELECT category_id, category_name FROM {table_name}'
+        )
+        return {
+            str(category_id): category_name
+            for category_id, category_name in cursor.fetchall()
+        }
+
+    def _catalog_snapshot(self, table_name: str) -> dict:
+        """
+        Защищенный метод, возвращает снимок каталога из служебного
+        файла. Если снимка нет, он построен для другой схемы таблицы
+        или число категорий в нем не совпадает с числом строк таблицы
+        (таблицу изменили в обход снимка), каталог читается из базы.
+        """
+        snapshot = self._read_meta(
+            self.meta_folder,
+            f'{table_name}{TABLE_SNAPSHOT_SUFFIX}'
+        )
+        if snapshot.get('version') == schema_version(CREATE_CATALOG_TABLE):
+            rows = snapshot['rows']
+            count = self._count_rows(table_name)
+            if count == len(rows):
+                return rows
+            logging.warning(
+                'Снимок таблицы %s устарел: в снимке %s строк, в базе %s',
+                table_name,
+                len(rows),
+                count
+            )
+        return self._select_catalog(table_name)
+
+    def save_catalog(self, data) -> int:
+        """
+        Метод записывает в базу только новые и переименованные
+        категории отчета (см. insert_catalog) относительно снимка
+        каталога и после успешной записи обновляет снимок.
+        Возвращает количество отправленных категорий.
+        """
+        table_name = self._create_table_if_not_exists(
+            'catalog_categories',
+            CREATE_CATALOG_TABLE
+        )
+        known = self._catalog_snapshot(table_name)
+        query, params = self.insert_catalog(data, known)
+        if params:
+            self.save_to_database((query, params))
+            known.update(
+                (str(category_id), category_name)
+                for category_id, category_name in params
+            )
+        self._write_meta(
+            self.meta_folder,
+            f'{table_name}{TABLE_SNAPSHOT_SUFFIX}',
+            {'version': schema_version(CREATE_CATALOG_TABLE), 'rows': known}
+        )
+        logging.info(
+            'Каталог категорий: отправлено %s, в снимке %s',
+            len(params),
+            len(known)
+        )
+        return len(params)
+
     def insert_reports(self, data):
         table_name = self._create_table_if_not_exists(
             'reports_offers',
@@ -187,17 +264,58 @@ class ReportDataBase(FileMixin):
         return query, params
 
     @connection_db
+    def _execute_chunk(self, query: str, params, cursor=None) -> None:
+        """Защищенный метод, записывает часть строк одной транзакцией."""
+        if isinstance(params, list):
+            cursor.executemany(query, params)
+        else:
+            cursor.execute(query, params)
+
+    @connection_db
+    def _load_chunk(self, query: str, params: list, cursor=None) -> None:
+        """
+        Защищенный метод, записывает часть строк одной транзакцией
+        через LOAD DATA LOCAL INFILE (см. load_data_queries).
+        """
+        table, columns, update = parse_insert(query)
+        with write_load_file(params) as file:
+            for statement in load_data_queries(
+                table,
+                columns,
+                update,
+                file.name
+            ):
+                cursor.execute(statement)
+
     def save_to_database(
         self,
         query_data: tuple,
-        cursor=None
+        chunk_size: int = DB_CHUNK_SIZE,
+        strategy: str = DB_LOAD_STRATEGY
     ) -> None:
-        """Метод сохраняется обработанные данные в базу данных."""
-        query, params = query_data
-        if isinstance(params, list):
-            cursor.executemany(query, params)
+        """
+        Метод сохраняется обработанные данные в базу данных.
+        Список строк записывается частями по chunk_size строк,
+        каждая часть фиксируется и при сетевой ошибке повторяется
+        отдельно (см. connection_db). strategy - 'chunked'
+        (многострочный INSERT) или 'load_data'.
+        """
+        if strategy == 'chunked':
+            save_chunk = self._execute_chunk
+        elif strategy == 'load_data':
+            save_chunk = self._load_chunk
         else:
-            cursor.execute(query, params)
+            raise ValueError(f'Неизвестный способ записи: {strategy}')
+        query, params = query_data
+        try:
+            if not isinstance(params, list):
+                self._execute_chunk(query, params)
+            else:
+                for chunk in chunks(params, chunk_size):
+                    save_chunk(query, chunk)
+        except mysql.connector.Error:
+            self.schema.invalidate()
+            raise
         logging.info('✅ Данные успешно сохранены!')
 
     @connection_db
@@ -211,6 +329,7 @@ class ReportDataBase(FileMixin):
             for table_name, should_clean in tables.items():
                 if should_clean and table_name in existing_tables:
                     cursor.execute(f'DELETE FROM {table_name}')
+                    self._drop_snapshot(table_name)
                     logging.info(f'Таблица {table_name} очищена')
                 else:
                     raise TableNameError(
@@ -1,11 +1,19 @@
 import logging
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Callable
 
-from handler.exceptions import DirectoryCreationError, EmptyFeedsListError
+from handler.constants import (AUCTION_PREFIX, NEW_FEEDS_FOLDER, NEW_PREFIX,
+                               PARAM_FOR_DELETE, PROCESS_WORKERS,
+                               STREAMING_MODE, TAGS_FOR_DELETE)
+from handler.exceptions import (DirectoryCreationError, EmptyFeedsListError,
+                                FeedProcessingError)
+from handler.feeds_handler import FeedHandler
 from handler.logging_config import setup_logging
 # from handler.feeds_handler import FeedHandler
 # from handler.feeds_save import FeedSaver
 from handler.reports_db import ReportDataBase
+from handler.vendor_category_dict import VENDOR_CATEGORY
 
 setup_logging()
 
@@ -40,12 +48,8 @@ def save_to_database(
         - db_client (XMLDataBase): Клиент для работы с базой данных.
         - data: Данные для сохранения
     """
-    queries = [
-        db_client.insert_reports(data),
-        db_client.insert_catalog(data)
-    ]
-    for query in queries:
-        db_client.save_to_database(query)
+    db_client.save_to_database(db_client.insert_reports(data))
+    db_client.save_catalog(data)
 
 
 def get_filenames_list(folder_name: str) -> list[str]:
@@ -62,3 +66,80 @@ def get_filenames_list(folder_name: str) -> list[str]:
         raise EmptyFeedsListError('Нет скачанных файлов')
     logging.debug('Найдены файлы: %s', files_names)
     return files_names
+
+
+def process_feed(filename: str) -> None:
+    """
+    Обрабатывает исходный фид: удаляет лишние теги и параметры,
+    добавляет видео и сохраняет с префиксом NEW_PREFIX.
+    """
+    handler_client = FeedHandler(filename, streaming=STREAMING_MODE)
+    (
+        handler_client
+        .delete_tags(TAGS_FOR_DELETE)
+        .delete_param(PARAM_FOR_DELETE)
+        # .replace_images()
+        .add_video()
+        .save(prefix=NEW_PREFIX)
+    )
+
+
+def filter_auction_feed(filename: str) -> None:
+    """
+    Формирует аукционный фид: оставляет офферы брендов и категорий
+    из VENDOR_CATEGORY и сохраняет с префиксом AUCTION_PREFIX.
+    """
+    handler = FeedHandler(
+        filename,
+        feeds_folder=NEW_FEEDS_FOLDER,
+        streaming=STREAMING_MODE
+    )
+    (
+        handler
+        .remove_non_matching_offers(VENDOR_CATEGORY)
+        .save(prefix=AUCTION_PREFIX)
+    )
+
+
+def run_per_feed(
+    func: Callable[[str], None],
+    filenames: list[str],
+    workers: int = PROCESS_WORKERS
+) -> None:
+    """
+    Выполняет func для каждого фида: последовательно или в пуле
+    из workers процессов. Ошибка одного фида не прерывает обработку
+    остальных; все ошибки собираются и поднимаются вместе
+    в FeedProcessingError после обработки всех фидов.
+    """
+    errors: dict[str, Exception] = {}
+    workers = min(workers, len(filenames))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                filename: executor.submit(func, filename)
+                for filename in filenames
+            }
+            for filename, future in futures.items():
+                error = future.exception()
+                if error is not None:
+                    errors[filename] = error
+    else:
+        for filename in filenames:
+            try:
+                func(filename)
+            except Exception as error:
+                errors[filename] = error
+
+    for filename, error in errors.items():
+        logging.error(
+            'Ошибка %s при обработке фида %s: %s',
+            func.__name__,
+            filename,
+            error
+        )
+    if errors:
+        raise FeedProcessingError(
+            f'Не обработано фидов: {len(errors)} из {len(filenames)} '
+            f'({", ".join(errors)})'
+        )
@@ -9,8 +9,8 @@ import cv2
 
 from handler.constants import (FEEDS_FOLDER, FORMAT_VIDEO, FPS,
                                NEW_FEEDS_FOLDER, NEW_IMAGE_FOLDER,
-                               TARGET_SECONDS_VIDEO, TOTAL_SECONDS_VIDEO,
-                               VIDEO_CODEC, VIDEOS_FOLDER)
+                               OFFER_SNAPSHOTS, TARGET_SECONDS_VIDEO,
+                               TOTAL_SECONDS_VIDEO, VIDEO_CODEC, VIDEOS_FOLDER)
 from handler.exceptions import DirectoryCreationError, EmptyFeedsListError
 from handler.logging_config import setup_logging
 from handler.mixins import FileMixin
@@ -33,8 +33,9 @@ class VideoCreater(FileMixin):
         fps: int = FPS,
         video_codec: str = VIDEO_CODEC,
         target_second: int = TARGET_SECONDS_VIDEO,
-        total_second: int = TOTAL_SECONDS_VIDEO
-
+        total_second: int = TOTAL_SECONDS_VIDEO,
+        refreshed_offers: set | None = None,
+        snapshots: bool = OFFER_SNAPSHOTS
     ):
         self.filenames = filenames
         self.feeds_folder = feeds_folder
@@ -46,6 +47,8 @@ class VideoCreater(FileMixin):
         self.video_codec = video_codec
         self.target_second = target_second
         self.total_second = total_second
+        self.refreshed_offers = refreshed_offers or set()
+        self.snapshots = snapshots
         self._root = None
         self._existing_videos_offers: set = set()
         self._existing_images: set = set()
@@ -68,14 +71,13 @@ class VideoCreater(FileMixin):
 
     def _create_single_video(
         self,
-        target_offer,
-        other_offers
+        offer_id: str,
+        other_offer_ids: list[str]
     ) -> bool:
         """
         Создает одно видео для целевого оффера.
         Возвращает True если успешно, False если ошибка.
         """
-        offer_id = target_offer.get('id')
         target_img = self._load_image(offer_id)
         if target_img is None:
             return False
@@ -107,8 +109,8 @@ class VideoCreater(FileMixin):
                 video_writer.write(target_img)
 
             other_imgs = []
-            for offer in other_offers:
-                img = self._load_image(offer.get('id'))
+            for other_offer_id in other_offer_ids:
+                img = self._load_image(other_offer_id)
                 if img is not None:
                     other_imgs.append(cv2.resize(img, (width, height)))
 
@@ -151,6 +153,23 @@ class VideoCreater(FileMixin):
                 video_writer.release()
             time.sleep(0.01)
 
+    def _group_fields(self, filename: str):
+        """
+        Защищенный метод, возвращает для офферов фида кортежи
+        (id, categoryId, vendor) из колоночного снимка или индекса.
+        """
+        if self.snapshots:
+            columns = self._get_snapshot(filename, self.feeds_folder).columns
+            return zip(
+                columns['offer_id'].tolist(),
+                columns['category_id'].tolist(),
+                columns['vendor'].tolist()
+            )
+        return (
+            (offer.offer_id, offer.category_id, offer.vendor)
+            for offer in self._get_offer_index(filename, self.feeds_folder)
+        )
+
     def create_videos(self):
         created_video = 0
         failed_video = 0
@@ -159,6 +178,7 @@ class VideoCreater(FileMixin):
             self._build_set(self.videos_folder, self._existing_videos_offers)
         except (DirectoryCreationError, EmptyFeedsListError):
             logging.warning('Директория с видео отсутствует. Первый запуск')
+        self._existing_videos_offers -= self.refreshed_offers
         try:
             self._build_set(self.new_images_folder, self._existing_images)
         except (DirectoryCreationError, EmptyFeedsListError):
@@ -166,33 +186,28 @@ class VideoCreater(FileMixin):
             raise
 
         for filename in self.filenames:
-            root = self._get_root(filename, self.feeds_folder)
-            offers = root.findall('.//offer')
             cat_ven_img_dict = defaultdict(list)
-            for offer in offers:
-                offer_id = str(offer.get('id'))
-                vendor = offer.findtext('vendor')
-                category_id = offer.findtext('categoryId')
+            for offer_id, category_id, vendor in self._group_fields(filename):
+                offer_id = str(offer_id)
                 if offer_id in self._existing_videos_offers:
                     existing_videos.add(offer_id)
                     continue
                 if offer_id not in self._existing_images:
                     continue
-                cat_ven_img_dict[(category_id, vendor)].append(offer)
+                cat_ven_img_dict[(category_id, vendor)].append(offer_id)
+            self._release_feed(filename, self.feeds_folder)
 
             for offers_in_group in cat_ven_img_dict.values():
-                for index, target_offer in enumerate(offers_in_group):
-                    offer_id = target_offer.get('id')
-
+                for index, offer_id in enumerate(offers_in_group):
                     if offer_id in self._existing_videos_offers:
                         continue
 
-                    other_offers = [
-                        offer for i, offer in enumerate(offers_in_group)
+                    other_offer_ids = [
+                        other_id for i, other_id in enumerate(offers_in_group)
                         if i != index
                     ]
 
-                    ok = self._create_single_video(target_offer, other_offers)
+                    ok = self._create_single_video(offer_id, other_offer_ids)
 
                     if ok:
                         created_video += 1
@@ -0,0 +1,142 @@
+import logging
+import xml.etree.ElementTree as ET
+from functools import lru_cache
+from typing import BinaryIO
+
+from handler.constants import XML_BACKEND
+from handler.logging_config import setup_logging
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+setup_logging()
+
+BACKENDS = ('etree', 'lxml')
+"""Поддерживаемые библиотеки разбора XML."""
+
+LXML_PARSER_OPTIONS = {
+    'remove_comments': True,
+    'remove_pis': True,
+    'resolve_entities': False,
+    'no_network': True,
+}
+"""Настройки парсеров lxml (см. parse_xml)."""
+
+COMMENT_TAGS = (ET.Comment,) + (
+    (lxml_etree.Comment,) if lxml_etree is not None else ()
+)
+"""Значения tag у комментариев в деревьях обеих библиотек."""
+
+
+@lru_cache(maxsize=None)
+def resolve_backend(backend: str = XML_BACKEND) -> str:
+    """
+    Возвращает библиотеку разбора XML, которая будет использована.
+    'auto' выбирает lxml, если она установлена; если lxml запрошена
+    явно, но не установлена, используется стандартная библиотека.
+    """
+    if backend == 'auto':
+        return 'lxml' if lxml_etree is not None else 'etree'
+    if backend not in BACKENDS:
+        raise ValueError(
+            f'Неизвестная библиотека XML: {backend}. '
+            f'Допустимые: auto, {", ".join(BACKENDS)}'
+        )
+    if backend == 'lxml' and lxml_etree is None:
+        logging.warning('lxml не установлена, используется xml.etree')
+        return 'etree'
+    return backend
+
+
+def parse_xml(source: BinaryIO, backend: str = XML_BACKEND):
+    """
+    Разбирает XML и возвращает корень дерева.
+    Парсер lxml настроен как xml.etree: комментарии и инструкции
+    обработки отбрасываются, поэтому деревья обеих библиотек
+    сериализуются одинаково (см. handler.xml_writer). Фиды скачиваются
+    из сети, поэтому сущности не подставляются и ограничения libxml2
+    на глубину и размер узлов не снимаются.
+    """
+    if resolve_backend(backend) == 'lxml':
+        parser = lxml_etree.XMLParser(**LXML_PARSER_OPTIONS)
+        return lxml_etree.parse(source, parser).getroot()
+    return ET.parse(source).getroot()
+
+
+def sub_element(parent, tag: str):
+    """Создает дочерний элемент в дереве любой из библиотек."""
+    child = parent.makeelement(tag, {})
+    parent.append(child)
+    return child
+
+
+class TagStream:
+    """
+    Потоковый разбор XML с событиями только для тегов tags.
+
+    Итерация возвращает кортежи (событие 'start' или 'end', элемент,
+    родитель), корень дерева доступен в атрибуте root, глубина
+    элемента последнего события - в методе depth. lxml отбирает
+    события по тегу сама, в xml.etree отбор идет в Python.
+    Текст после элемента (tail) на событии 'end' может быть
+    еще не прочитан: он гарантированно есть к следующему событию.
+    """
+
+    def __init__(
+        self,
+        source: BinaryIO,
+        tags: tuple,
+        backend: str = XML_BACKEND
+    ) -> None:
+        self.source = source
+        self.tags = tags
+        self.backend = resolve_backend(backend)
+        self.root = None
+        self._element = None
+        self._depth = 0
+
+    def __iter__(self):
+        if self.backend == 'lxml':
+            return self._iter_lxml()
+        return self._iter_etree()
+
+    def depth(self) -> int:
+        """Возвращает число предков элемента последнего события."""
+        if self.backend == 'lxml':
+            return sum(1 for _ in self._element.iterancestors())
+        return self._depth
+
+    def _iter_lxml(self):
+        """Защищенный метод, события парсера lxml."""
+        for event, element in lxml_etree.iterparse(
+            self.source,
+            events=('start', 'end'),
+            tag=self.tags,
+            **LXML_PARSER_OPTIONS
+        ):
+            if self.root is None:
+                self.root = element.getroottree().getroot()
+            self._element = element
+            yield event, element, element.getparent()
+
+    def _iter_etree(self):
+        """Защищенный метод, события парсера xml.etree."""
+        tags = frozenset(self.tags)
+        stack: list = []
+        for event, element in ET.iterparse(
+            self.source,
+            events=('start', 'end')
+        ):
+            if event == 'start':
+                if self.root is None:
+                    self.root = element
+                stack.append(element)
+            else:
+                stack.pop()
+            if element.tag not in tags:
+                continue
+            depth = len(stack) - (event == 'start')
+            self._depth = depth
+            yield event, element, stack[depth - 1] if depth else None
@@ -0,0 +1,104 @@
+import io
+import xml.etree.ElementTree as ET
+from typing import TextIO
+
+from handler.xml_backend import COMMENT_TAGS
+
+INDENT = '  '
+"""Отступ одного уровня вложенности."""
+
+FLUSH_PARTS = 4096
+"""Количество накопленных фрагментов, после которого они пишутся в файл."""
+
+_NEWLINES = tuple('\n' + INDENT * level for level in range(32))
+"""Готовые переводы строки с отступом для первых уровней вложенности."""
+
+_escape_cdata = ET._escape_cdata
+_escape_attrib = ET._escape_attrib
+
+
+def _newline(level: int) -> str:
+    """Возвращает перевод строки с отступом уровня level."""
+    if level < len(_NEWLINES):
+        return _NEWLINES[level]
+    return '\n' + INDENT * level
+
+
+def _is_blank(value: str | None) -> bool:
+    """Проверяет, что текст пустой или состоит из пробельных символов."""
+    return not value or not value.strip()
+
+
+def write_xml(
+    elem,
+    file: TextIO,
+    level: int = 0,
+    compact: bool = False
+) -> None:
+    """
+    Потоково пишет элемент в текстовый файл.
+
+    Отступы расставляются по тем же правилам, что и в
+    FileMixin._indent, а экранирование совпадает с ET.tostring,
+    поэтому результат побайтно равен _indent + ET.tostring,
+    но дерево не изменяется и целиком в памяти не собирается.
+    В компактном режиме пробельные text и tail не пишутся.
+    Теги с пространствами имен не поддерживаются.
+    """
+    parts: list[str] = []
+    append = parts.append
+
+    def serialize(elem, level: int) -> None:
+        tag = elem.tag
+        text = elem.text
+        tail = elem.tail
+        has_children = len(elem) > 0
+        if compact:
+            if has_children and _is_blank(text):
+                text = None
+            if _is_blank(tail):
+                tail = None
+        elif has_children:
+            if _is_blank(text):
+                text = _newline(level + 1)
+            if _is_blank(tail):
+                tail = _newline(level)
+        elif level and _is_blank(tail):
+            tail = _newline(level)
+
+        if tag in COMMENT_TAGS:
+            append(f'<!--{text}-->')
+        elif tag is ET.ProcessingInstruction:
+            append(f'<?{text}?>')
+        else:
+            if tag[:1] == '{':
+                raise ValueError(
+                    f'Теги с пространствами имен не поддерживаются: {tag}'
+                )
+            append('<' + tag)
+            for key, value in elem.items():
+                append(f' {key}="{_escape_attrib(value)}"')
+            if text or has_children:
+                append('>')
+                if text:
+                    append(_escape_cdata(text))
+                for child in elem:
+                    serialize(child, level + 1)
+                append(f'</{tag}>')
+            else:
+                append(' />')
+        if tail:
+            append(_escape_cdata(tail))
+        if len(parts) > FLUSH_PARTS:
+            file.write(''.join(parts))
+            parts.clear()
+
+    serialize(elem, level)
+    file.write(''.join(parts))
+
+
+def serialize_xml(elem, level: int = 0, compact: bool = False) -> str:
+    """Возвращает элемент строкой, отформатированной как в write_xml."""
+    buffer = io.StringIO()
+    write_xml(elem, buffer, level, compact)
+    return buffer.getvalue()
@@ -4,7 +4,8 @@ from unittest.mock import MagicMock, Mock
 
 import pytest
 
-from handler.reports_db import ReportDataBase
+from handler.db_pool import DB_POOL
+from handler.reports_db import SCHEMA_REGISTRY, ReportDataBase
 
 sys.path.insert(0, os.path.abspath(
     os.path.join(os.path.dirname(__file__), '..')))
@@ -41,9 +42,21 @@ def mock_response(sample_xml_content):
     mock = Mock()
     mock.status_code = 200
     mock.content = sample_xml_content
+    mock.iter_content.return_value = [sample_xml_content]
+    mock.headers = {}
     return mock
 
 
+@pytest.fixture(autouse=True)
+def reset_db_state():
+    """Фикстура сброса пула подключений и реестра таблиц."""
+    DB_POOL.close_all()
+    SCHEMA_REGISTRY.invalidate()
+    yield
+    DB_POOL.close_all()
+    SCHEMA_REGISTRY.invalidate()
+
+
 @pytest.fixture
 def mock_db_connection():
     """Фикстура для мока подключения к базе данных"""
@@ -54,9 +67,9 @@ def mock_db_connection():
 
 
 @pytest.fixture
-def xml_db_client():
+def xml_db_client(tmp_path):
     """Фикстура для создания экземпляра XMLDataBase с моками"""
-    client = ReportDataBase(shop_name='test_shop')
+    client = ReportDataBase(shop_name='test_shop', meta_folder=str(tmp_path))
     yield client
 
 
@@ -89,3 +102,96 @@ def sample_reports_data():
             'clear_median_price': 130.0
         }
     ]
+
+
+SAMPLE_FEED = '''<?xml version="1.0" encoding="UTF-8"?>
+<yml_catalog date="2025-01-01 00:00">
+  <shop>
+    <name>Ситилинк</name>
+    <company>Ситилинк &amp; Ко</company>
+    <categories>
+      <category id="1">Электроника</category>
+      <category id="2" parentId="1">Ноутбуки</category>
+      <category id="3" parentId="1">Смартфоны</category>
+      <category id="4" parentId="2">Игровые ноутбуки</category>
+      <category id="5">Инструменты</category>
+      <category id="6" parentId="5" parentIdPhysical="50">Дрели</category>
+    </categories>
+    <offers>
+      <offer id="101" available="true" parentIdPhysical="7">
+        <price>1000</price>
+        <categoryId>2</categoryId>
+        <vendor>Delonghi</vendor>
+        <picture>https://img.example.com/101.jpg</picture>
+        <url2>https://example.com/101</url2>
+        <cpa>1</cpa>
+        <param name="Цвет" parentIdPhysical="8">черный</param>
+      </offer>
+      <offer id="102" available="true">
+        <price>25000</price>
+        <categoryId>4</categoryId>
+        <vendor>Зубр</vendor>
+        <picture>https://img.example.com/102.jpg</picture>
+        <picture>https://img.example.com/102_2.jpg</picture>
+        <barcode>4600000000000</barcode>
+      </offer>
+      <offer id="103" available="false">
+        <price>3000</price>
+        <categoryId>6</categoryId>
+        <vendor>ЗУБР</vendor>
+        <description>Дрель &lt;ударная&gt;</description>
+      </offer>
+      <offer id="104" available="true">
+        <price>700</price>
+        <categoryId>3</categoryId>
+        <vendor>Атлант</vendor>
+      </offer>
+      <offer id="105" available="true">
+        <price>990000</price>
+        <categoryId>6</categoryId>
+        <vendor>Интерскол</vendor>
+        <cpa>0</cpa>
+      </offer>
+      <offer id="106" available="true">
+        <price>1200</price>
+        <categoryId>99</categoryId>
+        <vendor>skyworth</vendor>
+      </offer>
+      <offer id="107" available="true">
+        <price>2500</price>
+        <categoryId>6</categoryId>
+        <vendor>Зубр</vendor>
+      </offer>
+      <offer id="108" available="true">
+        <price>2700</price>
+        <categoryId>6</categoryId>
+        <vendor>Зубр</vendor>
+      </offer>
+    </offers>
+  </shop>
+</yml_catalog>
+'''
+"""Фид в формате YML, повторяющий структуру фидов Ситилинка."""
+
+
+@pytest.fixture
+def feed_folder(tmp_path):
+    """Фикстура с директорией, содержащей тестовый фид."""
+    folder = tmp_path / 'feeds'
+    folder.mkdir()
+    (folder / 'context_msk_cl.xml').write_text(SAMPLE_FEED, encoding='utf-8')
+    return folder
+
+
+@pytest.fixture
+def media_folders(tmp_path):
+    """Фикстура с директориями видео и обрамленных изображений."""
+    videos = tmp_path / 'videos'
+    images = tmp_path / 'new_images'
+    videos.mkdir()
+    images.mkdir()
+    for offer_id in ('101', '103'):
+        (videos / f'{offer_id}.mp4').write_bytes(b'')
+    for offer_id in ('102', '104'):
+        (images / f'{offer_id}.png').write_bytes(b'')
+    return videos, images
@@ -0,0 +1,86 @@
+import shutil
+
+import numpy as np
+
+from handler.calculation import (STAT_FIELDS, clear_avg, clear_max,
+                                 clear_median, clear_min, price_stats,
+                                 segment_price_stats, validate_sketch)
+from handler.constants import DECIMAL_ROUNDING
+from handler.feed_registry import FEED_REGISTRY
+from handler.feeds_report import FeedReport
+
+PRICES = [120, 90, 100, 15000, 130, 110, 95, 1, 105]
+
+
+def expected_stats(prices: list) -> dict:
+    """Считает статистику цен отдельными функциями, как раньше."""
+    return {
+        'min_price': min(prices),
+        'clear_min_price': clear_min(prices),
+        'max_price': max(prices),
+        'clear_max_price': clear_max(prices),
+        'avg_price': round(sum(prices) / len(prices), DECIMAL_ROUNDING),
+        'clear_avg_price': clear_avg(prices),
+        'median_price': round(np.median(prices), DECIMAL_ROUNDING),
+        'clear_median_price': clear_median(prices),
+    }
+
+
+def test_price_stats_match_separate_functions():
+    """Тест: статистика за один вызов совпадает со значениями и типами."""
+    stats = price_stats(PRICES)
+    expected = expected_stats(PRICES)
+    assert stats == expected
+    assert [type(stats[field]) for field in STAT_FIELDS] == [
+        type(expected[field]) for field in STAT_FIELDS
+    ]
+    assert stats['clear_max_price'] == 130
+
+
+def test_segment_stats_with_nested_and_empty_segments():
+    """Тест: вложенные, пересекающиеся и пустые отрезки."""
+    segments = [(0, 9), (2, 5), (4, 9), (3, 3)]
+    stats = segment_price_stats(
+        PRICES,
+        [start for start, _ in segments],
+        [end for _, end in segments]
+    )
+    for (start, end), row in zip(segments[:3], stats):
+        assert row == expected_stats(PRICES[start:end])
+    assert stats[3] == dict.fromkeys(STAT_FIELDS, 0)
+
+
+def test_sketch_rank_error_within_bound():
+    """Тест: объединенный по регионам скетч держит заданную ошибку ранга."""
+    prices = np.random.default_rng(7).lognormal(9, 1.2, 100_000)
+    result = validate_sketch(prices.astype(np.int64) + 1, rank_error=0.01)
+    assert result['rank_error'] <= result['rank_error_bound']
+    assert result['retained'] < result['count'] // 50
+    assert result['relative_error']['max_price'] == 0
+
+
+def test_sketch_report_matches_exact_on_small_feed(feed_folder):
+    """
+    Тест: на небольшом фиде скетчи не сжимаются и отчет совпадает
+    с точным, а статистика по регионам объединяет скетчи фидов.
+    """
+    shutil.copy(
+        feed_folder / 'context_msk_cl.xml',
+        feed_folder / 'context_spb_cl.xml'
+    )
+    filenames = ['context_msk_cl.xml', 'context_spb_cl.xml']
+    FEED_REGISTRY.clear()
+    exact = FeedReport(filenames, feeds_folder=str(feed_folder))
+    sketch = FeedReport(
+        filenames,
+        feeds_folder=str(feed_folder),
+        stats_mode='sketch'
+    )
+    assert sketch.get_offers_report() == exact.get_offers_report()
+
+    regions = sketch.regions_price_stats()
+    row = exact.get_offers_report()[0]
+    assert regions[row['category_id']] == {
+        field: row[field] for field in STAT_FIELDS
+    }
+    FEED_REGISTRY.clear()
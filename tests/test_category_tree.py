@@ -0,0 +1,49 @@
+from handler.category_tree import CategoryTree
+
+
+def make_data(prices: dict) -> dict:
+    """Создает данные категорий с собственными ценами офферов."""
+    return {
+        category_id: {
+            'prices': list(values),
+            'category_name': category_id,
+            'offers_count': len(values)
+        }
+        for category_id, values in prices.items()
+    }
+
+
+def test_subtree_prices_follow_preorder():
+    """
+    Тест: цены поддерева идут в прямом порядке обхода, а категории
+    вне дерева (нет родителя, цикл) сохраняют свои цены.
+    """
+    parents = {
+        '1': None,
+        '2': '1',
+        '3': '2',
+        '4': '1',
+        '5': 'missing',
+        '6': '7',
+        '7': '6',
+    }
+    data = make_data({
+        '1': [10],
+        '2': [20],
+        '3': [30, 31],
+        '4': [40],
+        '5': [50],
+        '6': [60],
+        '7': [70],
+        'orphan': [80],
+    })
+    tree = CategoryTree(parents)
+    tree.aggregate(data)
+
+    assert tree.order == ['1', '2', '3', '4']
+    assert data['1']['prices'] == [10, 20, 30, 31, 40]
+    assert data['1']['offers_count'] == 5
+    assert data['2']['prices'] == [20, 30, 31]
+    for category_id in ('5', '6', '7', 'orphan'):
+        assert category_id not in tree
+        assert data[category_id]['offers_count'] == 1
@@ -1,7 +1,10 @@
 from unittest.mock import patch
 
+import mysql.connector
 import pytest
 
+from handler.constants import INSERT_CATALOG
+from handler.db_pool import DB_POOL
 from handler.exceptions import TableNameError
 
 
@@ -151,3 +154,139 @@ def test_clean_database_table_not_exists(xml_db_client, mock_db_connection):
             with pytest.raises(TableNameError):
                 xml_db_client.clean_database(nonexistent_table=True)
             mock_logging.assert_called()
+
+
+def test_connections_are_reused(xml_db_client, mock_db_connection):
+    """
+    Тест: вызовы используют одно подключение из пула, вложенный
+    вызов - подключение внешнего, простоявшее подключение проверяется.
+    """
+    mock_conn, mock_cursor = mock_db_connection
+    mock_cursor.fetchall.return_value = [('existing_table',)]
+    with patch(
+        'handler.decorators.mysql.connector.connect',
+        return_value=mock_conn
+    ) as connect:
+        xml_db_client.clean_database(existing_table=True)
+        xml_db_client.save_to_database(('DELETE FROM t', ()))
+        assert connect.call_count == 1
+        assert mock_conn.commit.call_count == 2
+        mock_conn.ping.assert_not_called()
+
+        mock_conn.ping.side_effect = mysql.connector.errors.InterfaceError
+        with patch.object(DB_POOL, 'check_interval', -1):
+            xml_db_client.save_to_database(('DELETE FROM t', ()))
+        assert connect.call_count == 2
+
+
+def test_tables_checked_once(xml_db_client, mock_db_connection):
+    """
+    Тест: таблица проверяется в базе один раз, ошибка записи
+    сбрасывает реестр таблиц.
+    """
+    mock_conn, mock_cursor = mock_db_connection
+    mock_cursor.fetchall.return_value = [('catalog_categories_test_shop',)]
+    with patch(
+        'handler.decorators.mysql.connector.connect',
+        return_value=mock_conn
+    ):
+        for _ in range(3):
+            xml_db_client.insert_catalog([])
+        mock_cursor.execute.assert_called_once_with('SHOW TABLES')
+
+        mock_cursor.executemany.side_effect = (
+            mysql.connector.errors.ProgrammingError
+        )
+        with pytest.raises(mysql.connector.errors.ProgrammingError):
+            xml_db_client.save_to_database(('INSERT', [()]))
+        xml_db_client.insert_catalog([])
+        assert mock_cursor.execute.call_count == 2
+
+
+def test_save_to_database_in_chunks(xml_db_client, mock_db_connection):
+    """
+    Тест: строки записываются частями, каждая часть фиксируется;
+    при LOAD DATA строки проходят через временный файл.
+    """
+    mock_conn, mock_cursor = mock_db_connection
+    query = INSERT_CATALOG.format(table_name='catalog_categories_test_shop')
+    params = [(number, f'Категория\t{number}') for number in range(5)]
+    loaded = []
+
+    def execute(statement, *args):
+        if statement.startswith('LOAD DATA'):
+            path = statement.split("'")[1]
+            with open(path, encoding='utf-8') as file:
+                loaded.append(file.read())
+
+    mock_cursor.execute.side_effect = execute
+    with patch(
+        'handler.decorators.mysql.connector.connect',
+        return_value=mock_conn
+    ):
+        xml_db_client.save_to_database((query, params), chunk_size=2)
+        assert [
+            call.args[1] for call in mock_cursor.executemany.call_args_list
+        ] == [params[:2], params[2:4], params[4:]]
+        assert mock_conn.commit.call_count == 3
+
+        xml_db_client.save_to_database(
+            (query, params),
+            chunk_size=0,
+            strategy='load_data'
+        )
+    assert loaded == [''.join(
+        f'{number}\tКатегория\\t{number}\n' for number in range(5)
+    )]
+    statements = [call.args[0] for call in mock_cursor.execute.call_args_list]
+    assert statements[-2].startswith(
+        'INSERT INTO catalog_categories_test_shop'
+    )
+    assert 'ON DUPLICATE KEY UPDATE' in statements[-2]
+
+
+def test_save_catalog_sends_only_changes(
+    xml_db_client,
+    mock_db_connection,
+    sample_catalog_data
+):
+    """
+    Тест: категории всех фидов записываются один раз, отправляются
+    только новые и переименованные относительно снимка каталога;
+    очистка или изменение таблицы в обход снимка сбрасывают его.
+    """
+    table_name = 'catalog_categories_test_shop'
+    mock_conn, mock_cursor = mock_db_connection
+    mock_cursor.fetchall.side_effect = [
+        [(table_name,)],
+        [(1, 'Category 1')],
+        [(table_name,)],
+        [],
+        [(1, 'Category 1b')],
+    ]
+    mock_cursor.fetchone.return_value = (2,)
+    data = sample_catalog_data * 20
+    with patch(
+        'handler.decorators.mysql.connector.connect',
+        return_value=mock_conn
+    ):
+        assert xml_db_client.save_catalog(data) == 1
+        assert mock_cursor.executemany.call_args.args[1] == [
+            (2, 'Category 2')
+        ]
+        assert xml_db_client.save_catalog(data) == 0
+
+        data[-1] = {'category_id': 1, 'category_name': 'Category 1b'}
+        assert xml_db_client.save_catalog(data) == 1
+        assert mock_cursor.executemany.call_args.args[1] == [
+            (1, 'Category 1b')
+        ]
+
+        xml_db_client.clean_database(**{table_name: True})
+        assert xml_db_client.save_catalog(data) == 2
+
+        mock_cursor.fetchone.return_value = (1,)
+        assert xml_db_client.save_catalog(data) == 1
+        assert mock_cursor.executemany.call_args.args[1] == [
+            (2, 'Category 2')
+        ]
@@ -0,0 +1,104 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+from handler.feed_registry import FEED_REGISTRY
+from handler.feeds_report import FeedReport
+from handler.offer_delta import OfferDeltaTracker
+
+FEED_NAME = 'context_msk_cl.xml'
+
+
+@pytest.fixture(autouse=True)
+def clear_registry():
+    """Фикстура сброса кэша фидов."""
+    FEED_REGISTRY.clear()
+    yield
+    FEED_REGISTRY.clear()
+
+
+def rewrite_feed(feed_folder, old, new):
+    """Изменяет тестовый фид так, чтобы кэш увидел новую версию."""
+    path = feed_folder / FEED_NAME
+    path.write_text(
+        path.read_text(encoding='utf-8').replace(old, new),
+        encoding='utf-8'
+    )
+    os.utime(path, ns=(1, 1))
+
+
+def test_delta_between_runs(feed_folder):
+    """Тест: добавленные, удаленные и измененные офферы."""
+    tracker = OfferDeltaTracker([FEED_NAME], feeds_folder=str(feed_folder))
+    first = tracker.compute(FEED_NAME)
+    assert first.initial and len(first.added) == 8
+    assert not len(FEED_REGISTRY)
+    tracker.commit()
+
+    rewrite_feed(feed_folder, 'offer id="108"', 'offer id="109"')
+    rewrite_feed(
+        feed_folder,
+        'https://img.example.com/101.jpg',
+        'https://img.example.com/101_new.jpg'
+    )
+    rewrite_feed(feed_folder, '<price>700</price>', '<price>750</price>')
+    second = tracker.compute(FEED_NAME)
+
+    assert second.added == {'109'}
+    assert second.removed == {'108'}
+    assert second.changed == {'101', '104'}
+    assert second.changed_in('picture') == {'101'}
+    assert not second.categories_changed
+
+    uncommitted = OfferDeltaTracker([FEED_NAME], str(feed_folder))
+    assert uncommitted.compute(FEED_NAME).changed == {'101', '104'}
+
+
+def test_report_recomputes_only_affected_categories(feed_folder):
+    """
+    Тест: отчет с изменениями пересчитывает категории измененных
+    офферов и их предков, а результат совпадает с полным пересчетом.
+    """
+    tracker = OfferDeltaTracker([FEED_NAME], feeds_folder=str(feed_folder))
+    report = FeedReport([FEED_NAME], feeds_folder=str(feed_folder))
+    report.get_offers_report({FEED_NAME: tracker.compute(FEED_NAME)})
+    tracker.commit()
+
+    rewrite_feed(feed_folder, '<price>700</price>', '<price>750</price>')
+    deltas = {FEED_NAME: tracker.compute(FEED_NAME)}
+    with patch.object(
+        FeedReport,
+        '_category_row',
+        autospec=True,
+        side_effect=FeedReport._category_row
+    ) as category_row:
+        incremental = report.get_offers_report(deltas)
+
+    recomputed = {call.args[2] for call in category_row.call_args_list}
+    assert recomputed == {'1', '3'}
+    assert incremental == report.get_offers_report()
+
+
+def test_failed_run_does_not_leave_stale_rows(feed_folder):
+    """
+    Тест: строки отчета упавшего запуска (без commit) не используются
+    повторно, когда следующий запуск сравнивает фид с прошлым commit.
+    """
+    tracker = OfferDeltaTracker([FEED_NAME], feeds_folder=str(feed_folder))
+    report = FeedReport([FEED_NAME], feeds_folder=str(feed_folder))
+    report.get_offers_report({FEED_NAME: tracker.compute(FEED_NAME)})
+    tracker.commit()
+    expected = report.get_offers_report()
+
+    rewrite_feed(feed_folder, '<price>700</price>', '<price>750</price>')
+    FEED_REGISTRY.clear()
+    failed = OfferDeltaTracker([FEED_NAME], feeds_folder=str(feed_folder))
+    report.get_offers_report({FEED_NAME: failed.compute(FEED_NAME)})
+
+    rewrite_feed(feed_folder, '<price>750</price>', '<price>700</price>')
+    FEED_REGISTRY.clear()
+    retry = OfferDeltaTracker([FEED_NAME], feeds_folder=str(feed_folder))
+    delta = retry.compute(FEED_NAME)
+    assert not delta
+    assert report.get_offers_report({FEED_NAME: delta}) == expected
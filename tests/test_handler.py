@@ -0,0 +1,227 @@
+import gzip
+import os
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from handler.exceptions import FeedProcessingError
+from handler.feeds_handler import FeedHandler
+from handler.offer_filter import OfferFilter
+from handler.utils import run_per_feed
+from handler.vendor_category_dict import VENDOR_CATEGORY
+
+
+@pytest.fixture(autouse=True)
+def clear_files_cache():
+    """Фикстура сброса кэша словарей видео и изображений."""
+    FeedHandler.clear_files_cache()
+    yield
+    FeedHandler.clear_files_cache()
+
+
+def make_handler(feed_folder, media_folders, new_folder):
+    """Создает обработчик тестового фида."""
+    videos, images = media_folders
+    return FeedHandler(
+        'context_msk_cl.xml',
+        feeds_folder=str(feed_folder),
+        new_feeds_folder=str(new_folder),
+        new_images_folder=str(images),
+        videos_folder=str(videos)
+    )
+
+
+def test_fused_plan_matches_stepwise(feed_folder, media_folders, tmp_path):
+    """Тест: один обход по плану дает тот же файл, что и пошаговый."""
+    fused = make_handler(feed_folder, media_folders, tmp_path / 'fused')
+    (
+        fused
+        .delete_tags(('url2', 'cpa', 'barcode'))
+        .delete_param('parentIdPhysical')
+        .replace_images()
+        .add_video()
+        .save(prefix='retailmedia')
+    )
+    stepwise = make_handler(feed_folder, media_folders, tmp_path / 'steps')
+    stepwise.delete_tags(('url2', 'cpa', 'barcode')).root
+    stepwise.delete_param('parentIdPhysical').root
+    stepwise.replace_images().root
+    stepwise.add_video().save(prefix='retailmedia')
+
+    fused_file = tmp_path / 'fused' / 'retailmedia_msk_cl.xml'
+    stepwise_file = tmp_path / 'steps' / 'retailmedia_msk_cl.xml'
+    assert fused_file.read_bytes() == stepwise_file.read_bytes()
+
+
+def test_plan_applies_operations(feed_folder, media_folders, tmp_path):
+    """Тест применения операций плана к дереву."""
+    handler = make_handler(feed_folder, media_folders, tmp_path)
+    handler.delete_tags(('cpa',)).delete_param('parentIdPhysical').add_video()
+
+    assert handler._plan
+    root = handler.root
+    assert not handler._plan
+    assert handler._is_modified
+    assert root.find('.//offer/cpa') is None
+    assert root.findall('.//*[@parentIdPhysical]') == []
+    videos = [offer.get('id') for offer in root.iter('offer')
+              if offer.find('video') is not None]
+    assert videos == ['101', '103']
+
+
+def test_files_dict_built_once(feed_folder, media_folders, tmp_path):
+    """Тест: словарь видео строится один раз на все фиды."""
+    first = make_handler(feed_folder, media_folders, tmp_path).add_video()
+    videos, _ = media_folders
+    (videos / '104.mp4').write_bytes(b'')
+    second = make_handler(feed_folder, media_folders, tmp_path).add_video()
+
+    assert first._plan[0][1] is second._plan[0][1]
+    assert '104' not in second._plan[0][1]
+
+
+@pytest.mark.parametrize('vendor_category', [
+    VENDOR_CATEGORY,
+    {'зубр': [5]},
+    {'нет такого': ['all']},
+])
+def test_streaming_matches_tree_mode(
+    feed_folder,
+    media_folders,
+    tmp_path,
+    vendor_category
+):
+    """Тест: потоковый режим дает тот же файл, что и обработка дерева."""
+    outputs = []
+    for streaming in (False, True):
+        new_folder = tmp_path / f'streaming_{streaming}'
+        videos, images = media_folders
+        handler = FeedHandler(
+            'context_msk_cl.xml',
+            feeds_folder=str(feed_folder),
+            new_feeds_folder=str(new_folder),
+            new_images_folder=str(images),
+            videos_folder=str(videos),
+            streaming=streaming
+        )
+        (
+            handler
+            .delete_tags(('url2', 'cpa', 'barcode'))
+            .delete_param('parentIdPhysical')
+            .replace_images()
+            .add_video()
+            .remove_non_matching_offers(vendor_category)
+            .save(prefix='retailmedia')
+        )
+        outputs.append(
+            (new_folder / 'retailmedia_msk_cl.xml').read_bytes()
+        )
+
+    assert outputs[0] == outputs[1]
+
+
+def test_streaming_mode_has_no_tree(feed_folder, tmp_path):
+    """Тест: в потоковом режиме дерево фида не загружается."""
+    handler = FeedHandler(
+        'context_msk_cl.xml',
+        feeds_folder=str(feed_folder),
+        new_feeds_folder=str(tmp_path),
+        streaming=True
+    )
+    with pytest.raises(ValueError):
+        handler.root
+
+
+def touch_feed(filename):
+    """Тестовый обработчик фида: создает файл или падает на 'bad'."""
+    if 'bad' in filename:
+        raise ValueError(filename)
+    Path(filename).write_text(Path(filename).name)
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_run_per_feed_aggregates_errors(tmp_path, workers):
+    """Тест: ошибки фидов собираются, остальные фиды обрабатываются."""
+    filenames = [str(tmp_path / name) for name in ('a', 'bad_b', 'c', 'bad_d')]
+    with pytest.raises(FeedProcessingError, match='2 из 4'):
+        run_per_feed(touch_feed, filenames, workers=workers)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['a', 'c']
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_filter_uses_vendor_category_pairs(feed_folder, tmp_path, streaming):
+    """
+    Тест: категория проверяется в паре с брендом оффера,
+    фильтр собирается один раз на сохранение, а не на оффер.
+    """
+    vendor_category = {'зубр': [2], 'атлант': [5], 'skyworth': ['all']}
+    handler = FeedHandler(
+        'context_msk_cl.xml',
+        feeds_folder=str(feed_folder),
+        new_feeds_folder=str(tmp_path),
+        streaming=streaming
+    )
+    with patch.object(
+        OfferFilter,
+        'from_dict',
+        side_effect=OfferFilter.from_dict
+    ) as from_dict:
+        handler.remove_non_matching_offers(vendor_category).save(
+            prefix='auction'
+        )
+    assert from_dict.call_count == 1
+    root = ET.parse(tmp_path / 'auction_msk_cl.xml').getroot()
+    assert [offer.get('id') for offer in root.iter('offer')] == [
+        '102', '106'
+    ]
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_unchanged_output_is_not_rewritten(
+    feed_folder,
+    tmp_path,
+    streaming
+):
+    """Тест: неизменившийся фид не перезаписывается, измененный - да."""
+    def publish(tags):
+        handler = FeedHandler(
+            'context_msk_cl.xml',
+            feeds_folder=str(feed_folder),
+            new_feeds_folder=str(tmp_path / 'new'),
+            streaming=streaming
+        )
+        handler.delete_tags(tags).save(prefix='new')
+        return tmp_path / 'new' / 'new_msk_cl.xml'
+
+    output = publish(('cpa',))
+    os.utime(output, ns=(1, 1))
+    publish(('cpa',))
+    assert output.stat().st_mtime_ns == 1
+
+    publish(('cpa', 'barcode'))
+    assert output.stat().st_mtime_ns != 1
+    assert 'barcode' not in output.read_text(encoding='utf-8')
+    assert not list((tmp_path / 'new' / '.meta').glob('*.tmp'))
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_compressed_source_is_published_as_xml(
+    feed_folder,
+    tmp_path,
+    streaming
+):
+    """Тест: сжатый исходный фид публикуется обычным XML."""
+    source = feed_folder / 'context_msk_cl.xml'
+    source.write_bytes(gzip.compress(source.read_bytes()))
+    FeedHandler(
+        'context_msk_cl.xml',
+        feeds_folder=str(feed_folder),
+        new_feeds_folder=str(tmp_path / 'new'),
+        streaming=streaming
+    ).delete_tags(('cpa',)).save(prefix='new')
+
+    output = (tmp_path / 'new' / 'new_msk_cl.xml').read_bytes()
+    assert not output.startswith(gzip.compress(b'')[:2])
+    assert ET.fromstring(output).find('.//offer') is not None
@@ -0,0 +1,62 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+from handler.feed_registry import FEED_REGISTRY
+from handler.offer_delta import OfferDeltaTracker
+
+pytest.importorskip('PIL')
+
+from handler.image_handler import FeedImage  # noqa: E402
+
+FEED_NAME = 'context_msk_cl.xml'
+OLD_PICTURE = 'https://img.example.com/101.jpg'
+NEW_PICTURE = 'https://img.example.com/101_new.jpg'
+
+
+def run_images(feed_folder, image_folder, image_data):
+    """
+    Выполняет этапы изменений и изображений одного запуска
+    и возвращает клиент изображений и адреса загрузок.
+    """
+    FEED_REGISTRY.clear()
+    tracker = OfferDeltaTracker([FEED_NAME], feeds_folder=str(feed_folder))
+    image_client = FeedImage(
+        [FEED_NAME],
+        images=[],
+        feeds_folder=str(feed_folder),
+        image_folder=str(image_folder),
+        deltas=tracker.compute_all()
+    )
+    with patch.object(
+        FeedImage,
+        '_get_image_data',
+        return_value=image_data
+    ) as get_image_data:
+        image_client.get_images()
+    tracker.commit()
+    return image_client, [call.args[0] for call in get_image_data.mock_calls]
+
+
+def test_failed_image_is_retried_next_run(feed_folder, tmp_path):
+    """
+    Тест: оффер, чье новое изображение не скачалось, не считается
+    обновленным, и следующий запуск скачивает изображение снова.
+    """
+    image_folder = tmp_path / 'images'
+    run_images(feed_folder, image_folder, (b'image', 'jpg'))
+
+    path = feed_folder / FEED_NAME
+    path.write_text(
+        path.read_text(encoding='utf-8').replace(OLD_PICTURE, NEW_PICTURE),
+        encoding='utf-8'
+    )
+    os.utime(path, ns=(1, 1))
+    failed, urls = run_images(feed_folder, image_folder, (None, None))
+    assert urls == [NEW_PICTURE]
+    assert not failed.refreshed_offers
+
+    retried, urls = run_images(feed_folder, image_folder, (b'image', 'jpg'))
+    assert urls == [NEW_PICTURE]
+    assert retried.refreshed_offers == {'101'}
@@ -0,0 +1,150 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from handler.feed_join import OfferJoinIndex
+from handler.feed_registry import FEED_REGISTRY
+from handler.feeds_report import FeedReport
+from handler.region_presence import (at_least, feed_region, left_join,
+                                     regions_join)
+
+FILENAMES = ['new_msk_cl.xml', 'new_spb_cl.xml']
+
+
+@pytest.fixture
+def join_folder(feed_folder):
+    """
+    Фикстура двух фидов: во втором нет оффера 101, у оффера 104
+    другая цена и добавлен оффер 109.
+    """
+    sample = (feed_folder / 'context_msk_cl.xml').read_text(encoding='utf-8')
+    (feed_folder / FILENAMES[0]).write_text(sample, encoding='utf-8')
+    second = sample.replace(
+        'offer id="101"', 'offer id="109"'
+    ).replace('<price>700</price>', '<price>750</price>')
+    (feed_folder / FILENAMES[1]).write_text(second, encoding='utf-8')
+    FEED_REGISTRY.clear()
+    yield feed_folder
+    FEED_REGISTRY.clear()
+
+
+def joined_offers(path):
+    """Возвращает пары (id, цена) офферов объединенного фида."""
+    return [
+        (offer.get('id'), offer.findtext('price'))
+        for offer in ET.parse(path).getroot().iter('offer')
+    ]
+
+
+def test_join_order_and_content(join_folder, tmp_path):
+    """
+    Тест: офферы идут в порядке первого вхождения, содержимое
+    берется из последнего фида, а оба объединения пишутся
+    за один проход так же, как по отдельности.
+    """
+    report = FeedReport(
+        FILENAMES,
+        new_feeds_folder=str(join_folder),
+        join_feeds_folder=str(tmp_path / 'together')
+    )
+    report.join_feeds('full_outer', 'inner')
+
+    outer = joined_offers(tmp_path / 'together' / 'full_outer_join_feed.xml')
+    inner = joined_offers(tmp_path / 'together' / 'inner_join_feed.xml')
+    assert [offer_id for offer_id, _ in outer] == [
+        '101', '102', '103', '104', '105', '106', '107', '108', '109'
+    ]
+    assert ('104', '750') in outer
+    assert [offer_id for offer_id, _ in inner] == [
+        '102', '103', '104', '105', '106', '107', '108'
+    ]
+
+    separate = FeedReport(
+        FILENAMES,
+        new_feeds_folder=str(join_folder),
+        join_feeds_folder=str(tmp_path / 'separate')
+    )
+    separate.join_feeds('full_outer')
+    separate.join_feeds('inner')
+    index = separate._join_index
+    separate.close_join_index()
+    assert index._spool.closed and separate._join_index is None
+
+    with OfferJoinIndex(FILENAMES, str(join_folder)).build() as index:
+        assert len(index) == 9
+    assert index._spool.closed
+    for name in ('full_outer_join_feed.xml', 'inner_join_feed.xml'):
+        assert (tmp_path / 'together' / name).read_bytes() == (
+            tmp_path / 'separate' / name
+        ).read_bytes()
+
+
+def test_region_joins(join_folder, tmp_path):
+    """
+    Тест: объединения по матрице присутствия офферов в регионах
+    пишутся за один проход вместе с inner.
+    """
+    sample = (join_folder / FILENAMES[0]).read_text(encoding='utf-8')
+    third = sample.replace('offer id="102"', 'offer id="110"')
+    (join_folder / 'new_vrzh_cl.xml').write_text(third, encoding='utf-8')
+    filenames = FILENAMES + ['new_vrzh_cl.xml']
+    report = FeedReport(
+        filenames,
+        new_feeds_folder=str(join_folder),
+        join_feeds_folder=str(tmp_path)
+    )
+    report.join_feeds(
+        'inner',
+        at_least(3),
+        regions_join(('msk', 'spb'), ('vrzh',)),
+        left_join('vrzh')
+    )
+
+    def ids(name):
+        return [
+            offer_id for offer_id, _ in joined_offers(tmp_path / name)
+        ]
+
+    assert ids('inner_join_feed.xml') == ids('at_least_3_join_feed.xml')
+    assert '102' not in ids('inner_join_feed.xml')
+    assert ids('msk_spb_not_vrzh_join_feed.xml') == ['102']
+    assert ids('left_vrzh_join_feed.xml') == [
+        '101', '103', '104', '105', '106', '107', '108', '110'
+    ]
+    with pytest.raises(ValueError):
+        report._get_join_index().presence.mask(left_join('ufa'))
+
+
+def test_auction_feeds_keep_their_region(join_folder, tmp_path):
+    """
+    Тест: аукционный фид прошлого запуска относится к своему
+    региону, а не к региону auction.
+    """
+    assert feed_region('retailmedia_auction_msk_cl.xml') == 'msk'
+    assert feed_region('retailmedia_spb_cl.xml') == 'spb'
+
+    sample = (join_folder / FILENAMES[0]).read_text(encoding='utf-8')
+    auction = sample.replace('offer id="103"', 'offer id="111"')
+    (join_folder / 'new_auction_msk_cl.xml').write_text(
+        auction,
+        encoding='utf-8'
+    )
+    report = FeedReport(
+        FILENAMES + ['new_auction_msk_cl.xml'],
+        new_feeds_folder=str(join_folder),
+        join_feeds_folder=str(tmp_path)
+    )
+    presence = report._get_join_index().presence
+    assert presence.regions == ['msk', 'spb', 'msk']
+
+    def ids(join_type):
+        mask = presence.mask(join_type)
+        return [
+            offer_id for offer_id, keep in zip(presence.ids, mask) if keep
+        ]
+
+    assert ids(regions_join(('msk',), ('spb',))) == ['101', '111']
+    assert '111' in ids(left_join('msk'))
+    assert ids(at_least(2)) == [
+        '102', '103', '104', '105', '106', '107', '108'
+    ]
@@ -0,0 +1,193 @@
+import os
+import xml.etree.ElementTree as ET
+from collections import Counter
+from unittest.mock import patch
+
+import pytest
+
+from handler.feed_registry import FEED_REGISTRY, FeedRegistry
+from handler.feeds_handler import FeedHandler
+from handler.feeds_report import FeedReport
+from handler.mixins import FileMixin
+from handler.offer_delta import OfferDeltaTracker
+from handler.offer_index import OfferIndex
+
+
+def parse(path):
+    """Разбирает XML-файл и возвращает корень."""
+    return ET.parse(path).getroot()
+
+
+@pytest.fixture
+def feed_path(tmp_path):
+    """Фикстура с путем к небольшому XML-файлу."""
+    path = tmp_path / 'feed.xml'
+    path.write_text('<shop><offers><offer id="1"/></offers></shop>')
+    return path
+
+
+def test_get_parses_once(feed_path):
+    """Тест: повторное получение фида не разбирает файл заново."""
+    registry = FeedRegistry(max_size=2)
+    first = registry.get(feed_path, parse)
+    second = registry.get(feed_path, parse)
+
+    assert first is second
+    assert (registry.hits, registry.misses) == (1, 1)
+
+
+def test_get_reparses_changed_file(feed_path):
+    """Тест: изменение файла (mtime и размер) сбрасывает запись."""
+    registry = FeedRegistry(max_size=2)
+    first = registry.get(feed_path, parse)
+    feed_path.write_text('<shop><offers/></shop>')
+    os.utime(feed_path, ns=(0, 0))
+    second = registry.get(feed_path, parse)
+
+    assert first is not second
+    assert second.find('.//offer') is None
+
+
+def test_take_evicts_tree(feed_path):
+    """Тест: забранное во владение дерево вытесняется из кэша."""
+    registry = FeedRegistry(max_size=2)
+    shared = registry.get(feed_path, parse)
+    owned = registry.take(feed_path, parse)
+
+    assert owned is shared
+    assert len(registry) == 0
+    assert registry.get(feed_path, parse) is not owned
+
+
+def test_lru_eviction(tmp_path):
+    """Тест: в кэше остается не больше max_size деревьев."""
+    registry = FeedRegistry(max_size=2)
+    paths = []
+    for index in range(3):
+        path = tmp_path / f'feed{index}.xml'
+        path.write_text(f'<shop id="{index}"/>')
+        paths.append(path)
+        registry.get(path, parse)
+
+    assert len(registry) == 2
+    registry.get(paths[0], parse)
+    assert registry.misses == 4
+
+
+def test_disabled_cache(feed_path):
+    """Тест: при max_size=0 деревья не кэшируются."""
+    registry = FeedRegistry(max_size=0)
+
+    assert registry.get(feed_path, parse) is not registry.get(
+        feed_path,
+        parse
+    )
+    assert len(registry) == 0
+
+
+def test_offer_index_matches_findtext(feed_folder):
+    """Тест: поля индекса совпадают с findtext по офферу."""
+    path = feed_folder / 'context_msk_cl.xml'
+    root = parse(path)
+    index = OfferIndex(root)
+
+    assert len(index) == len(root.findall('.//offer'))
+    for record in index:
+        offer = record.element
+        assert record.offer_id == offer.get('id')
+        assert record.vendor == offer.findtext('vendor')
+        assert record.category_id == offer.findtext('categoryId')
+        assert record.price == offer.findtext('price')
+        assert record.picture == offer.findtext('picture')
+        assert index.get(record.offer_id).offer_id == record.offer_id
+    assert index.get('missing') is None
+
+
+def test_offer_index_lives_with_tree(feed_path):
+    """Тест: индекс строится один раз и сбрасывается вместе с деревом."""
+    registry = FeedRegistry(max_size=2)
+    index = registry.get_index(feed_path, parse)
+
+    assert registry.get_index(feed_path, parse) is index
+    assert '1' in index
+
+    registry.take(feed_path, parse)
+    rebuilt = registry.get_index(feed_path, parse)
+    assert rebuilt is not index
+
+    feed_path.write_text('<shop><offers><offer id="2"/></offers></shop>')
+    os.utime(feed_path, ns=(1, 1))
+    assert '2' in registry.get_index(feed_path, parse)
+
+
+def test_run_parses_each_feed_once_per_tree(
+    feed_folder,
+    media_folders,
+    tmp_path
+):
+    """
+    Тест: за запуск в порядке main() этапы чтения (изменения, отчет,
+    изображения, видео) разбирают каждый фид один раз, а обработчик
+    забирает свое дерево для изменения - второй разбор.
+    """
+    pytest.importorskip('PIL')
+    pytest.importorskip('cv2')
+    from handler.image_handler import FeedImage
+    from handler.video_create import VideoCreater
+
+    sample = (feed_folder / 'context_msk_cl.xml').read_text(encoding='utf-8')
+    (feed_folder / 'context_spb_cl.xml').write_text(sample, encoding='utf-8')
+    filenames = ['context_msk_cl.xml', 'context_spb_cl.xml']
+    videos, images = media_folders
+    FEED_REGISTRY.clear()
+    with patch.object(
+        FileMixin,
+        '_parse_file',
+        autospec=True,
+        side_effect=FileMixin._parse_file
+    ) as parse_file:
+        tracker = OfferDeltaTracker(filenames, feeds_folder=str(feed_folder))
+        deltas = tracker.compute_all()
+        FeedReport(filenames, feeds_folder=str(feed_folder)).get_offers_report(
+            deltas
+        )
+        with patch.object(
+            FeedImage,
+            '_get_image_data',
+            return_value=(None, None)
+        ):
+            FeedImage(
+                filenames,
+                images=[],
+                feeds_folder=str(feed_folder),
+                image_folder=str(tmp_path / 'images'),
+                deltas=deltas
+            ).get_images()
+        with patch.object(
+            VideoCreater,
+            '_create_single_video',
+            return_value=True
+        ):
+            VideoCreater(
+                filenames,
+                feeds_folder=str(feed_folder),
+                new_images_folder=str(images),
+                videos_folder=str(videos)
+            ).create_videos()
+        read_parses = Counter(
+            call.args[1].name for call in parse_file.mock_calls
+        )
+        for filename in filenames:
+            FeedHandler(
+                filename,
+                feeds_folder=str(feed_folder),
+                new_feeds_folder=str(tmp_path / 'new'),
+                new_images_folder=str(images),
+                videos_folder=str(videos)
+            ).add_video().save(prefix='new')
+        parses = Counter(call.args[1].name for call in parse_file.mock_calls)
+    FEED_REGISTRY.clear()
+    FeedHandler.clear_files_cache()
+
+    assert read_parses == dict.fromkeys(filenames, 1)
+    assert parses == dict.fromkeys(filenames, 2)
@@ -1,3 +1,5 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import Mock, patch
 
 import pytest
@@ -5,7 +7,7 @@ import requests
 
 from handler.exceptions import (EmptyFeedsListError, EmptyXMLError,
                                 InvalidXMLError)
-from handler.feeds_save import FeedSaver
+from handler.feeds_save import FeedSaver, _PartialDownload
 
 
 def test_init_with_empty_feeds_list():
@@ -36,46 +38,56 @@ def test_get_filename_from_url(sample_feeds):
     assert filename == 'test_feed.xml'
 
 
-@patch('handler.feeds_save.requests.get')
-def test_get_file_success(mock_get, sample_feeds, mock_response):
+@patch('handler.feeds_save.requests.Session.get')
+def test_get_file_success(
+    mock_get,
+    sample_feeds,
+    mock_response,
+    sample_xml_content,
+    tmp_path
+):
     """Тест успешного получения файла."""
     mock_get.return_value = mock_response
     saver = FeedSaver(feeds_list=sample_feeds)
-    response = saver._get_file('https://example.com/feed.xml')
+    download = _PartialDownload(tmp_path / 'feed.xml.part')
+    response = saver._get_file('https://example.com/feed.xml', download)
 
     assert response == mock_response
+    assert download.path.read_bytes() == sample_xml_content
     mock_get.assert_called_once_with(
-        'https://example.com/feed.xml', stream=True, timeout=(10, 60)
+        'https://example.com/feed.xml',
+        headers={},
+        stream=True,
+        timeout=(10, 60)
     )
 
 
-def test_validate_xml_valid_content(sample_feeds, sample_xml_content):
-    """Тест валидации корректного XML."""
-    saver = FeedSaver(feeds_list=sample_feeds)
-    decoded_content, encoding = saver._validate_xml(sample_xml_content)
+def stream_response(*chunks):
+    """Возвращает ответ, отдающий тело блоками chunks."""
+    response = Mock()
+    response.iter_content.return_value = list(chunks)
+    return response
 
-    assert 'root' in decoded_content
-    assert encoding == 'utf-8'
 
+def test_download_validates_xml_while_streaming(sample_xml_content, tmp_path):
+    """Тест проверки XML при потоковой загрузке."""
+    download = _PartialDownload(tmp_path / 'feed.xml.part')
+    download.consume(stream_response(sample_xml_content))
+    assert download.finish()
 
-def test_validate_xml_empty_content(sample_feeds):
-    """Тест валидации пустого XML."""
-    saver = FeedSaver(feeds_list=sample_feeds)
+    download.reset()
+    download.consume(stream_response(b'  ', b''))
     with pytest.raises(EmptyXMLError):
-        saver._validate_xml(b'')
+        download.finish()
 
-
-def test_validate_xml_invalid_content(sample_feeds):
-    """Тест валидации некорректного XML."""
-    saver = FeedSaver(feeds_list=sample_feeds)
+    download.reset()
+    download.consume(stream_response(b'<invalid>', b'<xml>'))
     with pytest.raises(InvalidXMLError):
-        saver._validate_xml(b'<invalid><xml>')
+        download.finish()
 
 
-@patch('handler.feeds_save.requests.get')
-@patch('handler.feeds_save.FeedSaver._validate_xml')
+@patch('handler.feeds_save.requests.Session.get')
 def test_save_xml_success(
-    mock_validate,
     mock_get,
     sample_feeds,
     tmp_path,
@@ -84,9 +96,9 @@ def test_save_xml_success(
     """Тест успешного сохранения XML файлов."""
     mock_response = Mock()
     mock_response.status_code = 200
-    mock_response.content = sample_xml_content
+    mock_response.iter_content.return_value = [sample_xml_content]
+    mock_response.headers = {}
     mock_get.return_value = mock_response
-    mock_validate.return_value = ('<root>test</root>', 'utf-8')
     saver = FeedSaver(feeds_list=sample_feeds, feeds_folder=str(tmp_path))
     saver.save_xml()
     files = list(tmp_path.glob('*.xml'))
@@ -96,7 +108,7 @@ def test_save_xml_success(
     assert any(file.name == 'feed2.xml' for file in files)
 
 
-@patch('handler.feeds_save.requests.get')
+@patch('handler.feeds_save.requests.Session.get')
 def test_save_xml_failed_download(mock_get, sample_feeds, tmp_path):
     """Тест обработки ошибки загрузки файла."""
     mock_get.side_effect = requests.RequestException("Connection error")
@@ -107,21 +119,14 @@ def test_save_xml_failed_download(mock_get, sample_feeds, tmp_path):
     assert len(files) == 0
 
 
-@patch('handler.feeds_save.requests.get')
-@patch('handler.feeds_save.FeedSaver._validate_xml')
-def test_save_xml_invalid_xml(
-    mock_validate,
-    mock_get,
-    sample_feeds,
-    tmp_path,
-    sample_xml_content
-):
+@patch('handler.feeds_save.requests.Session.get')
+def test_save_xml_invalid_xml(mock_get, sample_feeds, tmp_path):
     """Тест обработки невалидного XML."""
     mock_response = Mock()
     mock_response.status_code = 200
-    mock_response.content = sample_xml_content
+    mock_response.iter_content.return_value = [b'<invalid>', b'<xml>']
+    mock_response.headers = {}
     mock_get.return_value = mock_response
-    mock_validate.side_effect = InvalidXMLError('Invalid XML')
     saver = FeedSaver(feeds_list=sample_feeds, feeds_folder=str(tmp_path))
     saver.save_xml()
     files = list(tmp_path.glob('*.xml'))
@@ -129,14 +134,15 @@ def test_save_xml_invalid_xml(
     assert len(files) == 0
 
 
-@patch('handler.feeds_save.requests.get')
+@patch('handler.feeds_save.requests.Session.get')
 def test_save_xml_encoding_detection(mock_get, tmp_path):
     """Тест определения кодировки XML."""
     xml_content_win1251 = b'''<?xml version="1.0" encoding="windows-1251"?>
     <root><item>Test</item></root>'''
     mock_response = Mock()
     mock_response.status_code = 200
-    mock_response.content = xml_content_win1251
+    mock_response.iter_content.return_value = [xml_content_win1251]
+    mock_response.headers = {}
     mock_get.return_value = mock_response
     saver = FeedSaver(
         feeds_list=[
@@ -155,3 +161,238 @@ def test_save_xml_with_custom_folder(sample_feeds, tmp_path):
 
     assert folder_path == custom_folder
     assert custom_folder.exists()
+
+
+@patch('handler.feeds_save.requests.Session.get')
+def test_save_xml_sequential_mode(
+    mock_get,
+    sample_feeds,
+    tmp_path,
+    mock_response
+):
+    """Тест последовательного режима скачивания (max_workers=1)."""
+    mock_get.return_value = mock_response
+    saver = FeedSaver(
+        feeds_list=sample_feeds,
+        feeds_folder=str(tmp_path),
+        max_workers=1
+    )
+    saver.save_xml()
+    files = list(tmp_path.glob('*.xml'))
+
+    assert len(files) == 2
+    assert mock_get.call_count == 2
+
+
+def test_session_is_shared_and_pooled(sample_feeds):
+    """Тест общей сессии с пулом соединений по числу потоков."""
+    saver = FeedSaver(feeds_list=sample_feeds, max_workers=4)
+    session = saver.session
+
+    assert saver.session is session
+    adapter = session.get_adapter('https://example.com/feed1.xml')
+    assert adapter._pool_maxsize == 4
+    saver._close_session()
+    assert saver._session is None
+
+
+def test_session_created_once_across_threads(sample_feeds):
+    """Тест: потоки загрузки получают одну и ту же сессию."""
+    saver = FeedSaver(feeds_list=sample_feeds, max_workers=8)
+    session_class = requests.Session
+
+    def slow_session():
+        time.sleep(0.01)
+        return session_class()
+
+    with patch(
+        'handler.feeds_save.requests.Session',
+        side_effect=slow_session
+    ) as mock_session:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            sessions = list(executor.map(
+                lambda _: saver.session, range(8)
+            ))
+    assert mock_session.call_count == 1
+    assert all(session is sessions[0] for session in sessions)
+    saver._close_session()
+
+
+@patch('handler.feeds_save.requests.Session.get')
+def test_save_xml_conditional_get(
+    mock_get,
+    tmp_path,
+    sample_xml_content
+):
+    """
+    Тест условного запроса: 304 оставляет локальный файл.
+    Пока запуск не завершен (commit), фид считается измененным.
+    Ответ закрывается и при 304.
+    """
+    feeds = ['https://example.com/feed1.xml']
+    first_response = Mock()
+    first_response.status_code = 200
+    first_response.iter_content.return_value = [sample_xml_content]
+    first_response.headers = {'ETag': '"v1"', 'Last-Modified': 'Mon'}
+    mock_get.return_value = first_response
+    saver = FeedSaver(feeds_list=feeds, feeds_folder=str(tmp_path))
+    saver.save_xml()
+
+    assert saver.changed_feeds == {'feed1.xml'}
+    saved_content = (tmp_path / 'feed1.xml').read_bytes()
+    saver = FeedSaver(feeds_list=feeds, feeds_folder=str(tmp_path))
+    saver.save_xml()
+    _, kwargs = mock_get.call_args
+    assert kwargs['headers'] == {}
+    assert saver.changed_feeds == {'feed1.xml'}
+    saver.commit()
+
+    not_modified = Mock()
+    not_modified.status_code = 304
+    not_modified.headers = {}
+    mock_get.return_value = not_modified
+    saver = FeedSaver(feeds_list=feeds, feeds_folder=str(tmp_path))
+    saver.save_xml()
+
+    _, kwargs = mock_get.call_args
+    assert kwargs['headers'] == {
+        'If-None-Match': '"v1"',
+        'If-Modified-Since': 'Mon'
+    }
+    assert saver.changed_feeds == set()
+    assert (tmp_path / 'feed1.xml').read_bytes() == saved_content
+    assert list(tmp_path.glob('*.xml')) == [tmp_path / 'feed1.xml']
+    first_response.close.assert_called()
+    not_modified.close.assert_called_once()
+
+
+@patch('handler.feeds_save.requests.Session.get')
+def test_save_xml_streams_chunks_atomically(mock_get, tmp_path):
+    """
+    Тест потокового сохранения: файл собирается из блоков как есть,
+    временные файлы не остаются, невалидный фид не затирает старый.
+    """
+    chunks = [
+        b'<?xml version="1.0" encoding="UTF-8"?>\n<shop><off',
+        b'ers><offer id="1"/></offers></shop>'
+    ]
+    response = Mock()
+    response.status_code = 200
+    response.iter_content.return_value = chunks
+    response.headers = {}
+    mock_get.return_value = response
+    feeds = ['https://example.com/feed1.xml']
+    saver = FeedSaver(feeds_list=feeds, feeds_folder=str(tmp_path))
+    saver.save_xml()
+
+    assert (tmp_path / 'feed1.xml').read_bytes() == b''.join(chunks)
+    assert not list((tmp_path / '.meta').glob('*.part'))
+
+    response.iter_content.return_value = [b'<shop><offers>']
+    saver.save_xml()
+
+    assert (tmp_path / 'feed1.xml').read_bytes() == b''.join(chunks)
+    assert saver.changed_feeds == set()
+    assert not list((tmp_path / '.meta').glob('*.part'))
+
+
+@patch('handler.decorators.time.sleep')
+@patch('handler.feeds_save.requests.Session.get')
+def test_save_xml_resumes_with_range(mock_get, mock_sleep, tmp_path):
+    """Тест докачки хвоста фида через Range после обрыва соединения."""
+    head = b'<?xml version="1.0" encoding="UTF-8"?>\n<shop><offers>'
+    tail = b'<offer id="1"/></offers></shop>'
+
+    def broken_stream(chunk_size):
+        yield head
+        raise requests.exceptions.ChunkedEncodingError('IncompleteRead')
+
+    first = Mock()
+    first.status_code = 200
+    first.headers = {
+        'ETag': '"v1"',
+        'Content-Length': str(len(head + tail))
+    }
+    first.iter_content.side_effect = broken_stream
+    second = Mock()
+    second.status_code = 206
+    second.headers = {
+        'ETag': '"v1"',
+        'Content-Range': f'bytes {len(head)}-{len(head + tail) - 1}/'
+                         f'{len(head + tail)}'
+    }
+    second.iter_content.return_value = [tail]
+    mock_get.side_effect = [first, second]
+    saver = FeedSaver(
+        feeds_list=['https://example.com/feed1.xml'],
+        feeds_folder=str(tmp_path)
+    )
+    saver.save_xml()
+
+    _, kwargs = mock_get.call_args
+    assert kwargs['headers'] == {
+        'Range': f'bytes={len(head)}-',
+        'If-Range': '"v1"'
+    }
+    assert (tmp_path / 'feed1.xml').read_bytes() == head + tail
+    assert saver.changed_feeds == {'feed1.xml'}
+
+
+@patch('handler.decorators.time.sleep')
+@patch('handler.feeds_save.requests.Session.get')
+def test_save_xml_range_not_supported(mock_get, mock_sleep, tmp_path):
+    """Тест полной перезагрузки, если сервер игнорирует Range."""
+    content = b'<shop><offers><offer id="1"/></offers></shop>'
+
+    def broken_stream(chunk_size):
+        yield content[:10]
+        raise requests.exceptions.ChunkedEncodingError('IncompleteRead')
+
+    first = Mock()
+    first.status_code = 200
+    first.headers = {'Last-Modified': 'Mon'}
+    first.iter_content.side_effect = broken_stream
+    second = Mock()
+    second.status_code = 200
+    second.headers = {'Last-Modified': 'Mon'}
+    second.iter_content.return_value = [content]
+    mock_get.side_effect = [first, second]
+    saver = FeedSaver(
+        feeds_list=['https://example.com/feed1.xml'],
+        feeds_folder=str(tmp_path)
+    )
+    saver.save_xml()
+
+    assert (tmp_path / 'feed1.xml').read_bytes() == content
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'lzma'])
+@patch('handler.feeds_save.requests.Session.get')
+def test_save_xml_compressed_storage(
+    mock_get,
+    compression,
+    tmp_path,
+    mock_response,
+    sample_xml_content
+):
+    """Тест сжатого хранения фида и прозрачного чтения через _get_root."""
+    mock_get.return_value = mock_response
+    saver = FeedSaver(
+        feeds_list=['https://example.com/feed1.xml'],
+        feeds_folder=str(tmp_path),
+        compression=compression
+    )
+    saver.save_xml()
+    raw = (tmp_path / 'feed1.xml').read_bytes()
+
+    assert raw != sample_xml_content
+    with saver._open_file(tmp_path / 'feed1.xml') as f:
+        assert f.read() == sample_xml_content
+    root = saver._get_root('feed1.xml', str(tmp_path))
+    assert root.findtext('item') == 'Test'
+
+
+def test_init_with_unknown_compression(sample_feeds):
+    """Тест инициализации с неизвестным форматом сжатия."""
+    with pytest.raises(ValueError):
+        FeedSaver(feeds_list=sample_feeds, compression='zip')
@@ -0,0 +1,45 @@
+from unittest.mock import patch
+
+import pytest
+
+from handler.feed_registry import FEED_REGISTRY
+from handler.feeds_report import FeedReport
+from handler.mixins import FileMixin
+
+FEED_NAME = 'context_msk_cl.xml'
+
+
+@pytest.fixture(autouse=True)
+def clear_registry():
+    """Фикстура сброса кэша фидов."""
+    FEED_REGISTRY.clear()
+    yield
+    FEED_REGISTRY.clear()
+
+
+def test_snapshot_report_matches_xml(feed_folder):
+    """
+    Тест: отчет по снимку совпадает с отчетом по XML, а сохраненный
+    снимок читается без повторного разбора фида.
+    """
+    expected = FeedReport(
+        [FEED_NAME],
+        feeds_folder=str(feed_folder),
+        snapshots=False
+    ).get_offers_report()
+    report = FeedReport(
+        [FEED_NAME],
+        feeds_folder=str(feed_folder),
+        snapshots=True
+    )
+    assert report.get_offers_report() == expected
+
+    FEED_REGISTRY.clear()
+    with patch.object(
+        FileMixin,
+        '_parse_file',
+        autospec=True,
+        side_effect=FileMixin._parse_file
+    ) as parse_file:
+        assert report.get_offers_report() == expected
+    assert parse_file.call_count == 0
@@ -0,0 +1,113 @@
+import io
+import shutil
+
+import pytest
+
+from handler.feed_registry import FEED_REGISTRY
+from handler.feeds_handler import FeedHandler
+from handler.feeds_report import FeedReport
+from handler.vendor_category_dict import VENDOR_CATEGORY
+from handler.xml_backend import parse_xml, resolve_backend
+
+pytest.importorskip('lxml')
+
+BACKENDS = ('etree', 'lxml')
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Фикстура сброса кэшей, чтобы каждый запуск разбирал файлы заново."""
+    FEED_REGISTRY.clear()
+    FeedHandler.clear_files_cache()
+    yield
+    FEED_REGISTRY.clear()
+    FeedHandler.clear_files_cache()
+
+
+def run_handler(feed_folder, media_folders, output, backend):
+    """Обрабатывает тестовый фид выбранной библиотекой XML."""
+    videos, images = media_folders
+    handler = FeedHandler(
+        'context_msk_cl.xml',
+        feeds_folder=str(feed_folder),
+        new_feeds_folder=str(output),
+        new_images_folder=str(images),
+        videos_folder=str(videos)
+    )
+    handler.xml_backend = backend
+    (
+        handler
+        .delete_tags(('cpa', 'barcode'))
+        .delete_param('parentIdPhysical')
+        .replace_images()
+        .add_video()
+        .remove_non_matching_offers(VENDOR_CATEGORY)
+        .save(prefix='new')
+    )
+    return (output / 'new_msk_cl.xml').read_bytes()
+
+
+def test_backends_resolve():
+    """Тест: выбор библиотеки и ошибка для неизвестного значения."""
+    assert resolve_backend('auto') == 'lxml'
+    assert resolve_backend('etree') == 'etree'
+    with pytest.raises(ValueError):
+        resolve_backend('sax')
+
+
+def test_handler_output_is_identical(feed_folder, media_folders, tmp_path):
+    """Тест: обработка фида дает одинаковый файл с обеими библиотеками."""
+    outputs = {
+        backend: run_handler(
+            feed_folder,
+            media_folders,
+            tmp_path / backend,
+            backend
+        )
+        for backend in BACKENDS
+    }
+    assert outputs['etree'] == outputs['lxml']
+
+
+def test_join_output_is_identical(feed_folder, tmp_path):
+    """
+    Тест: join дает одинаковые файлы с обеими библиотеками,
+    а исходные деревья в кэше не изменяются.
+    """
+    for region in ('msk', 'spb'):
+        shutil.copy(
+            feed_folder / 'context_msk_cl.xml',
+            feed_folder / f'new_{region}_cl.xml'
+        )
+    filenames = ['new_msk_cl.xml', 'new_spb_cl.xml']
+    outputs = {}
+    for backend in BACKENDS:
+        report = FeedReport(
+            filenames,
+            new_feeds_folder=str(feed_folder),
+            join_feeds_folder=str(tmp_path / backend)
+        )
+        report.xml_backend = backend
+        report.join_feeds('full_outer')
+        report.join_feeds('inner')
+        root = report._get_root(filenames[0], str(feed_folder))
+        assert len(root.findall('.//offer')) == 8
+        outputs[backend] = [
+            (tmp_path / backend / name).read_bytes()
+            for name in ('full_outer_join_feed.xml', 'inner_join_feed.xml')
+        ]
+        FEED_REGISTRY.clear()
+    assert outputs['etree'] == outputs['lxml']
+
+
+def test_lxml_does_not_resolve_external_entities(tmp_path):
+    """Тест: lxml не подставляет внешние сущности из фида."""
+    secret = tmp_path / 'secret.txt'
+    secret.write_text('секрет', encoding='utf-8')
+    feed = (
+        '<?xml version="1.0"?>\n'
+        f'<!DOCTYPE shop [<!ENTITY xxe SYSTEM "{secret.as_uri()}">]>\n'
+        '<shop><name>&xxe;</name></shop>'
+    ).encode('utf-8')
+    root = parse_xml(io.BytesIO(feed), 'lxml')
+    assert 'секрет' not in ''.join(root.itertext())
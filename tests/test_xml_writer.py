@@ -0,0 +1,37 @@
+import copy
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from handler.mixins import FileMixin
+from handler.xml_writer import serialize_xml
+
+
+def legacy_format(elem, level=0):
+    """Форматирует копию элемента прежним способом: _indent + tostring."""
+    elem = copy.deepcopy(elem)
+    FileMixin()._indent(elem, level)
+    return ET.tostring(elem, encoding='unicode')
+
+
+@pytest.mark.parametrize('level', [0, 2])
+def test_matches_indent_and_tostring(feed_folder, level):
+    """Тест: вывод побайтно совпадает с _indent + ET.tostring."""
+    root = ET.parse(feed_folder / 'context_msk_cl.xml').getroot()
+    offer = root.find('.//offer')
+    offer.set('note', 'a "b" & <c>\n')
+    offer.append(ET.Comment(' комментарий '))
+    before = ET.tostring(root, encoding='unicode')
+
+    assert serialize_xml(root) == legacy_format(root)
+    assert serialize_xml(offer, level) == legacy_format(offer, level)
+    assert ET.tostring(root, encoding='unicode') == before
+
+
+def test_compact_mode_drops_whitespace(feed_folder):
+    """Тест: компактный режим не пишет отступы, но сохраняет данные."""
+    root = ET.parse(feed_folder / 'context_msk_cl.xml').getroot()
+    compact = serialize_xml(root, compact=True)
+
+    assert '\n' not in compact
+    assert serialize_xml(ET.fromstring(compact)) == serialize_xml(root)